@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped scientific arrays (.npy, raw binary) as libvips images
+
+Analysis pipelines write huge float or uint16 arrays. Instead of saving
+them as PNG/TIFF and decoding that again, convert_to_dzi.py maps the
+array file and feeds it straight to dzsave:
+
+- uint8 arrays are wrapped as a vips image directly over the mapped
+  buffer, with no copy
+- other dtypes libvips has a format for (8-64 bit floats, 8-32 bit
+  integers, either byte order) are wrapped the same way and windowed to
+  8 bits by libvips as dzsave pulls rows (a clip and scale, as
+  dicom_to_image does for DICOM)
+- the rest (64-bit integers, float16, Fortran order) are windowed strip
+  by strip with numpy into an 8-bit temporary file, which is then mapped
+
+No loader is involved, so this works with any libvips build; nothing the
+size of the image is held in memory, and arrays larger than RAM convert
+through the page cache.
+
+.npy files carry their own dtype and shape. Raw files need a header,
+either from the command line or from a JSON sidecar next to the file
+(<file>.json, e.g. scan.raw.json):
+
+    {"dtype": "float32", "shape": [40000, 50000], "offset": 0}
+
+dtype takes numpy spellings, including byte order ('>u2' is big-endian
+uint16). shape is (height, width) or (height, width, bands) with 1, 3 or
+4 bands; a fourth band is dropped.
+
+Usage:
+    python3 convert_to_dzi.py density.npy
+    python3 convert_to_dzi.py density.npy --window 0,3.5
+    python3 convert_to_dzi.py scan.raw --raw-dtype uint16 --raw-shape 40000x50000
+"""
+
+import json
+import math
+import tempfile
+from pathlib import Path
+import argparse
+
+ARRAY_FORMATS = {'.npy', '.raw'}
+
+# Source bytes windowed per strip
+STRIP_BYTES = 32 * 1024 * 1024
+
+# libvips band formats by numpy kind and item size
+VIPS_FORMATS = {
+    'b1': 'uchar', 'u1': 'uchar', 'i1': 'char', 'u2': 'ushort', 'i2': 'short',
+    'u4': 'uint', 'i4': 'int', 'f4': 'float', 'f8': 'double',
+}
+
+def raw_header_path(path):
+    """JSON sidecar describing a raw array file"""
+    path = Path(path)
+    return path.with_name(path.name + '.json')
+
+def parse_shape(text):
+    """Parse HEIGHTxWIDTH[xBANDS] from the command line"""
+    try:
+        shape = tuple(int(v) for v in text.lower().split('x'))
+    except ValueError:
+        shape = ()
+    if len(shape) not in (2, 3) or min(shape) < 1:
+        raise argparse.ArgumentTypeError(f"Shape must be HEIGHTxWIDTH or HEIGHTxWIDTHxBANDS, not '{text}'")
+    return shape
+
+def parse_window(text):
+    """Parse a LOW,HIGH value window from the command line"""
+    try:
+        low, high = (float(v) for v in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Window must be LOW,HIGH, not '{text}'")
+    if not high > low:
+        raise argparse.ArgumentTypeError(f"Window high must exceed low, not '{text}'")
+    return low, high
+
+def open_array(path, dtype=None, shape=None, offset=0):
+    """
+    Memory-map an array file read-only
+
+    Args:
+        path: .npy or raw file
+        dtype, shape, offset: Raw layout; default from <file>.json
+
+    Returns:
+        numpy memmap of shape (height, width) or (height, width, bands)
+
+    Raises:
+        ValueError if the layout is missing or does not match the file
+    """
+    import numpy as np
+
+    path = Path(path)
+    if path.suffix.lower() == '.npy':
+        array = np.load(path, mmap_mode='r')
+    else:
+        header_path = raw_header_path(path)
+        if (dtype is None or shape is None) and header_path.exists():
+            header = json.loads(header_path.read_text())
+            dtype = dtype or header.get('dtype')
+            shape = shape or tuple(header.get('shape', ()))
+            offset = offset or header.get('offset', 0)
+        if dtype is None or not shape:
+            raise ValueError(f"{path.name} needs a dtype and shape: pass --raw-dtype and "
+                             f"--raw-shape or write {header_path.name}")
+        dtype = np.dtype(dtype)
+        expected = offset + math.prod(shape) * dtype.itemsize
+        if path.stat().st_size < expected:
+            raise ValueError(f"{path.name} is {path.stat().st_size:,} bytes; "
+                             f"{dtype} {tuple(shape)} needs {expected:,}")
+        array = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
+    if array.ndim not in (2, 3) or (array.ndim == 3 and array.shape[2] not in (3, 4)):
+        raise ValueError(f"Array shape {array.shape} is not (height, width[, 1|3|4])")
+    if array.dtype.kind not in 'uif' and array.dtype != bool:
+        raise ValueError(f"Array dtype {array.dtype} is not numeric")
+    return array
+
+def strip_rows(array):
+    """Rows per strip so one strip reads about STRIP_BYTES of the source"""
+    return max(1, STRIP_BYTES // max(1, array[0].nbytes))
+
+def value_range(array):
+    """
+    (min, max) of the finite values, in one sequential pass over strips
+
+    Returns:
+        (low, high) floats; (0, 0) if nothing is finite
+    """
+    import numpy as np
+
+    low, high = math.inf, -math.inf
+    rows = strip_rows(array)
+    for start in range(0, array.shape[0], rows):
+        strip = array[start:start + rows]
+        if strip.ndim == 3:
+            strip = strip[:, :, :3]
+        if strip.dtype.kind == 'f':
+            strip = strip[np.isfinite(strip)]
+        if strip.size:
+            low, high = min(low, float(strip.min())), max(high, float(strip.max()))
+    return (0.0, 0.0) if low > high else (low, high)
+
+def window_to_uint8(strip, low, high):
+    """
+    Clip to [low, high] and scale to 0-255, vectorized
+
+    NaN maps to 0, +/-inf to the window ends.
+    """
+    import numpy as np
+
+    pixels = np.clip(strip.astype(np.float32), low, high)
+    pixels -= low
+    if high - low > 0:  # Avoid division by zero
+        pixels *= 255 / (high - low)
+    pixels = np.nan_to_num(pixels, nan=0.0)
+    return (pixels + 0.5).astype(np.uint8)
+
+def _windowed_strips(array, low, high):
+    """Yield the windowed array as 8-bit bytes, strip by strip"""
+    rows = strip_rows(array)
+    for start in range(0, array.shape[0], rows):
+        strip = array[start:start + rows]
+        if strip.ndim == 3:
+            strip = strip[:, :, :3]
+        yield window_to_uint8(strip, low, high).tobytes()
+
+class ArraySource:
+    """
+    A mapped array and the vips image reading it
+
+    Keep this object alive while the image is in use; the 8-bit spool
+    file, when one is needed, lives here.
+    """
+
+    def __init__(self, path, dtype=None, shape=None, offset=0, window=None):
+        self.path = Path(path)
+        self.array = open_array(path, dtype, shape, offset)
+        self.window = window
+        self.spool = None
+
+    @property
+    def zero_copy(self):
+        """True when the mapped buffer can be handed to libvips as is"""
+        array = self.array
+        return (array.dtype.kind == 'u' and array.dtype.itemsize == 1 and self.window is None
+                and array.flags['C_CONTIGUOUS'] and (array.ndim == 2 or array.shape[2] == 3))
+
+    def image(self):
+        """
+        The array as an 8-bit vips image
+
+        Without a window, uint8 values pass through and other arrays are
+        stretched to their own finite min/max (one extra sequential pass).
+        """
+        import numpy as np
+        import pyvips
+
+        height, width = self.array.shape[:2]
+        bands = 1 if self.array.ndim == 2 else 3
+        if self.zero_copy:
+            return pyvips.Image.new_from_memory(self.array, width, height, bands, 'uchar')
+
+        if self.window:
+            low, high = self.window
+        elif self.array.dtype.kind == 'u' and self.array.dtype.itemsize == 1:
+            low, high = 0, 255
+        else:
+            low, high = value_range(self.array)
+
+        array = self.array
+        vips_format = VIPS_FORMATS.get(f"{array.dtype.kind}{array.dtype.itemsize}")
+        if vips_format and array.flags['C_CONTIGUOUS']:
+            # Window lazily in libvips, over the mapped buffer; this matches
+            # window_to_uint8 (to float rounding), NaN and infinities included
+            image = pyvips.Image.new_from_memory(array, width, height,
+                                                 1 if array.ndim == 2 else array.shape[2],
+                                                 vips_format)
+            if not array.dtype.isnative:
+                image = image.byteswap()
+            if image.bands == 4:
+                image = image.extract_band(0, n=3)
+            scale = 255 / (high - low) if high > low else 0
+            pixels = image.linear(scale, 0.5 - low * scale)
+            if array.dtype.kind == 'f':
+                pixels = (image == image).ifthenelse(pixels, 0)
+            return pixels.cast('uchar')
+
+        # No libvips format for the dtype: window into an 8-bit spool file
+        self.spool = tempfile.TemporaryFile()
+        for strip in _windowed_strips(array, low, high):
+            self.spool.write(strip)
+        self.spool.flush()
+        pixels = np.memmap(self.spool, np.uint8, 'r', shape=(height, width, bands))
+        return pyvips.Image.new_from_memory(pixels, width, height, bands, 'uchar')
+
+    def describe(self):
+        """One-line summary: dtype, shape and how the image is produced"""
+        mode = 'zero-copy map' if self.zero_copy else (
+            f"window {self.window[0]:g}..{self.window[1]:g}" if self.window else 'stretched to min/max')
+        return f"{self.array.dtype} {tuple(self.array.shape)}, {mode}"
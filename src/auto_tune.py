@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Pick the tile size and quality for an image from a sampled benchmark
+
+Samples a few representative regions of the image (spread from flat to
+busy, skipping blank background), then encodes them at every candidate
+tile size and quality. For each candidate it measures:
+
+- encode speed
+- bytes per tile
+- worst-tile PSNR against the source pixels
+- the requests and bytes a viewer fetches to fill one viewport
+
+The candidate that best meets the objective wins, among those at or
+above the quality floor:
+
+    bytes    fewest bytes per viewport
+    latency  shortest estimated viewport load: request round trips over
+             the browser's parallel connections plus transfer time
+
+convert_to_dzi.py --auto-tune and png_to_dzi.py --auto-tune convert with
+the winner and record the measurements in <name>_tuning.json next to the
+.dzi.
+
+Usage:
+    python3 auto_tune.py scan.tiff
+    python3 auto_tune.py scan.tiff --objective latency --rtt-ms 120
+    python3 auto_tune.py ct_slice.png --codec webp --quality-floor 42 --json tuning.json
+"""
+
+import sys
+import json
+import math
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import memory_budget
+import tile_codecs
+
+TILE_SIZES = (128, 256, 512)
+QUALITIES = (60, 70, 80, 85, 90, 95)
+
+OBJECTIVES = ('bytes', 'latency')
+
+# Worst-tile PSNR a candidate must reach, in dB
+DEFAULT_QUALITY_FLOOR = 38.0
+
+DEFAULT_VIEWPORT = (1920, 1080)
+DEFAULT_RTT_MS = 50
+DEFAULT_BANDWIDTH_MBPS = 50
+
+# Requests a browser keeps in flight to one host
+BROWSER_CONNECTIONS = 6
+
+# Side of each sampled region; a multiple of every candidate tile size
+REGION_SIDE = 1024
+DEFAULT_REGIONS = 4
+
+# Regions whose standard deviation is below this are background
+UNIFORM_DEVIATION = 2.0
+
+# Regions are ranked on a thumbnail this size (shrink-on-load where the
+# format allows); only the chosen ones are read at full resolution
+THUMBNAIL_SIDE = 1024
+
+def _to_uchar(image):
+    """8-bit, alpha flattened onto white, as the candidates are encoded"""
+    if image.hasalpha():
+        image = image.flatten(background=[255])
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    return image
+
+def representative_regions(thumbnail, width, height, count=DEFAULT_REGIONS, side=REGION_SIDE):
+    """
+    Regions spanning the image's range of detail, background left out
+
+    A grid of up to 5×5 candidate windows is ranked by the standard
+    deviation of the matching area of a thumbnail, and count of them are
+    taken at evenly spaced ranks, so flat, typical and busy content are all
+    represented. Grid rows never overlap, so read_regions() can fetch the
+    windows in one top-to-bottom pass.
+
+    Args:
+        thumbnail: Downscaled image, see THUMBNAIL_SIDE
+        width, height: Full-resolution size
+
+    Returns:
+        list of (x, y, width, height) at full resolution
+    """
+    side_x, side_y = min(side, width), min(side, height)
+    steps, rows = 5, max(1, min(5, height // side_y))
+    windows = []
+    for row in range(rows):
+        y = (height - side_y) * row // (rows - 1) if rows > 1 else (height - side_y) // 2
+        for col in range(steps):
+            x = (width - side_x) * col // (steps - 1)
+            windows.append((x, y, side_x, side_y))
+    windows = sorted(set(windows))
+
+    scale_x, scale_y = thumbnail.width / width, thumbnail.height / height
+
+    def deviation(window):
+        x, y, w, h = window
+        left, top = min(int(x * scale_x), thumbnail.width - 1), min(int(y * scale_y), thumbnail.height - 1)
+        return thumbnail.crop(left, top, max(1, min(round(w * scale_x), thumbnail.width - left)),
+                              max(1, min(round(h * scale_y), thumbnail.height - top))).deviate()
+
+    scored = [(deviation(window), window) for window in windows]
+    detailed = sorted((score, window) for score, window in scored if score >= UNIFORM_DEVIATION)
+    if not detailed:
+        return [tile_codecs.sample_region(width, height, side, 1)]
+    if len(detailed) <= count:
+        return [window for _, window in detailed]
+    if count == 1:
+        return [detailed[len(detailed) // 2][1]]
+    return [detailed[round(i * (len(detailed) - 1) / (count - 1))][1] for i in range(count)]
+
+def read_regions(input_path, regions):
+    """
+    Decode regions of an image in one sequential pass
+
+    Regions are read in order of their top edge; those on the same rows
+    are joined and read together. Regions must not overlap vertically
+    unless they share their rows, as representative_regions() ensures.
+
+    Returns:
+        list of in-memory 8-bit images, in the order of regions
+    """
+    import pyvips
+
+    image = _to_uchar(pyvips.Image.new_from_file(str(input_path), access='sequential'))
+    rows = {}
+    for index, (_, y, _, height) in enumerate(regions):
+        rows.setdefault((y, height), []).append(index)
+
+    samples = [None] * len(regions)
+    for (y, height), indices in sorted(rows.items()):
+        crops = [image.crop(*regions[index]) for index in indices]
+        band = pyvips.Image.arrayjoin(crops, across=len(crops)).copy_memory()
+        for position, (index, crop) in enumerate(zip(indices, crops)):
+            samples[index] = band.crop(position * crops[0].width, 0, crop.width, crop.height)
+    return samples
+
+def requests_per_viewport(tile_size, viewport=DEFAULT_VIEWPORT):
+    """
+    Expected tiles intersecting a viewport placed at a random offset
+
+    A span of w pixels over tiles of t pixels crosses 1 + (w - 1) / t
+    tiles on average.
+    """
+    width, height = viewport
+    return (1 + (width - 1) / tile_size) * (1 + (height - 1) / tile_size)
+
+def measure_candidates(samples, codec=tile_codecs.DEFAULT_CODEC, tile_sizes=TILE_SIZES,
+                       qualities=QUALITIES, viewport=DEFAULT_VIEWPORT):
+    """
+    Encode sample regions (see read_regions) at every tile size and quality
+
+    Returns:
+        list of dicts with tile_size, quality, tiles, encode_mps,
+        bytes_per_tile, psnr (worst tile, None without a decoder),
+        requests_per_viewport and bytes_per_viewport
+    """
+    import pyvips
+
+    pixels = sum(sample.width * sample.height for sample in samples)
+    if codec == 'png':
+        qualities = (100,)   # Lossless; the quality setting is ignored
+
+    candidates = []
+    for tile_size in tile_sizes:
+        tiles = [sample.crop(x, y, min(tile_size, sample.width - x), min(tile_size, sample.height - y))
+                 for sample in samples
+                 for y in range(0, sample.height, tile_size)
+                 for x in range(0, sample.width, tile_size)]
+        requests = requests_per_viewport(tile_size, viewport)
+        for quality in qualities:
+            suffix = tile_codecs.tile_suffix(codec, quality)
+            start = time.perf_counter()
+            encoded = [tile.write_to_buffer(suffix) for tile in tiles]
+            elapsed = time.perf_counter() - start
+
+            try:
+                errors = [tile_codecs.psnr(tile, pyvips.Image.new_from_buffer(data, '').copy_memory())
+                          for tile, data in zip(tiles, encoded)]
+                finite = [value for value in errors if value != math.inf]
+                quality_db = min(finite) if finite else math.inf
+            except pyvips.Error:
+                quality_db = None
+
+            # Edge tiles of a region clipped to the image are smaller;
+            # scale to a full tile so the sizes compare across candidates
+            bytes_per_tile = sum(len(data) for data in encoded) / pixels * tile_size ** 2
+            candidates.append({
+                'tile_size': tile_size,
+                'quality': quality,
+                'tiles': len(encoded),
+                'encode_mps': pixels / 1_000_000 / max(elapsed, 1e-9),
+                'bytes_per_tile': round(bytes_per_tile),
+                'psnr': quality_db,
+                'requests_per_viewport': round(requests, 1),
+                'bytes_per_viewport': round(requests * bytes_per_tile),
+            })
+    return candidates
+
+def viewport_seconds(candidate, rtt_ms=DEFAULT_RTT_MS, bandwidth_mbps=DEFAULT_BANDWIDTH_MBPS):
+    """Estimated time to fill one viewport: round trips plus transfer"""
+    round_trips = math.ceil(candidate['requests_per_viewport'] / BROWSER_CONNECTIONS)
+    transfer = candidate['bytes_per_viewport'] * 8 / (bandwidth_mbps * 1_000_000)
+    return round_trips * rtt_ms / 1000 + transfer
+
+def choose(candidates, objective='bytes', quality_floor=DEFAULT_QUALITY_FLOOR,
+           rtt_ms=DEFAULT_RTT_MS, bandwidth_mbps=DEFAULT_BANDWIDTH_MBPS):
+    """
+    Best candidate for the objective among those meeting the quality floor
+
+    Without a decoder to check quality against, every candidate counts as
+    meeting the floor. If none does, the highest-PSNR candidate is taken.
+
+    Returns:
+        (candidate, met_floor) tuple
+    """
+    if objective == 'latency':
+        def cost(candidate):
+            return (viewport_seconds(candidate, rtt_ms, bandwidth_mbps), -candidate['encode_mps'])
+    else:
+        def cost(candidate):
+            return (candidate['bytes_per_viewport'], -candidate['encode_mps'])
+
+    passing = [candidate for candidate in candidates
+               if candidate['psnr'] is None or candidate['psnr'] >= quality_floor]
+    if passing:
+        return min(passing, key=cost), True
+    return max(candidates, key=lambda candidate: (candidate['psnr'], -cost(candidate)[0])), False
+
+def auto_tune(input_path, codec=tile_codecs.DEFAULT_CODEC, objective='bytes',
+              quality_floor=DEFAULT_QUALITY_FLOOR, viewport=DEFAULT_VIEWPORT,
+              rtt_ms=DEFAULT_RTT_MS, bandwidth_mbps=DEFAULT_BANDWIDTH_MBPS,
+              regions=DEFAULT_REGIONS, tile_sizes=TILE_SIZES, qualities=QUALITIES):
+    """
+    Benchmark candidate tile sizes and qualities on an image and pick one
+
+    Args:
+        input_path: Path to the source image
+        codec: Tile codec the candidates are encoded with
+        objective: 'bytes' or 'latency', see OBJECTIVES
+        quality_floor: Minimum worst-tile PSNR in dB
+        viewport: (width, height) of the client viewport in pixels
+        rtt_ms, bandwidth_mbps: Client network, for the latency objective
+        regions: Number of sample regions
+
+    Returns:
+        JSON-ready dict with the chosen tile_size and quality, whether the
+        floor was met, the settings and every candidate's measurements
+    """
+    import pyvips
+
+    # Never opened for random access: that would decode a PNG or JPEG
+    # source whole; the thumbnail and one sequential pass are enough. The
+    # thumbnail is a sequential pipeline too, so it is rendered to memory
+    # once before its regions are ranked in arbitrary order.
+    header = pyvips.Image.new_from_file(str(input_path), access='sequential')
+    thumbnail = _to_uchar(pyvips.Image.thumbnail(str(input_path), THUMBNAIL_SIDE)).copy_memory()
+
+    start = time.perf_counter()
+    sample_regions = representative_regions(thumbnail, header.width, header.height, regions)
+    samples = read_regions(input_path, sample_regions)
+    candidates = measure_candidates(samples, codec, tile_sizes, qualities, viewport)
+    best, met_floor = choose(candidates, objective, quality_floor, rtt_ms, bandwidth_mbps)
+    for candidate in candidates:
+        candidate['viewport_seconds'] = round(viewport_seconds(candidate, rtt_ms, bandwidth_mbps), 3)
+    return {
+        'source': Path(input_path).name,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'codec': codec,
+        'objective': objective,
+        'quality_floor': quality_floor,
+        'viewport': list(viewport),
+        'rtt_ms': rtt_ms,
+        'bandwidth_mbps': bandwidth_mbps,
+        'regions': [list(region) for region in sample_regions],
+        'tile_size': best['tile_size'],
+        'quality': best['quality'],
+        'met_floor': met_floor,
+        'benchmark_seconds': round(time.perf_counter() - start, 1),
+        'candidates': candidates,
+    }
+
+def write_tuning(base_path, result):
+    """Record an auto_tune() result in <base>_tuning.json beside the .dzi"""
+    path = dzi_pyramid.tuning_path(base_path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return path
+
+def print_tuning(result):
+    """Print an auto_tune() result, the chosen candidate marked"""
+    print(f"\n{'Tile':>5} {'Q':>4} {'Encode':>10} {'Per tile':>10} {'PSNR':>9} "
+          f"{'Req/view':>9} {'Per view':>10} {'Load':>7}")
+    print(f"{'-' * 5} {'-' * 4} {'-' * 10} {'-' * 10} {'-' * 9} {'-' * 9} {'-' * 10} {'-' * 7}")
+    for candidate in result['candidates']:
+        if candidate['psnr'] is None:
+            quality_db = 'n/a'
+        elif candidate['psnr'] == math.inf:
+            quality_db = 'lossless'
+        else:
+            quality_db = f"{candidate['psnr']:.1f} dB"
+        chosen = (candidate['tile_size'], candidate['quality']) == (result['tile_size'], result['quality'])
+        print(f"{candidate['tile_size']:>5} {candidate['quality']:>4} "
+              f"{candidate['encode_mps']:>6.1f} MP/s "
+              f"{memory_budget.format_bytes(candidate['bytes_per_tile']):>10} "
+              f"{quality_db:>9} {candidate['requests_per_viewport']:>9.1f} "
+              f"{memory_budget.format_bytes(candidate['bytes_per_viewport']):>10} "
+              f"{candidate['viewport_seconds'] * 1000:>5.0f}ms{'  ◀' if chosen else ''}")
+    print(f"\n🎯 Tile size {result['tile_size']}, quality {result['quality']} "
+          f"({result['objective']} objective, {result['quality_floor']:g} dB floor, "
+          f"{result['viewport'][0]}×{result['viewport'][1]} viewport)")
+    if not result['met_floor']:
+        print(f"⚠️  No candidate reached {result['quality_floor']:g} dB; took the highest PSNR")
+
+def parse_viewport(text):
+    """Parse a WIDTHxHEIGHT viewport from the command line"""
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Viewport must be WIDTHxHEIGHT, e.g. 1920x1080")
+    return width, height
+
+def add_arguments(parser):
+    """Objective options shared by this tool and the converters' --auto-tune"""
+    parser.add_argument('--objective', default='bytes', choices=OBJECTIVES,
+                       help='bytes: fewest bytes per viewport; latency: fastest viewport load '
+                            '(default: bytes)')
+    parser.add_argument('--quality-floor', type=float, default=DEFAULT_QUALITY_FLOOR, metavar='DB',
+                       help=f'Minimum worst-tile PSNR (default: {DEFAULT_QUALITY_FLOOR:g})')
+    parser.add_argument('--viewport', type=parse_viewport, default=DEFAULT_VIEWPORT, metavar='WxH',
+                       help='Client viewport (default: 1920x1080)')
+    parser.add_argument('--rtt-ms', type=float, default=DEFAULT_RTT_MS,
+                       help=f'Client round-trip time for --objective latency (default: {DEFAULT_RTT_MS})')
+    parser.add_argument('--bandwidth-mbps', type=float, default=DEFAULT_BANDWIDTH_MBPS,
+                       help=f'Client bandwidth for --objective latency (default: {DEFAULT_BANDWIDTH_MBPS})')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark tile sizes and qualities on an image and pick the best',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 auto_tune.py scan.tiff
+  python3 auto_tune.py scan.tiff --objective latency --rtt-ms 120
+  python3 auto_tune.py ct_slice.png --codec webp --quality-floor 42 --json tuning.json
+        """
+    )
+    parser.add_argument('input', help='Input image file path')
+    parser.add_argument('--codec', default=tile_codecs.DEFAULT_CODEC, choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
+    add_arguments(parser)
+    parser.add_argument('--regions', type=int, default=DEFAULT_REGIONS,
+                       help=f'Sample regions of {REGION_SIDE}px (default: {DEFAULT_REGIONS})')
+    parser.add_argument('--json', metavar='FILE', help='Also write the result as JSON')
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ Error: File not found: {args.input}")
+        sys.exit(1)
+    if not tile_codecs.codec_available(args.codec):
+        print(f"❌ Error: This libvips build cannot encode {args.codec} tiles")
+        sys.exit(1)
+
+    print(f"🧪 Tuning {Path(args.input).name} ({args.codec}, {args.regions} regions)...")
+    result = auto_tune(args.input, args.codec, args.objective, args.quality_floor, args.viewport,
+                       args.rtt_ms, args.bandwidth_mbps, args.regions)
+    print_tuning(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"📄 Result: {args.json}")
+
+if __name__ == '__main__':
+    main()
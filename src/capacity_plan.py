@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Dry-run capacity plan for a conversion: tiles, bytes and time
+
+The tile geometry is exact: every level's size, grid and tile count come
+from the same rules dzsave uses (halving with round-up, one pixel of
+overlap on interior edges). Output bytes and time are estimated by
+encoding a random sample of full-resolution tiles with the chosen codec.
+The sample is read top to bottom, so the decode rate is measured on the
+way and no random access to the source is needed.
+
+The estimate extrapolates the sample's bytes per pixel to every level and
+rounds each tile up to the filesystem block for the disk figure. Time is
+the source decode, plus tile encoding spread over the libvips threads,
+plus per-file writes. Expect it to be within tens of percent, not exact.
+
+Usage:
+    python3 capacity_plan.py scan.tiff
+    python3 capacity_plan.py scan.tiff --tile-size 512 --codec webp --json plan.json
+    python3 capacity_plan.py --size 200000x160000 --like sample.png
+"""
+
+import sys
+import json
+import math
+import os
+import time
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import memory_budget
+import tile_codecs
+
+# Full-resolution tiles encoded for the estimate
+DEFAULT_SAMPLES = 64
+
+# Allocation unit assumed when the output filesystem cannot be asked
+DEFAULT_BLOCK_SIZE = 4096
+
+def plan_geometry(width, height, tile_size=256, overlap=1):
+    """
+    Exact tile geometry of a DZI pyramid
+
+    Returns:
+        list of dicts (level, width, height, cols, rows, tiles, pixels), one
+        per level from 0 (1×1) up; pixels counts every tile's overlap
+    """
+    levels = []
+    for level in range(dzi_pyramid.max_level(width, height) + 1):
+        level_width, level_height = dzi_pyramid.level_dimensions(width, height, level)
+        cols, rows = dzi_pyramid.tile_grid(level_width, level_height, tile_size)
+        column_widths = sum(dzi_pyramid.tile_bounds(col, 0, tile_size, overlap,
+                                                    level_width, level_height)[2]
+                            for col in range(cols))
+        row_heights = sum(dzi_pyramid.tile_bounds(0, row, tile_size, overlap,
+                                                  level_width, level_height)[3]
+                          for row in range(rows))
+        levels.append({
+            'level': level,
+            'width': level_width,
+            'height': level_height,
+            'cols': cols,
+            'rows': rows,
+            'tiles': cols * rows,
+            'pixels': column_widths * row_heights,
+        })
+    return levels
+
+def block_size(path):
+    """Filesystem allocation unit at path (or its nearest existing parent)"""
+    path = Path(path).resolve()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    try:
+        return os.statvfs(path).f_bsize or DEFAULT_BLOCK_SIZE
+    except (AttributeError, OSError):
+        return DEFAULT_BLOCK_SIZE
+
+def sample_tiles(input_path, tile_size=256, overlap=1, codec=tile_codecs.DEFAULT_CODEC,
+                 quality=90, samples=DEFAULT_SAMPLES, seed=0, block=DEFAULT_BLOCK_SIZE):
+    """
+    Encode a random sample of full-resolution tiles of an image
+
+    Returns:
+        dict with samples, bytes_per_pixel, disk_bytes_per_pixel (tiles
+        rounded up to the block size), encode_seconds_per_mp (one thread),
+        write_seconds_per_tile and decode_mps (source decode rate)
+    """
+    import random
+    import tempfile
+    import numpy as np
+    import pyvips
+
+    image = pyvips.Image.new_from_file(str(input_path), access='sequential')
+    if image.hasalpha() and codec == 'jpeg':
+        image = image.flatten(background=[255])
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    width, height = image.width, image.height
+    cols, rows = dzi_pyramid.tile_grid(width, height, tile_size)
+    picks = sorted(random.Random(seed).sample(range(cols * rows), min(samples, cols * rows)))
+    picks_by_row = {}
+    for index in picks:
+        picks_by_row.setdefault(index // cols, []).append(index % cols)
+    suffix = tile_codecs.tile_suffix(codec, quality)
+    extension = f".{tile_codecs.CODECS[codec]['format']}"
+
+    encode_seconds = write_seconds = 0.0
+    total_bytes = disk_bytes = pixels = 0
+    read = dzi_pyramid.row_reader(image)
+    band = None
+    band_end = 0
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as scratch:
+        for row, row_cols in sorted(picks_by_row.items()):
+            # One band per sampled tile row, read top to bottom; the overlap
+            # rows shared with the band above are carried in memory
+            _, y, _, tile_height = dzi_pyramid.tile_bounds(0, row, tile_size, overlap,
+                                                           width, height)
+            if band is not None and y < band_end:
+                band = np.concatenate([band[len(band) - (band_end - y):],
+                                       read(band_end, y + tile_height - band_end)])
+            else:
+                band = read(y, tile_height)
+            band_end = y + tile_height
+
+            for col in row_cols:
+                x, _, tile_width, _ = dzi_pyramid.tile_bounds(col, row, tile_size, overlap,
+                                                              width, height)
+                tile = np.ascontiguousarray(band[:, x:x + tile_width])
+                tile = pyvips.Image.new_from_memory(tile.data, tile_width, tile_height,
+                                                    image.bands, 'uchar')
+                encode_start = time.perf_counter()
+                data = tile.write_to_buffer(suffix)
+                write_start = time.perf_counter()
+                with open(os.path.join(scratch, f"{col}_{row}{extension}"), 'wb') as f:
+                    f.write(data)
+                write_end = time.perf_counter()
+                encode_seconds += write_start - encode_start
+                write_seconds += write_end - write_start
+                total_bytes += len(data)
+                disk_bytes += math.ceil(len(data) / block) * block
+                pixels += tile_width * tile_height
+    elapsed = time.perf_counter() - start
+
+    # Decoding covered the source down to the last sampled tile row
+    decoded_rows = min(height, (picks[-1] // cols + 1) * tile_size + overlap)
+    decode_seconds = max(elapsed - encode_seconds - write_seconds, 1e-6)
+    return {
+        'samples': len(picks),
+        'bytes_per_pixel': total_bytes / pixels,
+        'disk_bytes_per_pixel': disk_bytes / pixels,
+        'encode_seconds_per_mp': encode_seconds / (pixels / 1_000_000),
+        'write_seconds_per_tile': write_seconds / len(picks),
+        'decode_mps': width * decoded_rows / 1_000_000 / decode_seconds,
+    }
+
+def plan_conversion(width, height, tile_size=256, overlap=1, codec=tile_codecs.DEFAULT_CODEC,
+                    quality=90, sample=None, threads=None):
+    """
+    Capacity plan for converting a width × height image
+
+    Args:
+        sample: sample_tiles() result; without it only geometry is planned
+        threads: Threads encoding tiles (default: libvips concurrency)
+
+    Returns:
+        JSON-ready dict with the settings, per-level geometry, totals and,
+        with a sample, estimated_bytes, estimated_disk_bytes and
+        estimated_seconds
+    """
+    levels = plan_geometry(width, height, tile_size, overlap)
+    plan = {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'overlap': overlap,
+        'codec': codec,
+        'quality': quality,
+        'levels': levels,
+        'total_levels': len(levels),
+        'total_tiles': sum(level['tiles'] for level in levels),
+        'total_pixels': sum(level['pixels'] for level in levels),
+    }
+    if sample is None:
+        return plan
+
+    if threads is None:
+        import pyvips
+
+        threads = pyvips.concurrency_get() if hasattr(pyvips, 'concurrency_get') else os.cpu_count()
+    threads = max(1, threads or 1)
+    decode = width * height / 1_000_000 / sample['decode_mps']
+    encode = plan['total_pixels'] / 1_000_000 * sample['encode_seconds_per_mp'] / threads
+    write = plan['total_tiles'] * sample['write_seconds_per_tile']
+    plan.update({
+        'sample': sample,
+        'threads': threads,
+        'estimated_bytes': round(plan['total_pixels'] * sample['bytes_per_pixel']),
+        'estimated_disk_bytes': round(plan['total_pixels'] * sample['disk_bytes_per_pixel']),
+        'estimated_seconds': {
+            'decode': round(decode, 1),
+            'encode': round(encode, 1),
+            'write': round(write, 1),
+            'total': round(decode + encode + write, 1),
+        },
+    })
+    return plan
+
+def plan_file(input_path, tile_size=256, overlap=1, codec=tile_codecs.DEFAULT_CODEC, quality=90,
+              samples=DEFAULT_SAMPLES, output_dir='../output/dzi', size=None, verbose=True):
+    """
+    Sample an image and plan its conversion (the --plan of the converters)
+
+    Args:
+        size: (width, height) to plan for instead of the image's own size,
+              with input_path standing in as similar content
+        verbose: Announce the sampling (off when stdout carries the JSON)
+
+    Returns:
+        plan_conversion() result
+    """
+    import pyvips
+
+    if size is None:
+        image = pyvips.Image.new_from_file(str(input_path), access='sequential')
+        size = (image.width, image.height)
+    if verbose:
+        print(f"🧪 Sampling {samples} tiles of {Path(input_path).name}...")
+    sample = sample_tiles(input_path, tile_size, overlap, codec, quality, samples,
+                          block=block_size(output_dir))
+    return plan_conversion(*size, tile_size, overlap, codec, quality, sample)
+
+def format_duration(seconds):
+    """Seconds as e.g. '42s', '12m 5s' or '3h 20m'"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
+def print_plan(plan):
+    """Print a plan_conversion() result"""
+    print(f"\n📐 {plan['width']:,} × {plan['height']:,} px, {plan['tile_size']}px tiles, "
+          f"overlap {plan['overlap']}, {plan['codec']} Q{plan['quality']}")
+    print(f"\n{'Level':>5} {'Size':>21} {'Grid':>13} {'Tiles':>12}")
+    for level in plan['levels']:
+        if level['tiles'] < 4 and level['level'] < plan['total_levels'] - 1:
+            continue   # The tiny 1-tile levels add nothing to read
+        print(f"{level['level']:>5} {level['width']:>10,} × {level['height']:<8,} "
+              f"{level['cols']:>5} × {level['rows']:<5} {level['tiles']:>12,}")
+    print(f"\n📚 Levels: {plan['total_levels']}")
+    print(f"🧩 Tiles: {plan['total_tiles']:,}")
+    if 'sample' not in plan:
+        print("   (no sample image: bytes and time not estimated)")
+        return
+    seconds = plan['estimated_seconds']
+    print(f"💾 Output: ~{memory_budget.format_bytes(plan['estimated_bytes'])} "
+          f"(~{memory_budget.format_bytes(plan['estimated_disk_bytes'])} on disk)")
+    print(f"⏱️  Time: ~{format_duration(seconds['total'])} "
+          f"(decode {format_duration(seconds['decode'])}, encode {format_duration(seconds['encode'])} "
+          f"on {plan['threads']} threads, write {format_duration(seconds['write'])})")
+    print(f"   From {plan['sample']['samples']} sampled tiles: "
+          f"{plan['sample']['bytes_per_pixel'] * plan['tile_size'] ** 2 / 1024:.1f} KB per full tile")
+
+def write_plan_json(plan, path):
+    """Write a plan as JSON to path, or to stdout for '-'"""
+    text = json.dumps(plan, indent=2)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        print(f"📄 Plan: {path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Exact tile geometry plus sampled size and time estimates for a conversion',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 capacity_plan.py scan.tiff
+  python3 capacity_plan.py scan.tiff --tile-size 512 --codec webp --json plan.json
+  python3 capacity_plan.py --size 200000x160000 --like sample.png
+        """
+    )
+    parser.add_argument('input', nargs='?', help='Image to plan the conversion of')
+    parser.add_argument('--size', metavar='WxH', help='Plan for an image of this size instead')
+    parser.add_argument('--like', metavar='IMAGE',
+                       help='With --size: sample bytes and time from this similar image')
+    parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
+                       help='Tile size in pixels (default: 256)')
+    parser.add_argument('--overlap', type=int, default=1, help='Pixel overlap (default: 1)')
+    parser.add_argument('--quality', type=int, default=90, help='Tile quality 1-100 (default: 90)')
+    parser.add_argument('--codec', default=tile_codecs.DEFAULT_CODEC, choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                       help=f'Tiles to encode for the estimate (default: {DEFAULT_SAMPLES})')
+    parser.add_argument('--output-dir', default='../output/dzi',
+                       help='Where the tiles would go, for the disk block size (default: ../output/dzi)')
+    parser.add_argument('--json', metavar='FILE', help="Write the plan as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    if bool(args.input) == bool(args.size):
+        parser.error('give either an input image or --size')
+    sample_path = args.input or args.like
+    if sample_path and not Path(sample_path).exists():
+        print(f"❌ Error: File not found: {sample_path}")
+        sys.exit(1)
+
+    size = None
+    if args.size:
+        try:
+            size = tuple(int(v) for v in args.size.lower().split('x'))
+        except ValueError:
+            size = ()
+        if len(size) != 2 or min(size) < 1:
+            parser.error('--size must be WIDTHxHEIGHT, e.g. 200000x160000')
+
+    if sample_path:
+        plan = plan_file(sample_path, args.tile_size, args.overlap, args.codec, args.quality,
+                         args.samples, args.output_dir, size, verbose=args.json != '-')
+    else:
+        plan = plan_conversion(*size, args.tile_size, args.overlap, args.codec, args.quality)
+    if args.json != '-':
+        print_plan(plan)
+    if args.json:
+        write_plan_json(plan, args.json)
+
+if __name__ == '__main__':
+    main()
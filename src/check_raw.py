@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Round-trip check for --raw (16-bit packed) DICOM conversions
+
+Converts the bundled samples with convert_dicom_to_dzi.py --raw in a
+scratch directory: a single slice, one frame of a multi-frame file and a
+slice directory (the series path). Each pyramid must have every level
+with the expected tiles, and unpacking its full-resolution tiles
+(red * 256 + green) must give back exactly the stored codes. Run it after
+touching the raw or packed-tile code.
+
+Usage:
+    python3 check_raw.py
+    python3 check_raw.py --keep
+"""
+
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / 'samples'
+
+# (label, sample, extra converter arguments, pyramid written for frame 0)
+CASES = (
+    ('single slice', '0015.dcm', [], 'check'),
+    ('12-bit slice', 'mrbrain.dcm', [], 'check'),
+    ('multi-frame', '0002-multiframe.dcm', ['--frame', '0'], 'check_frame_0000'),
+    ('series directory', 'mrbrain.dcm', ['--workers', '2'], 'check_frame_0000'),
+)
+
+def expected_codes(sample):
+    """Stored codes of a sample's first frame, as raw tiles should hold them"""
+    import numpy as np
+    import pydicom
+    from convert_dicom_to_dzi import raw_codes, raw_encoding
+
+    ds = pydicom.dcmread(sample)
+    pixels = ds.pixel_array
+    if int(getattr(ds, 'NumberOfFrames', 1) or 1) > 1:
+        pixels = pixels[0]
+    return raw_codes(np.squeeze(pixels), raw_encoding(ds))
+
+def check_pyramid(dzi_path, codes):
+    """
+    Returns:
+        list of problems; empty if the pyramid matches the codes
+    """
+    import numpy as np
+    import pyvips
+
+    info = dzi_pyramid.read_dzi(dzi_path)
+    width, height = info['width'], info['height']
+    if (height, width) != codes.shape:
+        return [f"pyramid is {width}×{height}, source is {codes.shape[1]}×{codes.shape[0]}"]
+    tile_size, overlap = info['tile_size'], info['overlap']
+    tiles_dir = dzi_path.with_name(f"{dzi_path.stem}_files")
+    top_level = dzi_pyramid.max_level(width, height)
+
+    problems = []
+    for level in range(top_level + 1):
+        cols, rows = dzi_pyramid.tile_grid(*dzi_pyramid.level_dimensions(width, height, level),
+                                           tile_size)
+        found = len(list((tiles_dir / str(level)).glob('*.png'))) if (tiles_dir / str(level)).is_dir() else 0
+        if found != cols * rows:
+            problems.append(f"level {level} has {found} of {cols * rows} tiles")
+    if problems:
+        return problems
+
+    cols, rows = dzi_pyramid.tile_grid(width, height, tile_size)
+    for row in range(rows):
+        for col in range(cols):
+            x, y, w, h = dzi_pyramid.tile_bounds(col, row, tile_size, overlap, width, height)
+            tile = pyvips.Image.new_from_file(str(tiles_dir / str(top_level) / f"{col}_{row}.png"))
+            pixels = np.ndarray(buffer=tile.write_to_memory(), dtype=np.uint8,
+                                shape=(tile.height, tile.width, tile.bands))
+            unpacked = pixels[:, :, 0].astype(np.uint16) * 256 + pixels[:, :, 1]
+            if unpacked.shape != (h, w) or not np.array_equal(unpacked, codes[y:y + h, x:x + w]):
+                return [f"tile {top_level}/{col}_{row} does not unpack to the stored codes"]
+    return []
+
+def run_case(scratch, label, sample, extra, pyramid):
+    """Convert one case in its own scratch tree and check the result"""
+    src = scratch / label.replace(' ', '_') / 'src'
+    src.mkdir(parents=True)
+    input_path = SAMPLES_DIR / sample
+    if label == 'series directory':
+        series_dir = src.parent / 'series'
+        series_dir.mkdir()
+        shutil.copy(input_path, series_dir / sample)
+        input_path = series_dir
+    converter = Path(__file__).resolve().parent / 'convert_dicom_to_dzi.py'
+    result = subprocess.run(
+        [sys.executable, str(converter), str(input_path), 'check', '--raw'] + extra,
+        cwd=src, capture_output=True, text=True, timeout=600,
+        env={**os.environ, 'DZI_SERVICE': 'off'})
+    if result.returncode != 0:
+        lines = (result.stdout + result.stderr).strip().splitlines()
+        return [f"conversion failed: {lines[-1] if lines else result.returncode}"]
+    dzi_path = src.parent / 'output' / 'dzi' / f"{pyramid}.dzi"
+    if not dzi_path.exists():
+        return [f"{dzi_path.name} was not written"]
+    return check_pyramid(dzi_path, expected_codes(SAMPLES_DIR / sample))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert the bundled DICOM samples with --raw and check the tiles round-trip',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 check_raw.py
+  python3 check_raw.py --keep        # leave the scratch pyramids for inspection
+        """
+    )
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix='check_raw_'))
+    failed = 0
+    print("🧪 Raw (16-bit packed) conversions")
+    try:
+        for label, sample, extra, pyramid in CASES:
+            try:
+                problems = run_case(scratch, label, sample, extra, pyramid)
+            except subprocess.TimeoutExpired:
+                problems = ["conversion timed out"]
+            if problems:
+                failed += 1
+                print(f"   ❌ {label:<18} {sample}: {'; '.join(problems)}")
+            else:
+                print(f"   ✅ {label:<18} {sample}")
+    finally:
+        if args.keep:
+            print(f"\n📁 Scratch output: {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if failed:
+        print(f"\n❌ {failed} raw conversion(s) failed")
+        sys.exit(1)
+    print("\n✅ Raw tiles round-trip")
+
+if __name__ == '__main__':
+    main()
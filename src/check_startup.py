@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Import-time regression check for the command-line tools
+
+Each tool is imported in a fresh interpreter with `python -X importtime`.
+The check fails if a tool imports an imaging library at module level
+(those belong inside the functions that use them) or if its cumulative
+import time exceeds the budget. Run it after touching a CLI's imports.
+
+Usage:
+    python3 check_startup.py
+    python3 check_startup.py --budget-ms 50 --runs 5
+    python3 check_startup.py convert_dicom_to_dzi generate_index
+"""
+
+import sys
+import os
+import subprocess
+from pathlib import Path
+import argparse
+
+# Tools whose startup should stay interpreter-bound
+TOOLS = (
+    'convert_to_dzi',
+    'convert_dicom_to_dzi',
+    'png_to_dzi',
+    'generate_index',
+    'update_dzi_region',
+    'transcode_dzi',
+    'tile_codecs',
+    'conversion_service',
+)
+
+# Loaded only on the code paths that need them
+HEAVY_MODULES = ('pyvips', 'numpy', 'pydicom', 'PIL')
+
+DEFAULT_BUDGET_MS = 100
+
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        (cumulative microseconds of the module import, set of top-level
+        package names imported on the way)
+    """
+    src_dir = Path(__file__).resolve().parent
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=src_dir, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    cumulative, packages = None, set()
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        if not total.strip().isdigit():
+            continue
+        packages.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            cumulative = int(total)
+    return cumulative or 0, packages
+
+def check_tool(module, budget_ms, runs=3):
+    """
+    Returns:
+        (best import time in ms, list of problems; empty if the tool passes)
+    """
+    best, problems = None, []
+    for _ in range(runs):
+        micros, packages = import_profile(module)
+        best = micros if best is None else min(best, micros)
+    heavy = sorted(name for name in HEAVY_MODULES if name in packages)
+    if heavy:
+        problems.append(f"imports {', '.join(heavy)} at module level")
+    if best / 1000 > budget_ms:
+        problems.append(f"import takes {best / 1000:.1f} ms (budget {budget_ms} ms)")
+    return best / 1000, problems
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fail if a CLI starts importing heavy libraries or slows down at startup',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 check_startup.py
+  python3 check_startup.py --budget-ms 50 --runs 5
+  python3 check_startup.py convert_dicom_to_dzi generate_index
+        """
+    )
+    parser.add_argument('tools', nargs='*', help=f"Modules to check (default: {', '.join(TOOLS)})")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                       help=f'Maximum cumulative import time per tool (default: {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--runs', type=int, default=3,
+                       help='Imports per tool; the fastest counts (default: 3)')
+    args = parser.parse_args()
+
+    failed = 0
+    print(f"⏱️  Import time per tool (best of {args.runs}, budget {args.budget_ms:g} ms)")
+    for module in args.tools or TOOLS:
+        try:
+            elapsed_ms, problems = check_tool(module, args.budget_ms, args.runs)
+        except RuntimeError as e:
+            print(f"   ❌ {module:<22} failed to import: {e}")
+            failed += 1
+            continue
+        if problems:
+            failed += 1
+            print(f"   ❌ {module:<22} {elapsed_ms:7.1f} ms  {'; '.join(problems)}")
+        else:
+            print(f"   ✅ {module:<22} {elapsed_ms:7.1f} ms")
+
+    if failed:
+        print(f"\n❌ {failed} tool(s) over budget or importing heavy modules at startup")
+        sys.exit(1)
+    print("\n✅ Startup within budget")
+
+if __name__ == '__main__':
+    main()
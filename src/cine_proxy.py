@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Low-resolution cine proxy for multi-frame series
+
+Packs a small version of every frame of a <base>_series.json series into a
+few sprite sheets and records their layout under "proxy" in the series
+JSON. multiframe_viewer.html scrubs and plays from the sheets, and only
+opens a frame's full pyramid once playback stops.
+
+Frames are taken from a level already in each frame's pyramid (a single
+tile), so no frame is decoded or resampled again.
+
+Usage:
+    python3 cine_proxy.py cardiac
+    python3 cine_proxy.py cardiac --max-side 384
+"""
+
+import sys
+import json
+import os
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+
+# Longer side of a proxy frame in pixels (capped at the tile size)
+PROXY_MAX_SIDE = 256
+
+# Sprite sheets stay within the texture size every browser accepts
+SHEET_MAX_SIDE = 4096
+
+def proxy_level(width, height, max_side):
+    """Deepest pyramid level whose longer side fits within max_side"""
+    level = dzi_pyramid.max_level(width, height)
+    while level > 0 and max(dzi_pyramid.level_dimensions(width, height, level)) > max_side:
+        level -= 1
+    return level
+
+def load_proxy_frame(dzi_path, max_side):
+    """
+    Small version of one frame, read from its own pyramid
+
+    Returns:
+        pyvips image, or None if the frame's pyramid is missing
+    """
+    import pyvips
+
+    if not dzi_path.exists():
+        return None
+    info = dzi_pyramid.read_dzi(dzi_path)
+    max_side = min(max_side, info['tile_size'])
+    level = proxy_level(info['width'], info['height'], max_side)
+    tile = dzi_path.with_name(f"{dzi_path.stem}_files") / str(level) / f"0_0.{info['format']}"
+    if not tile.exists():
+        return None
+    return pyvips.Image.new_from_file(str(tile))
+
+def build_cine_proxy(base_name, frame_count, output_dir='../output/dzi',
+                     max_side=PROXY_MAX_SIDE, quality=80):
+    """
+    Write sprite sheets for frames <base>_frame_0000 ... and describe them
+
+    Every frame occupies one cell of the same size (the first frame's proxy
+    size), so cell N is always frame N; frames of other sizes are scaled
+    into it and frames without a pyramid (failed or not converted) are
+    left black. Raw (PNG-tiled) series get PNG sheets so the packed values
+    survive.
+
+    Args:
+        frame_count: Frames in the series (total, not just converted)
+
+    Returns:
+        dict for the series JSON "proxy" key, or None if no frame was found
+    """
+    import pyvips
+
+    output_dir = Path(output_dir)
+    dzi_paths = [output_dir / f"{base_name}_frame_{index:04d}.dzi" for index in range(frame_count)]
+
+    first = next((frame for frame in (load_proxy_frame(path, max_side) for path in dzi_paths)
+                  if frame is not None), None)
+    if first is None:
+        return None
+    cell_width, cell_height, bands = first.width, first.height, first.bands
+    tile_format = dzi_pyramid.read_dzi(next(path for path in dzi_paths if path.exists()))['format']
+    sheet_format = 'png' if tile_format == 'png' else 'jpg'
+    save_options = '[compression=6,strip=true]' if sheet_format == 'png' \
+        else f'[Q={quality},optimize_coding=true,strip=true]'
+
+    columns = max(1, SHEET_MAX_SIDE // cell_width)
+    rows = max(1, SHEET_MAX_SIDE // cell_height)
+    per_sheet = columns * rows
+    blank = pyvips.Image.black(cell_width, cell_height, bands=bands).cast('uchar')
+
+    sheets = []
+    for start in range(0, frame_count, per_sheet):
+        cells = []
+        for path in dzi_paths[start:start + per_sheet]:
+            frame = load_proxy_frame(path, max_side)
+            if frame is None or frame.bands != bands:
+                frame = blank
+            elif (frame.width, frame.height) != (cell_width, cell_height):
+                frame = frame.resize(cell_width / frame.width, vscale=cell_height / frame.height)
+            cells.append(frame)
+        sheet = pyvips.Image.arrayjoin(cells, across=min(columns, len(cells)))
+        name = f"{base_name}_proxy_{len(sheets):03d}.{sheet_format}"
+        tmp_path = output_dir / f".{name}"
+        sheet.write_to_file(f"{tmp_path}{save_options}")
+        os.replace(tmp_path, output_dir / name)
+        sheets.append(name)
+
+    return {
+        'frame_width': cell_width,
+        'frame_height': cell_height,
+        'columns': columns,
+        'frames_per_sheet': per_sheet,
+        'format': sheet_format,
+        'sheets': sheets,
+    }
+
+def add_to_series(series_file, max_side=PROXY_MAX_SIDE):
+    """
+    Build the proxy for a series and record it in its JSON
+
+    Returns:
+        The proxy dict, or None if none could be built
+    """
+    series_file = Path(series_file)
+    with open(series_file) as f:
+        series = json.load(f)
+    # Cells follow frame numbers: a failed frame or a single --frame N
+    # conversion leaves gaps, not a shorter run starting at frame 0
+    proxy = build_cine_proxy(series['base_name'], series['total_frames'],
+                             series_file.parent, max_side)
+    if proxy is None:
+        return None
+    series['proxy'] = proxy
+    tmp_path = series_file.with_name(series_file.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(series, f, indent=2)
+    os.replace(tmp_path, series_file)
+    return proxy
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build sprite-sheet cine proxies for multi-frame series',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 cine_proxy.py cardiac
+  python3 cine_proxy.py cardiac chest_ct --max-side 384
+        """
+    )
+
+    parser.add_argument('series', nargs='+', help='Series base names in ../output/dzi')
+    parser.add_argument('--max-side', type=int, default=PROXY_MAX_SIDE,
+                       help=f'Longer side of a proxy frame (default: {PROXY_MAX_SIDE})')
+
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.series:
+        series_file = Path('../output/dzi') / f"{name}_series.json"
+        if not series_file.exists():
+            print(f"❌ Error: Series not found: {series_file}")
+            ok = False
+            continue
+        proxy = add_to_series(series_file, args.max_side)
+        if proxy is None:
+            print(f"⚠️  {name}: no frames to build a proxy from")
+            ok = False
+            continue
+        print(f"🎞️  {name}: {len(proxy['sheets'])} sheet(s) of "
+              f"{proxy['frame_width']}×{proxy['frame_height']} frames")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Long-lived conversion service with a warm worker pool
+
+Starting a converter costs an interpreter plus pyvips, numpy, PIL and
+pydicom imports and libvips start-up, which dominates the wall time of a
+small DICOM slice. The service keeps worker processes with all of that
+already loaded and runs jobs from a local Unix socket.
+
+While the service is running, convert_to_dzi.py, convert_dicom_to_dzi.py,
+png_to_dzi.py and mosaic.py become thin clients: they send their arguments
+and working directory, stream the job's output back, answer its prompts
+(e.g. overwrite an existing output) from their own stdin and exit with
+its status.
+Without a service (or with DZI_SERVICE=off) they run locally as before.
+
+Jobs are interactive (default) or bulk (DZI_PRIORITY=bulk). Interactive
+jobs go ahead of every queued bulk job, and with two or more workers one
+worker only takes interactive jobs, so a bulk backlog never blocks them.
+
+Usage:
+    python3 conversion_service.py start --workers 4
+    python3 conversion_service.py status
+    python3 conversion_service.py stop
+    DZI_PRIORITY=bulk python3 convert_dicom_to_dzi.py slice_0001.dcm
+"""
+
+import sys
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from pathlib import Path
+import argparse
+
+SOCKET_PATH = os.environ.get(
+    'DZI_SERVICE_SOCKET',
+    str(Path(__file__).resolve().parent.parent / 'output' / '.convert_service.sock'))
+
+# CLIs the service can run; each module's main() parses sys.argv
+TOOLS = ('convert_to_dzi', 'convert_dicom_to_dzi', 'png_to_dzi', 'mosaic')
+
+PRIORITIES = ('interactive', 'bulk')
+
+# Loaded once per worker so jobs start without import or library start-up
+WARM_MODULES = ('numpy', 'PIL.Image', 'pydicom', 'pyvips') + TOOLS
+
+class _Output(io.TextIOBase):
+    """sys.stdout/sys.stderr replacement that ships lines to the service"""
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+        self.buffer = ''
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.buffer += text
+        if '\n' in self.buffer:
+            lines, self.buffer = self.buffer.rsplit('\n', 1)
+            with self.lock:
+                self.conn.send(('output', lines + '\n'))
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            with self.lock:
+                self.conn.send(('output', self.buffer))
+            self.buffer = ''
+
+class _Input(io.TextIOBase):
+    """sys.stdin replacement that asks the client for each line"""
+
+    def __init__(self, conn, lock, output):
+        self.conn = conn
+        self.lock = lock
+        self.output = output
+
+    def readable(self):
+        return True
+
+    def readline(self, size=-1):
+        self.output.flush()   # The prompt has no newline yet
+        with self.lock:
+            self.conn.send(('input', None))
+        return self.conn.recv()   # '' once the client has no more input
+
+def _worker_main(conn, src_dir):
+    """Worker process: warm up, then run jobs received on conn"""
+    import importlib
+
+    sys.path.insert(0, src_dir)
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass   # Reported by the job that needs it
+    try:
+        import pyvips
+        pyvips.Image.black(16, 16).avg()   # Start libvips' thread pool
+    except Exception:
+        pass
+
+    lock = threading.Lock()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        output = _Output(conn, lock)
+        sys.stdout = sys.stderr = output
+        sys.stdin = _Input(conn, lock, output)
+        sys.argv = [f"{job['tool']}.py"] + job['argv']
+        status = 0
+        try:
+            os.chdir(job['cwd'])
+            importlib.import_module(job['tool']).main()
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException as e:
+            print(f"❌ Service worker error: {e}")
+            status = 1
+        finally:
+            output.flush()
+            sys.stdout, sys.stderr, sys.stdin = sys.__stdout__, sys.__stderr__, sys.__stdin__
+        conn.send(('exit', status))
+
+class Worker:
+    """One warm worker process and the pipe to it"""
+
+    def __init__(self, context, src_dir):
+        self.context = context
+        self.src_dir = src_dir
+        self.jobs_done = 0
+        self.start()
+
+    def start(self):
+        self.conn, child = self.context.Pipe()
+        # Not daemonic: jobs may open process pools of their own (directory
+        # series, catalog builds); the service kills its workers on shutdown
+        self.process = self.context.Process(target=_worker_main, args=(child, self.src_dir))
+        self.process.start()
+        child.close()
+        self.jobs_done = 0
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+class JobQueue:
+    """Two FIFO priority classes; interactive jobs are always taken first"""
+
+    def __init__(self):
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        self.condition = threading.Condition()
+
+    def put(self, job):
+        with self.condition:
+            self.queues[job['priority']].append(job)
+            self.condition.notify_all()
+            return sum(len(q) for q in self.queues.values())
+
+    def get(self, allow_bulk=True):
+        with self.condition:
+            while True:
+                if self.queues['interactive']:
+                    return self.queues['interactive'].popleft()
+                if allow_bulk and self.queues['bulk']:
+                    return self.queues['bulk'].popleft()
+                self.condition.wait()
+
+    def lengths(self):
+        with self.condition:
+            return {priority: len(q) for priority, q in self.queues.items()}
+
+class ConversionService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Accepts jobs on a Unix socket and runs them on the warm workers"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers):
+        import multiprocessing
+
+        self.jobs = JobQueue()
+        self.stats = {'completed': 0, 'failed': 0, 'started': time.time()}
+        self.stats_lock = threading.Lock()
+        context = multiprocessing.get_context('spawn')
+        src_dir = str(Path(__file__).resolve().parent)
+        self.workers = [Worker(context, src_dir) for _ in range(workers)]
+        self.busy = [None] * workers
+        super().__init__(socket_path, ServiceRequestHandler)
+        for index in range(workers):
+            # With several workers the first one is kept for interactive jobs
+            allow_bulk = workers == 1 or index > 0
+            threading.Thread(target=self.dispatch, args=(index, allow_bulk), daemon=True).start()
+
+    def dispatch(self, index, allow_bulk):
+        """Feed one worker from the queue and relay its output"""
+        worker = self.workers[index]
+        while True:
+            job = self.jobs.get(allow_bulk)
+            # A memory budget is measured per process, so it gets a fresh one
+            if job['fresh'] and worker.jobs_done:
+                worker.restart()
+            self.busy[index] = job
+            job['send']({'event': 'started', 'worker': worker.process.pid})
+            status = None
+            try:
+                worker.conn.send({k: job[k] for k in ('tool', 'argv', 'cwd')})
+                while status is None:
+                    kind, value = worker.conn.recv()
+                    if kind == 'exit':
+                        status = value
+                    elif kind == 'input':
+                        worker.conn.send(job['read']())
+                    elif not job['send']({'event': 'output', 'text': value}):
+                        # Client went away: cancel by replacing the worker
+                        status = 130
+                        worker.restart()
+            except (EOFError, OSError):
+                # The worker died (e.g. a --max-memory stop); replace it
+                worker.process.join()
+                status = worker.process.exitcode or 1
+                worker.restart()
+            worker.jobs_done += 1
+            if job['fresh']:
+                worker.restart()
+            self.busy[index] = None
+            with self.stats_lock:
+                self.stats['completed' if status == 0 else 'failed'] += 1
+            job['send']({'event': 'exit', 'status': status})
+            job['done'].set()
+
+    def status(self):
+        return {
+            'workers': len(self.workers),
+            'busy': [job and {'tool': job['tool'], 'priority': job['priority']}
+                     for job in self.busy],
+            'queued': self.jobs.lengths(),
+            'completed': self.stats['completed'],
+            'failed': self.stats['failed'],
+            'uptime': round(time.time() - self.stats['started']),
+        }
+
+class ServiceRequestHandler(socketserver.StreamRequestHandler):
+    """One client connection: a JSON request line, JSON event lines back"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        if request.get('command') == 'status':
+            self.send(self.server.status())
+            return
+        if request.get('command') == 'stop':
+            self.send({'event': 'stopping'})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        if request.get('tool') not in TOOLS or request.get('priority') not in PRIORITIES:
+            self.send({'event': 'exit', 'status': 2, 'error': 'Unknown tool or priority'})
+            return
+
+        job = {
+            'tool': request['tool'],
+            'argv': [str(a) for a in request.get('argv', [])],
+            'cwd': request.get('cwd') or os.getcwd(),
+            'priority': request['priority'],
+            'fresh': any(a.startswith('--max-memory') for a in request.get('argv', [])),
+            'send': self.send,
+            'read': self.read_input,
+            'done': threading.Event(),
+        }
+        position = self.server.jobs.put(job)
+        self.send({'event': 'queued', 'position': position})
+        job['done'].wait()
+
+    def read_input(self):
+        """The client's answer to a prompt; '' at end of input"""
+        self.send({'event': 'input'})
+        try:
+            line = self.rfile.readline()
+            return json.loads(line).get('input', '') if line else ''
+        except (OSError, ValueError):
+            return ''
+
+    def send(self, message):
+        """Write one event line; False once the client has gone"""
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode())
+            self.wfile.flush()
+            return True
+        except OSError:
+            return False
+
+def _connect(socket_path=SOCKET_PATH, timeout=None):
+    """Connected socket to a running service, or None"""
+    if not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def request(message, socket_path=SOCKET_PATH):
+    """Send a control request and return the first reply, or None"""
+    sock = _connect(socket_path, timeout=5)
+    if sock is None:
+        return None
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps(message) + '\n').encode())
+        stream.flush()
+        line = stream.readline()
+        return json.loads(line) if line else None
+
+def submit(tool, argv, priority=None, socket_path=SOCKET_PATH):
+    """
+    Run a CLI invocation in the service, streaming its output here
+
+    Returns:
+        The job's exit status, or None if no service is running
+    """
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+    priority = priority or os.environ.get('DZI_PRIORITY', 'interactive')
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps({'tool': tool, 'argv': argv, 'cwd': os.getcwd(),
+                                  'priority': priority}) + '\n').encode())
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event['event'] == 'queued' and event['position'] > 1:
+                print(f"⏳ Queued ({priority}, position {event['position']})", flush=True)
+            elif event['event'] == 'output':
+                sys.stdout.write(event['text'])
+                sys.stdout.flush()
+            elif event['event'] == 'input':
+                stream.write((json.dumps({'input': sys.stdin.readline()}) + '\n').encode())
+                stream.flush()
+            elif event['event'] == 'exit':
+                if event.get('error'):
+                    print(f"❌ Service: {event['error']}")
+                return event['status']
+    print("❌ Conversion service closed the connection")
+    return 1
+
+def run_main(tool, main):
+    """
+    Entry point of the converter CLIs: use the service when it is running
+
+    Help and DZI_SERVICE=off always run locally.
+    """
+    argv = sys.argv[1:]
+    if os.environ.get('DZI_SERVICE', '').lower() not in ('off', '0', 'no') \
+            and not {'-h', '--help'} & set(argv):
+        status = submit(tool, argv)
+        if status is not None:
+            sys.exit(status)
+    main()
+
+def serve(socket_path=SOCKET_PATH, workers=None):
+    """Run the service in the foreground until stopped"""
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    if _connect(socket_path):
+        print(f"❌ Error: A service is already running on {socket_path}")
+        return False
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)   # Left behind by a service that crashed
+    Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+
+    service = ConversionService(socket_path, workers)
+    print(f"🔥 Conversion service: {workers} warm worker(s) on {socket_path}")
+    print("   Converters now submit here; stop with: python3 conversion_service.py stop")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        for worker in service.workers:
+            worker.stop()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    print("👋 Conversion service stopped")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Warm conversion service the converter CLIs submit jobs to',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 conversion_service.py start --workers 4
+  python3 conversion_service.py status
+  python3 conversion_service.py stop
+  DZI_PRIORITY=bulk python3 convert_dicom_to_dzi.py slice_0001.dcm
+  DZI_SERVICE=off python3 convert_to_dzi.py photo.jpg      # bypass the service
+        """
+    )
+    parser.add_argument('command', choices=['start', 'status', 'stop'])
+    parser.add_argument('--workers', type=int, metavar='N',
+                       help='Warm worker processes (default: half the CPUs)')
+    parser.add_argument('--socket', default=SOCKET_PATH, help=f'Socket path (default: {SOCKET_PATH})')
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        sys.exit(0 if serve(args.socket, args.workers) else 1)
+
+    reply = request({'command': args.command}, args.socket)
+    if reply is None:
+        print(f"⚠️  No conversion service running on {args.socket}")
+        sys.exit(1)
+    if args.command == 'stop':
+        print("🛑 Stopping conversion service")
+        return
+    busy = sum(1 for job in reply['busy'] if job)
+    print(f"🔥 {reply['workers']} worker(s), {busy} busy; up {reply['uptime']}s")
+    print(f"   Queued: {reply['queued']['interactive']} interactive, {reply['queued']['bulk']} bulk")
+    print(f"   Jobs: {reply['completed']} completed, {reply['failed']} failed")
+
+if __name__ == '__main__':
+    main()
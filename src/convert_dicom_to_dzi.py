@@ -9,41 +9,38 @@ Usage:
     python3 convert_dicom_to_dzi.py scan.dcm patient_001 --tile-size 512 --quality 95
     python3 convert_dicom_to_dzi.py multi.dcm study --all-frames
     python3 convert_dicom_to_dzi.py multi.dcm study --frame 50
+    python3 convert_dicom_to_dzi.py multi.dcm study --all-frames --max-memory 1G
+    python3 convert_dicom_to_dzi.py ct_study_dir/ chest_ct --workers 8
+    python3 convert_dicom_to_dzi.py ct_study_dir/ chest_ct --windows dataset,lung,bone
 """
 
 import sys
 import os
 from pathlib import Path
 import argparse
+import re
 import tempfile
+from contextlib import nullcontext
 
-try:
-    import pydicom
-except ImportError:
-    print("❌ Error: pydicom not installed")
-    print("   Install with: pip install pydicom")
-    sys.exit(1)
-
-try:
-    import numpy as np
-except ImportError:
-    print("❌ Error: numpy not installed")
-    print("   Install with: pip install numpy")
-    sys.exit(1)
+import cine_proxy
+import conversion_service
+import memory_budget
+import tile_codecs
+import tile_dedup
 
-try:
-    from PIL import Image
-except ImportError:
-    print("❌ Error: Pillow not installed")
-    print("   Install with: pip install pillow")
-    sys.exit(1)
+# Imaging libraries are imported where they are used so --help, argument
+# errors and thin-client runs against the conversion service start fast
+DEPENDENCIES = (('pydicom', 'pydicom'), ('numpy', 'numpy'), ('pyvips', 'pyvips'))
 
-try:
-    import pyvips
-except ImportError:
-    print("❌ Error: pyvips not installed")
-    print("   Install with: pip install pyvips")
-    sys.exit(1)
+def check_dependencies():
+    """Exit with an install hint if a required imaging library is missing"""
+    from importlib.util import find_spec
+    
+    for module, package in DEPENDENCIES:
+        if find_spec(module) is None:
+            print(f"❌ Error: {module} not installed")
+            print(f"   Install with: pip install {package}")
+            sys.exit(1)
 
 def format_bytes(bytes_val):
     """Human-readable file size"""
@@ -53,6 +50,260 @@ def format_bytes(bytes_val):
         bytes_val /= 1024.0
     return f"{bytes_val:.1f} TB"
 
+def rescale_pixels(pixel_array, ds):
+    """Apply rescale slope and intercept if present (Hounsfield units for CT)"""
+    if hasattr(ds, 'RescaleSlope') and hasattr(ds, 'RescaleIntercept'):
+        pixel_array = pixel_array * ds.RescaleSlope + ds.RescaleIntercept
+    return pixel_array
+
+def dataset_window(ds):
+    """
+    First WindowCenter/WindowWidth pair of a dataset
+    
+    Returns:
+        (img_min, img_max) tuple, or None if the dataset has no window
+    """
+    import pydicom
+
+    if not (hasattr(ds, 'WindowCenter') and hasattr(ds, 'WindowWidth')):
+        return None
+    window_center = ds.WindowCenter
+    window_width = ds.WindowWidth
+    
+    # Handle multiple windows (use first)
+    if isinstance(window_center, (list, pydicom.multival.MultiValue)):
+        window_center = float(window_center[0])
+    if isinstance(window_width, (list, pydicom.multival.MultiValue)):
+        window_width = float(window_width[0])
+    
+    return window_center - window_width / 2, window_center + window_width / 2
+
+def window_to_uint8(pixel_array, ds, value_range=None):
+    """
+    Rescale, window and normalize raw DICOM pixels to 8-bit
+    
+    Args:
+        pixel_array: Raw stored pixel values
+        ds: Dataset supplying rescale, window and photometric attributes
+        value_range: Fixed (min, max) mapped to 0-255. By default each array
+            is stretched to its own min/max, which is right for a single
+            image but makes slices of a volume inconsistent.
+    
+    Returns:
+        uint8 array of the same shape
+    """
+    import numpy as np
+
+    pixel_array = rescale_pixels(pixel_array, ds)
+    
+    # Apply windowing if WindowCenter and WindowWidth are present
+    window = dataset_window(ds)
+    if window is not None:
+        pixel_array = np.clip(pixel_array, *window)
+    
+    # Normalize to 0-255 range
+    if value_range is None:
+        low, high = np.min(pixel_array), np.max(pixel_array)
+    else:
+        low, high = value_range
+        pixel_array = np.clip(pixel_array, low, high)
+    pixel_array = pixel_array - low
+    if high - low > 0:  # Avoid division by zero
+        pixel_array = pixel_array / (high - low)
+    pixel_array = (pixel_array * 255).astype(np.uint8)
+    
+    # Handle photometric interpretation
+    photometric = getattr(ds, 'PhotometricInterpretation', 'MONOCHROME2')
+    if photometric == 'MONOCHROME1':
+        # Invert for MONOCHROME1 (pixel value increases = darker)
+        pixel_array = 255 - pixel_array
+    
+    return pixel_array
+
+def raw_encoding(ds):
+    """
+    Lossless mapping of a dataset's stored values to 16-bit tile codes
+    
+    Codes are stored values shifted to start at zero, so the modality value
+    is code * step + offset. The same mapping holds for every frame of a
+    series, which lets the viewer share one window across frames.
+    
+    Returns:
+        dict describing the encoding (written to the series/raw JSON)
+    """
+    bits = int(getattr(ds, 'BitsStored', 16) or 16)
+    if bits > 16:
+        raise ValueError(f"Raw tiles support up to 16 bits stored (dataset has {bits})")
+    if int(getattr(ds, 'SamplesPerPixel', 1) or 1) != 1:
+        raise ValueError("Raw tiles support greyscale images only")
+    signed = int(getattr(ds, 'PixelRepresentation', 0) or 0) == 1
+    raw_min = -(1 << (bits - 1)) if signed else 0
+    slope = float(getattr(ds, 'RescaleSlope', 1) or 1)
+    intercept = float(getattr(ds, 'RescaleIntercept', 0) or 0)
+    return {
+        'encoding': 'rg16',
+        'raw_min': raw_min,
+        'step': slope,
+        'offset': raw_min * slope + intercept,
+        'invert': getattr(ds, 'PhotometricInterpretation', 'MONOCHROME2') == 'MONOCHROME1',
+        'units': 'HU' if getattr(ds, 'Modality', '') == 'CT' else '',
+    }
+
+def window_presets(ds, value_range=None):
+    """
+    Window presets for client-side windowing
+    
+    Every WindowCenter/WindowWidth pair in the dataset (named by
+    WindowCenterWidthExplanation when present), plus the data's full range.
+    """
+    import pydicom
+
+    presets = []
+    if hasattr(ds, 'WindowCenter') and hasattr(ds, 'WindowWidth'):
+        centers, widths = ds.WindowCenter, ds.WindowWidth
+        if not isinstance(centers, (list, pydicom.multival.MultiValue)):
+            centers, widths = [centers], [widths]
+        names = getattr(ds, 'WindowCenterWidthExplanation', None) or []
+        if isinstance(names, str):
+            names = [names]
+        for index, (center, width) in enumerate(zip(centers, widths)):
+            name = str(names[index]) if index < len(names) else f"Window {index + 1}"
+            presets.append({'name': name, 'center': float(center), 'width': float(width)})
+    if value_range is not None:
+        low, high = value_range
+        presets.append({'name': 'Full range', 'center': (low + high) / 2,
+                        'width': max(high - low, 1.0)})
+    return presets
+
+def raw_codes(pixel_array, encoding):
+    """Convert stored pixel values to unsigned 16-bit codes"""
+    import numpy as np
+
+    codes = pixel_array.astype(np.int32) - encoding['raw_min']
+    return np.clip(codes, 0, 65535).astype(np.uint16)
+
+def save_raw_pyramid(pixel_array, encoding, base_path, tile_size, overlap):
+    """
+    Tile stored pixel values losslessly (see dzi_pyramid.build_packed16)
+    
+    Returns:
+        (low, high) modality value range of this image
+    """
+    import numpy as np
+    import pyvips
+
+    import dzi_pyramid
+    
+    codes = raw_codes(np.squeeze(pixel_array), encoding)
+    height, width = codes.shape
+    image = pyvips.Image.new_from_memory(codes.tobytes(), width, height, 1, 'ushort')
+    dzi_pyramid.build_packed16(image, base_path, tile_size, overlap)
+    low, high = int(codes.min()), int(codes.max())
+    return (low * encoding['step'] + encoding['offset'],
+            high * encoding['step'] + encoding['offset'])
+
+# Common CT windows (center, width in HU) for --windows
+SITE_WINDOWS = {
+    'brain': (40, 80),
+    'subdural': (75, 215),
+    'stroke': (40, 40),
+    'lung': (-600, 1500),
+    'mediastinum': (50, 350),
+    'abdomen': (50, 400),
+    'liver': (30, 150),
+    'bone': (400, 1800),
+}
+
+def _preset_slug(name):
+    """File-name-safe form of a window preset name"""
+    return re.sub(r'[^a-z0-9]+', '_', str(name).lower()).strip('_') or 'window'
+
+def resolve_windows(spec, ds):
+    """
+    Expand a --windows spec into window presets
+    
+    The spec is a comma-separated list of 'dataset' (every WindowCenter/
+    WindowWidth pair in the file), site preset names from SITE_WINDOWS, or
+    custom NAME=CENTER/WIDTH entries.
+    
+    Returns:
+        list of (name, center, width) with unique, file-name-safe names
+    """
+    windows = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        if item == 'dataset':
+            windows.extend((_preset_slug(preset['name']), preset['center'], preset['width'])
+                           for preset in window_presets(ds))
+        elif '=' in item:
+            name, _, values = item.partition('=')
+            center, _, width = values.partition('/')
+            try:
+                windows.append((_preset_slug(name), float(center), float(width)))
+            except ValueError:
+                raise ValueError(f"Invalid window '{item}' (use NAME=CENTER/WIDTH)")
+        elif item.lower() in SITE_WINDOWS:
+            windows.append((item.lower(),) + SITE_WINDOWS[item.lower()])
+        else:
+            raise ValueError(f"Unknown window preset '{item}' "
+                             f"(site presets: {', '.join(SITE_WINDOWS)})")
+    
+    if not windows:
+        raise ValueError("No window presets to render (the dataset has no WindowCenter/WindowWidth)")
+    if any(width <= 0 for _, _, width in windows):
+        raise ValueError("Window widths must be positive")
+    
+    unique, seen = [], {}
+    for name, center, width in windows:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append((name if seen[name] == 1 else f"{name}_{seen[name]}", center, width))
+    return unique
+
+def window_lut(encoding, center, width):
+    """8-bit lookup table mapping 16-bit codes (see raw_encoding) through one window"""
+    import numpy as np
+
+    values = np.arange(65536, dtype=np.float64) * encoding['step'] + encoding['offset']
+    grey = np.clip((values - (center - width / 2)) / width * 255, 0, 255)
+    if encoding['invert']:
+        grey = 255 - grey
+    return np.rint(grey).astype(np.uint8)
+
+def save_window_pyramids(pixel_array, encoding, luts, base_paths, tile_size, quality, overlap,
+                         codec=tile_codecs.DEFAULT_CODEC):
+    """
+    Tile one decoded frame once per window preset
+    
+    The frame is converted to 16-bit codes once; each preset is then a
+    table lookup feeding its own dzsave. The pipelines run in threads since
+    libvips releases the GIL while it encodes.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import numpy as np
+    import pyvips
+    
+    codes = raw_codes(np.squeeze(pixel_array), encoding)
+    height, width = codes.shape
+    
+    def tile(lut, base_path):
+        grey = lut[codes]
+        image = pyvips.Image.new_from_memory(grey.tobytes(), width, height, 1, 'uchar')
+        with memory_budget.remove_on_stop(f"{base_path}.dzi", f"{base_path}_files"):
+            image.dzsave(
+                str(base_path),
+                tile_size=tile_size,
+                overlap=overlap,
+                suffix=tile_codecs.tile_suffix(codec, quality),
+                depth='onepixel',
+                centre=False,
+                layout='dz'
+            )
+    
+    with ThreadPoolExecutor(max_workers=len(luts)) as pool:
+        for future in [pool.submit(tile, lut, path) for lut, path in zip(luts, base_paths)]:
+            future.result()
+
 def dicom_to_image(dicom_path, frame_index=None):
     """
     Convert DICOM file to PIL Image
@@ -65,6 +316,9 @@ def dicom_to_image(dicom_path, frame_index=None):
     Returns:
         (image, dicom_dataset, total_frames) tuple
     """
+    import numpy as np
+    import pydicom
+
     # Read DICOM file
     ds = pydicom.dcmread(dicom_path)
     
@@ -127,39 +381,11 @@ def dicom_to_image(dicom_path, frame_index=None):
             f"   For 3D/4D data, please extract individual slices first."
         )
     
-    # Apply rescale slope and intercept if present (Hounsfield units for CT)
-    if hasattr(ds, 'RescaleSlope') and hasattr(ds, 'RescaleIntercept'):
-        pixel_array = pixel_array * ds.RescaleSlope + ds.RescaleIntercept
-    
-    # Apply windowing if WindowCenter and WindowWidth are present
-    if hasattr(ds, 'WindowCenter') and hasattr(ds, 'WindowWidth'):
-        window_center = ds.WindowCenter
-        window_width = ds.WindowWidth
-        
-        # Handle multiple windows (use first)
-        if isinstance(window_center, (list, pydicom.multival.MultiValue)):
-            window_center = float(window_center[0])
-        if isinstance(window_width, (list, pydicom.multival.MultiValue)):
-            window_width = float(window_width[0])
-        
-        # Apply window
-        img_min = window_center - window_width / 2
-        img_max = window_center + window_width / 2
-        pixel_array = np.clip(pixel_array, img_min, img_max)
+    pixel_array = window_to_uint8(pixel_array, ds)
     
-    # Normalize to 0-255 range
-    pixel_array = pixel_array - np.min(pixel_array)
-    if np.max(pixel_array) > 0:  # Avoid division by zero
-        pixel_array = pixel_array / np.max(pixel_array)
-    pixel_array = (pixel_array * 255).astype(np.uint8)
-    
-    # Handle photometric interpretation
-    photometric = getattr(ds, 'PhotometricInterpretation', 'MONOCHROME2')
-    if photometric == 'MONOCHROME1':
-        # Invert for MONOCHROME1 (pixel value increases = darker)
-        pixel_array = 255 - pixel_array
+    # Convert to PIL Image (only needed for the temp-file paths)
+    from PIL import Image
     
-    # Convert to PIL Image
     if len(pixel_array.shape) == 2:
         # Grayscale
         image = Image.fromarray(pixel_array, mode='L')
@@ -190,7 +416,50 @@ def extract_dicom_metadata(ds):
     
     return metadata
 
-def convert_dicom_to_dzi(dicom_path, output_name=None, tile_size=256, quality=90, overlap=1):
+def _report_output(dzi_path, tiles_dir, input_size):
+    """Print tile counts and sizes for a finished single-image conversion"""
+    # Count generated tiles
+    tile_count = sum(1 for f in tiles_dir.rglob('*') if f.suffix in tile_codecs.TILE_EXTENSIONS)
+    
+    # Get output size
+    dzi_size = dzi_path.stat().st_size
+    tiles_size = sum(f.stat().st_size for f in tiles_dir.rglob('*') if f.is_file())
+    total_size = dzi_size + tiles_size
+    
+    print(f"\n✅ Conversion complete!")
+    print(f"\n📊 Results:")
+    print(f"   DZI file: {format_bytes(dzi_size)}")
+    print(f"   Tiles: {tile_count:,} files ({format_bytes(tiles_size)})")
+    print(f"   Total: {format_bytes(total_size)}")
+    print(f"   Ratio: {total_size/input_size:.1f}x original")
+    
+    print(f"\n📁 Output location:")
+    print(f"   {dzi_path}")
+    print(f"   {tiles_dir}/")
+    
+    print(f"\n🎯 Next steps:")
+    print(f"   1. Run: make gallery")
+    print(f"   2. Run: make view")
+    print(f"   3. Open: http://localhost:8000/")
+    
+    return True
+
+def _header_budget(dicom_path, max_memory, tile_size, overlap, bands=3):
+    """
+    Memory budget sized from the DICOM header alone
+
+    Only the header is read, so the budget is already watching when the
+    pixel data is loaded and decoded.
+    """
+    if not max_memory:
+        return nullcontext()
+    import pydicom
+    header = pydicom.dcmread(dicom_path, stop_before_pixels=True)
+    return memory_budget.budget_context(max_memory, int(header.Columns), bands,
+                                        tile_size, overlap)
+
+def convert_dicom_to_dzi(dicom_path, output_name=None, tile_size=256, quality=90, overlap=1,
+                         max_memory=None, raw=False, codec=tile_codecs.DEFAULT_CODEC):
     """
     Convert DICOM image to DZI format
     
@@ -200,7 +469,13 @@ def convert_dicom_to_dzi(dicom_path, output_name=None, tile_size=256, quality=90
         tile_size: Size of each tile (default 256)
         quality: JPEG quality 1-100 (default 90)
         overlap: Pixel overlap between tiles (default 1)
+        max_memory: Memory budget in bytes; sizes libvips and stops if exceeded
+        raw: Store full-bit-depth values for client-side windowing instead of
+            baking the first window into JPEG tiles
+        codec: Tile codec, see tile_codecs.CODECS (raw tiles are always PNG)
     """
+    import pyvips
+
     dicom_path = Path(dicom_path)
     
     # Validate input
@@ -238,87 +513,81 @@ def convert_dicom_to_dzi(dicom_path, output_name=None, tile_size=256, quality=90
     print(f"📁 DICOM file: {format_bytes(input_size)}")
     
     try:
-        # Read and convert DICOM
-        print(f"🏥 Reading DICOM file...")
-        image, dicom_dataset, total_frames = dicom_to_image(dicom_path)
-        
-        # Check if multi-frame
-        if image is None and total_frames > 1:
-            print(f"\n📹 Multi-frame DICOM detected: {total_frames} frames")
-            print(f"   Use --all-frames to convert all frames")
-            print(f"   Use --frame N to convert specific frame (0-{total_frames-1})")
-            return False
-        
-        # Extract metadata
-        metadata = extract_dicom_metadata(dicom_dataset)
-        
-        print(f"\n📊 DICOM Metadata:")
-        print(f"   Modality: {metadata['modality']}")
-        print(f"   Patient ID: {metadata['patient_id']}")
-        print(f"   Study Date: {metadata['study_date']}")
-        print(f"   Study: {metadata['study_description']}")
-        print(f"   Photometric: {metadata['photometric']}")
-        print(f"   Bit Depth: {metadata['bits_stored']} bits")
-        
-        # Image info
-        width, height = image.size
-        megapixels = (width * height) / 1_000_000
-        
-        print(f"\n📐 Image Dimensions: {width:,} × {height:,} pixels")
-        print(f"🖼️  Megapixels: {megapixels:.1f} MP")
-        print(f"🎨 Mode: {image.mode}")
-        
-        print(f"\n🔧 Tile size: {tile_size}×{tile_size}")
-        print(f"📊 Quality: {quality}")
-        print(f"🔗 Overlap: {overlap}px")
-        
-        # Save to temporary file
-        print(f"\n⚙️  Converting to DZI format...")
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            temp_path = tmp_file.name
-            image.save(temp_path, 'PNG')
-        
-        try:
-            # Convert to DZI using pyvips
-            vips_image = pyvips.Image.new_from_file(temp_path)
-            vips_image.dzsave(
-                str(dzi_path.with_suffix('')),
-                tile_size=tile_size,
-                overlap=overlap,
-                suffix='.jpg[Q={0}]'.format(quality),
-                depth='onepixel',
-                centre=False,
-                layout='dz'
-            )
-        finally:
-            # Clean up temp file
-            os.unlink(temp_path)
-        
-        # Count generated tiles
-        tile_count = sum(1 for _ in tiles_dir.rglob('*.jpg'))
-        
-        # Get output size
-        dzi_size = dzi_path.stat().st_size
-        tiles_size = sum(f.stat().st_size for f in tiles_dir.rglob('*') if f.is_file())
-        total_size = dzi_size + tiles_size
-        
-        print(f"\n✅ Conversion complete!")
-        print(f"\n📊 Results:")
-        print(f"   DZI file: {format_bytes(dzi_size)}")
-        print(f"   Tiles: {tile_count:,} files ({format_bytes(tiles_size)})")
-        print(f"   Total: {format_bytes(total_size)}")
-        print(f"   Ratio: {total_size/input_size:.1f}x original")
-        
-        print(f"\n📁 Output location:")
-        print(f"   {dzi_path}")
-        print(f"   {tiles_dir}/")
-        
-        print(f"\n🎯 Next steps:")
-        print(f"   1. Run: make gallery")
-        print(f"   2. Run: make view")
-        print(f"   3. Open: http://localhost:8000/")
-        
-        return True
+        with _header_budget(dicom_path, max_memory, tile_size, overlap):
+            # Read and convert DICOM
+            print(f"🏥 Reading DICOM file...")
+            image, dicom_dataset, total_frames = dicom_to_image(dicom_path)
+            
+            # Check if multi-frame
+            if image is None and total_frames > 1:
+                print(f"\n📹 Multi-frame DICOM detected: {total_frames} frames")
+                print(f"   Use --all-frames to convert all frames")
+                print(f"   Use --frame N to convert specific frame (0-{total_frames-1})")
+                return False
+            
+            # Extract metadata
+            metadata = extract_dicom_metadata(dicom_dataset)
+            
+            print(f"\n📊 DICOM Metadata:")
+            print(f"   Modality: {metadata['modality']}")
+            print(f"   Patient ID: {metadata['patient_id']}")
+            print(f"   Study Date: {metadata['study_date']}")
+            print(f"   Study: {metadata['study_description']}")
+            print(f"   Photometric: {metadata['photometric']}")
+            print(f"   Bit Depth: {metadata['bits_stored']} bits")
+            
+            # Image info
+            width, height = image.size
+            megapixels = (width * height) / 1_000_000
+            
+            print(f"\n📐 Image Dimensions: {width:,} × {height:,} pixels")
+            print(f"🖼️  Megapixels: {megapixels:.1f} MP")
+            print(f"🎨 Mode: {image.mode}")
+            
+            print(f"\n🔧 Tile size: {tile_size}×{tile_size}")
+            print(f"📊 Quality: {quality}")
+            print(f"🔗 Overlap: {overlap}px")
+            
+            if raw:
+                print(f"\n⚙️  Converting to raw {metadata['bits_stored']}-bit DZI tiles...")
+                encoding = raw_encoding(dicom_dataset)
+                value_range = save_raw_pyramid(dicom_dataset.pixel_array, encoding,
+                                               dzi_path.with_suffix(''), tile_size, overlap)
+                raw_file = output_dir / f"{base_name}_raw.json"
+                import json
+                with open(raw_file, 'w') as f:
+                    json.dump(dict(encoding, presets=window_presets(dicom_dataset, value_range)),
+                              f, indent=2)
+                return _report_output(dzi_path, tiles_dir, input_size)
+            
+            # Save to temporary file
+            print(f"\n⚙️  Converting to DZI format...")
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+                temp_path = tmp_file.name
+                image.save(temp_path, 'PNG')
+            
+            # The pixels already live in the PIL image; free the dataset's copy
+            del dicom_dataset
+            
+            try:
+                # Convert to DZI using pyvips
+                access = 'sequential' if max_memory else 'random'
+                vips_image = pyvips.Image.new_from_file(temp_path, access=access)
+                with memory_budget.remove_on_stop(temp_path, dzi_path, tiles_dir):
+                    vips_image.dzsave(
+                        str(dzi_path.with_suffix('')),
+                        tile_size=tile_size,
+                        overlap=overlap,
+                        suffix=tile_codecs.tile_suffix(codec, quality),
+                        depth='onepixel',
+                        centre=False,
+                        layout='dz'
+                    )
+            finally:
+                # Clean up temp file
+                os.unlink(temp_path)
+            
+            return _report_output(dzi_path, tiles_dir, input_size)
         
     except Exception as e:
         print(f"\n❌ Error during conversion: {e}")
@@ -326,7 +595,8 @@ def convert_dicom_to_dzi(dicom_path, output_name=None, tile_size=256, quality=90
         traceback.print_exc()
         return False
 
-def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, quality=90, overlap=1, frame_number=None):
+def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, quality=90, overlap=1, frame_number=None,
+                             max_memory=None, raw=False, codec=tile_codecs.DEFAULT_CODEC):
     """
     Convert multi-frame DICOM to DZI format
     
@@ -337,7 +607,12 @@ def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, qualit
         quality: JPEG quality
         overlap: Pixel overlap
         frame_number: Specific frame to convert (0-indexed), or None for all frames
+        max_memory: Memory budget in bytes; sizes libvips and stops if exceeded
+        raw: Store full-bit-depth values for client-side windowing
+        codec: Tile codec, see tile_codecs.CODECS (raw tiles are always PNG)
     """
+    import pyvips
+
     dicom_path = Path(dicom_path)
     
     if not dicom_path.exists():
@@ -361,70 +636,95 @@ def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, qualit
     print(f"📁 DICOM file: {format_bytes(input_size)}")
     
     try:
-        # First check total frames
-        print(f"🏥 Reading DICOM file...")
-        image, dicom_dataset, total_frames = dicom_to_image(dicom_path)
-        
-        if total_frames == 1:
-            print(f"⚠️  This is a single-frame DICOM. Use regular convert_dicom_to_dzi instead.")
-            return False
-        
-        print(f"📹 Total frames: {total_frames}")
-        
-        # Extract metadata once
-        metadata = extract_dicom_metadata(dicom_dataset)
-        print(f"   Modality: {metadata['modality']}")
-        print(f"   Patient ID: {metadata['patient_id']}")
-        print(f"   Study: {metadata['study_description']}")
-        
-        # Determine which frames to convert
-        if frame_number is not None:
-            frames_to_convert = [frame_number]
-            print(f"\n🎯 Converting frame {frame_number} of {total_frames}")
-        else:
-            frames_to_convert = list(range(total_frames))
-            print(f"\n🎯 Converting all {total_frames} frames...")
-        
-        converted_count = 0
-        failed_count = 0
-        
-        for frame_idx in frames_to_convert:
-            frame_name = f"{base_name}_frame_{frame_idx:04d}"
-            dzi_path = output_dir / f"{frame_name}.dzi"
-            tiles_dir = output_dir / f"{frame_name}_files"
+        with _header_budget(dicom_path, max_memory, tile_size, overlap):
+            # First check total frames
+            print(f"🏥 Reading DICOM file...")
+            image, dicom_dataset, total_frames = dicom_to_image(dicom_path)
             
-            # Check if already exists
-            if dzi_path.exists():
-                print(f"   ⏭️  Frame {frame_idx}: Already exists, skipping...")
-                continue
+            if total_frames == 1:
+                print(f"⚠️  This is a single-frame DICOM. Use regular convert_dicom_to_dzi instead.")
+                return False
             
-            try:
-                # Extract this frame
-                frame_image, _, _ = dicom_to_image(dicom_path, frame_index=frame_idx)
+            print(f"📹 Total frames: {total_frames}")
+            
+            # Extract metadata once
+            metadata = extract_dicom_metadata(dicom_dataset)
+            print(f"   Modality: {metadata['modality']}")
+            print(f"   Patient ID: {metadata['patient_id']}")
+            print(f"   Study: {metadata['study_description']}")
+            
+            # Determine which frames to convert
+            if frame_number is not None:
+                frames_to_convert = [frame_number]
+                print(f"\n🎯 Converting frame {frame_number} of {total_frames}")
+            else:
+                frames_to_convert = list(range(total_frames))
+                print(f"\n🎯 Converting all {total_frames} frames...")
+            
+            converted_count = 0
+            failed_count = 0
+            
+            if raw:
+                # One encoding for every frame so the viewer's window carries over
+                encoding = raw_encoding(dicom_dataset)
+                all_frames = dicom_dataset.pixel_array
+                value_range = None
+            
+            # Tiles identical across frames are stored once in a shared pool
+            pool = tile_dedup.pool_dir(output_dir, base_name)
+            
+            for frame_idx in frames_to_convert:
+                frame_name = f"{base_name}_frame_{frame_idx:04d}"
+                dzi_path = output_dir / f"{frame_name}.dzi"
+                tiles_dir = output_dir / f"{frame_name}_files"
                 
-                # Convert to temporary PNG
-                temp_png = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                frame_image.save(temp_png.name)
+                # Check if already exists
+                if dzi_path.exists():
+                    print(f"   ⏭️  Frame {frame_idx}: Already exists, skipping...")
+                    continue
                 
-                # Convert PNG to DZI
-                vips_image = pyvips.Image.new_from_file(temp_png.name)
-                vips_image.dzsave(
-                    str(dzi_path.with_suffix('')),
-                    tile_size=tile_size,
-                    overlap=overlap,
-                    suffix=f'.jpg[Q={quality}]'
-                )
+                try:
+                    tile_dedup.discard_tree(tiles_dir)
+                    if raw:
+                        low, high = save_raw_pyramid(all_frames[frame_idx], encoding,
+                                                     dzi_path.with_suffix(''), tile_size, overlap)
+                        value_range = (low, high) if value_range is None else \
+                            (min(low, value_range[0]), max(high, value_range[1]))
+                        tile_dedup.add_tree(pool, tiles_dir)
+                        converted_count += 1
+                        if converted_count % 10 == 0:
+                            print(f"   ✅ Converted {converted_count}/{len(frames_to_convert)} frames...")
+                        continue
+                    
+                    # Extract this frame
+                    frame_image, _, _ = dicom_to_image(dicom_path, frame_index=frame_idx)
                 
-                # Clean up temp file
-                os.unlink(temp_png.name)
+                    # Convert to temporary PNG
+                    temp_png = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+                    frame_image.save(temp_png.name)
                 
-                converted_count += 1
-                if converted_count % 10 == 0:
-                    print(f"   ✅ Converted {converted_count}/{len(frames_to_convert)} frames...")
+                    # Convert PNG to DZI
+                    access = 'sequential' if max_memory else 'random'
+                    vips_image = pyvips.Image.new_from_file(temp_png.name, access=access)
+                    with memory_budget.remove_on_stop(temp_png.name, dzi_path, tiles_dir):
+                        vips_image.dzsave(
+                            str(dzi_path.with_suffix('')),
+                            tile_size=tile_size,
+                            overlap=overlap,
+                            suffix=tile_codecs.tile_suffix(codec, quality)
+                        )
                 
-            except Exception as e:
-                print(f"   ❌ Frame {frame_idx} failed: {e}")
-                failed_count += 1
+                    # Clean up temp file
+                    os.unlink(temp_png.name)
+                    tile_dedup.add_tree(pool, tiles_dir)
+                
+                    converted_count += 1
+                    if converted_count % 10 == 0:
+                        print(f"   ✅ Converted {converted_count}/{len(frames_to_convert)} frames...")
+                
+                except Exception as e:
+                    print(f"   ❌ Frame {frame_idx} failed: {e}")
+                    failed_count += 1
         
         print(f"\n✅ Multi-frame conversion complete!")
         print(f"   Converted: {converted_count} frames")
@@ -442,8 +742,14 @@ def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, qualit
             "tile_size": tile_size,
             "quality": quality
         }
+        if raw:
+            series_data["raw"] = dict(encoding, presets=window_presets(dicom_dataset, value_range))
+        tile_dedup.prune_pool(pool)
+        series_data["dedup"] = tile_dedup.series_summary(output_dir, base_name, total_frames)
+        print(f"   Dedup: {tile_dedup.describe(series_data['dedup'])}")
         with open(series_file, 'w') as f:
             json.dump(series_data, f, indent=2)
+        cine_proxy.add_to_series(series_file)
         
         print(f"\n📁 Output location:")
         print(f"   {output_dir}/{base_name}_frame_*.dzi")
@@ -462,6 +768,473 @@ def convert_dicom_multiframe(dicom_path, output_name=None, tile_size=256, qualit
         return False
 
 
+def convert_dicom_windows(dicom_path, output_name=None, tile_size=256, quality=90, overlap=1,
+                          windows='dataset', frame_number=None, all_frames=False,
+                          max_memory=None, codec=tile_codecs.DEFAULT_CODEC):
+    """
+    Convert a DICOM file to one pyramid per window preset in a single pass
+    
+    Each frame is decoded and rescaled once and then fanned out to N
+    windowing lookups and N tiling pipelines, producing <base>_<preset>
+    pyramids (or <base>_<preset>_frame_NNNN series) side by side.
+    
+    Args:
+        dicom_path: Path to a single- or multi-frame DICOM file
+        output_name: Base name for output files
+        tile_size: Size of each tile
+        quality: JPEG quality
+        overlap: Pixel overlap
+        windows: Preset spec, see resolve_windows
+        frame_number: Specific frame of a multi-frame file
+        all_frames: Convert every frame of a multi-frame file
+        max_memory: Memory budget in bytes; sizes libvips and stops if exceeded
+        codec: Tile codec, see tile_codecs.CODECS
+    """
+    import json
+    import time
+    import pydicom
+    
+    dicom_path = Path(dicom_path)
+    if not dicom_path.exists():
+        print(f"❌ Error: File not found: {dicom_path}")
+        return False
+    
+    base_name = output_name or dicom_path.stem
+    output_dir = Path('../output/dzi')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    print(f"\n{'='*60}")
+    print(f"Converting DICOM window presets: {dicom_path.name}")
+    print(f"{'='*60}\n")
+    
+    try:
+        start_time = time.time()
+        print(f"🏥 Reading DICOM file...")
+        ds = pydicom.dcmread(dicom_path, stop_before_pixels=True)
+        encoding = raw_encoding(ds)
+        presets = resolve_windows(windows, ds)
+        luts = [window_lut(encoding, center, width) for _, center, width in presets]
+        metadata = extract_dicom_metadata(ds)
+        
+        print(f"🪟 {len(presets)} window presets:")
+        for name, center, width in presets:
+            print(f"   {base_name}_{name}: center {center:g}, width {width:g}")
+        
+        budget = memory_budget.budget_context(max_memory, metadata['columns'], len(presets),
+                                              tile_size, overlap)
+        with budget:
+            pixel_array = pydicom.dcmread(dicom_path).pixel_array
+            total_frames = int(getattr(ds, 'NumberOfFrames', 1) or 1)
+            multiframe = total_frames > 1
+            if multiframe and frame_number is None and not all_frames:
+                print(f"\n📹 Multi-frame DICOM detected: {total_frames} frames")
+                print(f"   Use --all-frames to convert all frames")
+                print(f"   Use --frame N to convert specific frame (0-{total_frames-1})")
+                return False
+            if frame_number is not None and not 0 <= frame_number < total_frames:
+                raise ValueError(f"Frame index {frame_number} out of range (0-{total_frames-1})")
+            frames = [frame_number] if frame_number is not None else list(range(total_frames))
+            print(f"📐 {metadata['columns']:,} × {metadata['rows']:,}, {len(frames)} frame(s)")
+            
+            converted_count = 0
+            for frame_idx in frames:
+                if multiframe:
+                    base_paths = [output_dir / f"{base_name}_{name}_frame_{frame_idx:04d}"
+                                  for name, _, _ in presets]
+                    frame_pixels = pixel_array[frame_idx]
+                else:
+                    base_paths = [output_dir / f"{base_name}_{name}" for name, _, _ in presets]
+                    frame_pixels = pixel_array
+                if all(path.with_suffix('.dzi').exists() for path in base_paths) and multiframe:
+                    continue
+                tiles_dirs = [path.with_name(f"{path.name}_files") for path in base_paths]
+                for tiles_dir in tiles_dirs:
+                    tile_dedup.discard_tree(tiles_dir)
+                save_window_pyramids(frame_pixels, encoding, luts, base_paths,
+                                     tile_size, quality, overlap, codec)
+                if multiframe:
+                    for (name, _, _), tiles_dir in zip(presets, tiles_dirs):
+                        tile_dedup.add_tree(
+                            tile_dedup.pool_dir(output_dir, f"{base_name}_{name}"), tiles_dir)
+                converted_count += 1
+                if multiframe and converted_count % 10 == 0:
+                    print(f"   ✅ Converted {converted_count}/{len(frames)} frames...")
+        
+        if multiframe:
+            for name, center, width in presets:
+                tile_dedup.prune_pool(tile_dedup.pool_dir(output_dir, f"{base_name}_{name}"))
+                series_file = output_dir / f"{base_name}_{name}_series.json"
+                with open(series_file, 'w') as f:
+                    json.dump({
+                        "base_name": f"{base_name}_{name}",
+                        "total_frames": total_frames,
+                        "converted_frames": len(frames),
+                        "metadata": metadata,
+                        "tile_size": tile_size,
+                        "quality": quality,
+                        "window": {"name": name, "center": center, "width": width},
+                        "dedup": tile_dedup.series_summary(output_dir, f"{base_name}_{name}",
+                                                           total_frames)
+                    }, f, indent=2)
+                cine_proxy.add_to_series(series_file)
+        
+        elapsed = time.time() - start_time
+        print(f"\n✅ Rendered {len(presets)} presets × {len(frames)} frame(s) in {elapsed:.1f}s "
+              f"(one decode per frame)")
+        print(f"\n📁 Output location:")
+        for name, _, _ in presets:
+            suffix = '_frame_*.dzi' if multiframe else '.dzi'
+            print(f"   {output_dir}/{base_name}_{name}{suffix}")
+        print(f"\n🎯 Next steps:")
+        print(f"   1. Run: make gallery")
+        print(f"   2. Run: make view")
+        return True
+    
+    except Exception as e:
+        print(f"\n❌ Error during conversion: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def slice_position(ds):
+    """
+    Position of a slice along its normal (ImagePositionPatient projected
+    onto the cross product of the ImageOrientationPatient cosines), or None
+    """
+    import numpy as np
+
+    position = getattr(ds, 'ImagePositionPatient', None)
+    orientation = getattr(ds, 'ImageOrientationPatient', None)
+    if position is None or orientation is None or len(orientation) != 6:
+        return None
+    row = np.array([float(v) for v in orientation[:3]])
+    col = np.array([float(v) for v in orientation[3:]])
+    normal = np.cross(row, col)
+    return float(np.dot(normal, [float(v) for v in position]))
+
+def slice_sort_key(position, instance_number, name):
+    """
+    Order slices along the acquisition axis
+
+    Prefers the projected slice position (robust to oblique stacks and to
+    InstanceNumber gaps), then InstanceNumber, then the filename.
+    """
+    if position is not None:
+        return (0, position, name)
+    if instance_number is not None:
+        return (1, int(instance_number), name)
+    return (2, 0, name)
+
+def _slice_sort_key(ds, path):
+    return slice_sort_key(slice_position(ds), getattr(ds, 'InstanceNumber', None), path.name)
+
+def scan_dicom_series(directory):
+    """
+    Group the DICOM files under a directory by SeriesInstanceUID
+
+    Only headers are read (stop_before_pixels), so scanning hundreds of
+    slices costs a fraction of decoding them. Non-DICOM files are skipped.
+
+    Returns:
+        dict mapping SeriesInstanceUID to (header dataset, [paths]) with
+        the paths sorted along the acquisition axis
+    """
+    import pydicom
+
+    groups = {}
+    for path in sorted(Path(directory).rglob('*')):
+        if not path.is_file():
+            continue
+        try:
+            ds = pydicom.dcmread(path, stop_before_pixels=True)
+        except Exception:
+            continue
+        if 'Rows' not in ds:
+            continue  # Structured reports, presentation states, etc.
+        uid = str(getattr(ds, 'SeriesInstanceUID', 'unknown'))
+        groups.setdefault(uid, []).append((_slice_sort_key(ds, path), path, ds))
+
+    series = {}
+    for uid, entries in groups.items():
+        entries.sort(key=lambda entry: entry[0])
+        series[uid] = (entries[0][2], [path for _, path, _ in entries])
+    return series
+
+def _init_series_worker(budget, width, bands, tile_size, overlap):
+    """Size libvips in a series worker to its share of the memory budget"""
+    if budget:
+        memory_budget.configure_vips(budget, width, bands, tile_size, overlap)
+
+def _convert_series_slice(job):
+    """
+    Decode one slice and tile it (runs in a worker process)
+    
+    Returns:
+        (slice_path, value range) - the range only for raw tiles
+    """
+    budget = job[-1]
+    # The worker's share of --max-memory covers the decode as well
+    with memory_budget.enforce(budget, report=False) if budget else nullcontext():
+        return _tile_series_slice(*job[:-1])
+
+def _tile_series_slice(slice_path, base_path, tile_size, quality, overlap, encoding, presets,
+                       codec):
+    """Decode and tile one slice for _convert_series_slice"""
+    import pydicom
+    import pyvips
+
+    if presets:
+        # base_path is one output path per window preset
+        ds = pydicom.dcmread(slice_path)
+        luts = [window_lut(encoding, center, width) for _, center, width in presets]
+        save_window_pyramids(ds.pixel_array, encoding, luts, base_path, tile_size, quality,
+                             overlap, codec)
+        return slice_path, None
+    if encoding is not None:
+        ds = pydicom.dcmread(slice_path)
+        return slice_path, save_raw_pyramid(ds.pixel_array, encoding, base_path,
+                                            tile_size, overlap)
+    image, _, _ = dicom_to_image(slice_path)
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+        temp_path = tmp_file.name
+    try:
+        image.save(temp_path, 'PNG')
+        vips_image = pyvips.Image.new_from_file(temp_path, access='sequential')
+        with memory_budget.remove_on_stop(temp_path, f"{base_path}.dzi", f"{base_path}_files"):
+            vips_image.dzsave(
+                base_path,
+                tile_size=tile_size,
+                overlap=overlap,
+                suffix=tile_codecs.tile_suffix(codec, quality),
+                depth='onepixel',
+                centre=False,
+                layout='dz'
+            )
+    finally:
+        os.unlink(temp_path)
+    return slice_path, None
+
+def convert_dicom_series(directory, output_name=None, tile_size=256, quality=90, overlap=1,
+                         series_uid=None, workers=None, catalog=None, raw=False, windows=None,
+                         max_memory=None, codec=tile_codecs.DEFAULT_CODEC):
+    """
+    Convert a directory of single-frame DICOM slices to frame pyramids
+
+    Each series becomes <base>_frame_NNNN.dzi pyramids plus <base>_series.json,
+    the same layout convert_dicom_multiframe writes, so the multi-frame viewer
+    and gallery pick it up unchanged. Slices are decoded and tiled in parallel.
+    
+    Args:
+        directory: Directory containing the DICOM files (searched recursively)
+        output_name: Base name for output files (default: directory name)
+        tile_size: Size of each tile
+        quality: JPEG quality
+        overlap: Pixel overlap
+        series_uid: Convert only this SeriesInstanceUID (default: all series)
+        workers: Worker processes (default: CPU count)
+        catalog: dicom_catalog database to plan from instead of scanning headers
+        raw: Store full-bit-depth values for client-side windowing
+        windows: Window preset spec (see resolve_windows); renders one
+            <base>_<preset> series per preset from a single decode per slice
+        max_memory: Memory budget in bytes for the whole conversion; split
+            between the worker processes, each stopping if it exceeds its share
+        codec: Tile codec, see tile_codecs.CODECS (raw tiles are always PNG)
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    import json
+    import multiprocessing
+    import time
+    import pydicom
+    
+    directory = Path(directory).resolve()
+    if not directory.is_dir():
+        print(f"❌ Error: Directory not found: {directory}")
+        return False
+    
+    output_dir = Path('../output/dzi')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    print(f"\n{'='*60}")
+    print(f"Converting DICOM Series Directory: {directory.name}")
+    print(f"{'='*60}\n")
+    
+    start_time = time.time()
+    if catalog and os.path.exists(catalog):
+        import dicom_catalog
+        print(f"🗂️  Planning from catalog {catalog}...")
+        series = {}
+        for uid, rows in dicom_catalog.series_in_directory(directory, catalog).items():
+            paths = [Path(row['path']) for row in rows]
+            series[uid] = (pydicom.dcmread(paths[0], stop_before_pixels=True), paths)
+    else:
+        print(f"🔍 Scanning headers...")
+        series = scan_dicom_series(directory)
+    file_count = sum(len(paths) for _, paths in series.values())
+    print(f"   Found {file_count} image files in {len(series)} series "
+          f"({time.time() - start_time:.1f}s)")
+    
+    if series_uid is not None:
+        if series_uid not in series:
+            print(f"❌ Error: Series {series_uid} not found")
+            return False
+        series = {series_uid: series[series_uid]}
+    if not series:
+        print(f"❌ Error: No DICOM images found in {directory}")
+        return False
+    
+    default_base = output_name or directory.name
+    workers = workers or os.cpu_count() or 1
+    all_ok = True
+    used_names = set()
+    
+    for index, (uid, (header, paths)) in enumerate(sorted(series.items(),
+            key=lambda item: int(getattr(item[1][0], 'SeriesNumber', 0) or 0))):
+        base_name = default_base
+        if len(series) > 1:
+            base_name = f"{default_base}_s{getattr(header, 'SeriesNumber', index) or index}"
+            if base_name in used_names:
+                base_name = f"{base_name}_{index}"
+        used_names.add(base_name)
+        
+        metadata = extract_dicom_metadata(header)
+        print(f"\n📹 Series {base_name}: {len(paths)} slices")
+        print(f"   Modality: {metadata['modality']}")
+        print(f"   Study: {metadata['study_description']}")
+        
+        # Slices share the first slice's encoding so one window fits all
+        encoding = raw_encoding(header) if raw or windows else None
+        try:
+            presets = resolve_windows(windows, header) if windows else None
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            return False
+        if presets:
+            print(f"   Window presets: {', '.join(name for name, _, _ in presets)}")
+        
+        pool_workers, share = workers, None
+        if max_memory:
+            # Each worker process holds its own share; run fewer workers
+            # rather than give each too little to stream a slice
+            bands = len(presets) if presets else 3
+            floor = memory_budget.BASELINE_BYTES + memory_budget.pyramid_buffer_bytes(
+                int(header.Columns), bands, tile_size, overlap)
+            available = max(1, max_memory - (memory_budget.current_rss() or 0))
+            pool_workers = max(1, min(workers, available // floor))
+            share = available // pool_workers
+            print(f"   🧠 Memory budget: {format_bytes(max_memory)} "
+                  f"({pool_workers} workers, {format_bytes(share)} each)")
+            if floor > share:
+                print(f"   ⚠️  Each slice needs about {format_bytes(floor)} to stream; "
+                      f"the conversion will likely be stopped")
+        value_range = None
+        jobs = []
+        for frame_idx, slice_path in enumerate(paths):
+            if presets:
+                outputs = [output_dir / f"{base_name}_{name}_frame_{frame_idx:04d}"
+                           for name, _, _ in presets]
+                if all(path.with_suffix('.dzi').exists() for path in outputs):
+                    continue
+                jobs.append((slice_path, outputs, tile_size, quality, overlap, encoding, presets,
+                             codec, share))
+                continue
+            frame_name = f"{base_name}_frame_{frame_idx:04d}"
+            if (output_dir / f"{frame_name}.dzi").exists():
+                continue
+            jobs.append((slice_path, str(output_dir / frame_name), tile_size, quality, overlap,
+                         encoding, None, codec, share))
+        for job in jobs:
+            for output in (job[1] if job[6] else [job[1]]):
+                tile_dedup.discard_tree(f"{output}_files")
+        skipped = len(paths) - len(jobs)
+        if skipped:
+            print(f"   ⏭️  {skipped} frames already exist, skipping...")
+        
+        converted_count = skipped
+        failed_count = 0
+        unfinished = []
+        # Spawned, not forked: main() has already run libvips (the codec
+        # probe), and forked children deadlock in its thread pool
+        with ProcessPoolExecutor(max_workers=pool_workers,
+                                 initializer=_init_series_worker,
+                                 initargs=(share, int(header.Columns),
+                                           len(presets) if presets else 3, tile_size, overlap),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_convert_series_slice, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    _, slice_range = future.result()
+                    # Pool tiles here, in one process, as each slice lands
+                    if presets:
+                        for (name, _, _), output in zip(presets, job[1]):
+                            tile_dedup.add_tree(
+                                tile_dedup.pool_dir(output_dir, f"{base_name}_{name}"),
+                                f"{output}_files")
+                    else:
+                        tile_dedup.add_tree(tile_dedup.pool_dir(output_dir, base_name),
+                                            f"{job[1]}_files")
+                    if slice_range is not None:
+                        value_range = slice_range if value_range is None else \
+                            (min(slice_range[0], value_range[0]), max(slice_range[1], value_range[1]))
+                    converted_count += 1
+                    if converted_count % 10 == 0:
+                        print(f"   ✅ Converted {converted_count}/{len(paths)} frames...")
+                except BrokenProcessPool:
+                    unfinished.append(job)
+                except Exception as e:
+                    print(f"   ❌ {job[0].name} failed: {e}")
+                    failed_count += 1
+        
+        if unfinished:
+            # A worker died (the budget stops one with status 3) and the pool
+            # killed the rest mid-slice; drop their partial trees
+            for job in unfinished:
+                for output in (job[1] if job[6] else [job[1]]):
+                    tile_dedup.discard_tree(f"{output}_files")
+                    Path(f"{output}.dzi").unlink(missing_ok=True)
+            print(f"   ❌ A worker process died; removed {len(unfinished)} unfinished slices")
+            if max_memory:
+                sys.exit(3)
+            failed_count += len(unfinished)
+        
+        if failed_count:
+            all_ok = False
+            print(f"   Failed: {failed_count} frames")
+        
+        for name, center, width in presets or [(None, None, None)]:
+            series_name = f"{base_name}_{name}" if name else base_name
+            series_file = output_dir / f"{series_name}_series.json"
+            series_data = {
+                "base_name": series_name,
+                "total_frames": len(paths),
+                "converted_frames": converted_count,
+                "metadata": metadata,
+                "tile_size": tile_size,
+                "quality": quality,
+                "series_instance_uid": uid,
+                "source_files": [str(path.relative_to(directory)) for path in paths]
+            }
+            if raw:
+                series_data["raw"] = dict(encoding, presets=window_presets(header, value_range))
+            if name:
+                series_data["window"] = {"name": name, "center": center, "width": width}
+            tile_dedup.prune_pool(tile_dedup.pool_dir(output_dir, series_name))
+            series_data["dedup"] = tile_dedup.series_summary(output_dir, series_name, len(paths))
+            print(f"   Dedup: {tile_dedup.describe(series_data['dedup'])}")
+            with open(series_file, 'w') as f:
+                json.dump(series_data, f, indent=2)
+            cine_proxy.add_to_series(series_file)
+            print(f"   {series_file}")
+    
+    print(f"\n✅ Series conversion complete in {time.time() - start_time:.1f}s "
+          f"({workers} workers)")
+    print(f"\n🎯 Next steps:")
+    print(f"   1. Run: make gallery")
+    print(f"   2. Open multi-frame viewer for {default_base}")
+    return all_ok
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Convert DICOM images to Deep Zoom Image (DZI) format',
@@ -476,22 +1249,55 @@ Examples:
   python3 convert_dicom_to_dzi.py angiogram.dcm study --all-frames
   python3 convert_dicom_to_dzi.py cine.dcm cardiac --frame 50
   
-Supported: Single-frame 2D and multi-frame DICOM files
+  # Directory of single-frame slices (grouped by SeriesInstanceUID)
+  python3 convert_dicom_to_dzi.py ct_study_dir/ chest_ct
+  python3 convert_dicom_to_dzi.py ct_study_dir/ chest_ct --workers 8
+  
+  # Full bit depth for windowing in the viewer (lossless PNG tiles)
+  python3 convert_dicom_to_dzi.py ct_slice.dcm chest --raw
+  
+  # Whole-slide microscopy (VL WSI): frames pass straight through as tiles
+  python3 convert_dicom_to_dzi.py slide_dir/ biopsy_42
+  
+  # Several baked window presets from one decode (<name>_<preset> pyramids)
+  python3 convert_dicom_to_dzi.py ct_study_dir/ chest --windows dataset,lung,bone
+  python3 convert_dicom_to_dzi.py ct_slice.dcm chest --windows soft=40/400,lung
+  
+  # WebP tiles for low-bandwidth reading rooms
+  python3 convert_dicom_to_dzi.py ct_study_dir/ chest_ct --codec webp --quality 80
+  
+Supported: Single-frame 2D and multi-frame DICOM files, series directories and whole slides
         """
     )
     
-    parser.add_argument('input', help='Input DICOM file path (.dcm)')
+    parser.add_argument('input', help='Input DICOM file path (.dcm) or directory of slices')
     parser.add_argument('output_name', nargs='?', help='Optional output name (default: input filename)')
     parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
                        help='Tile size in pixels (default: 256)')
     parser.add_argument('--quality', type=int, default=90,
-                       help='JPEG quality 1-100 (default: 90)')
+                       help='Tile quality 1-100 (default: 90)')
+    parser.add_argument('--codec', default=tile_codecs.DEFAULT_CODEC, choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
     parser.add_argument('--overlap', type=int, default=1,
                        help='Pixel overlap between tiles (default: 1)')
     parser.add_argument('--all-frames', action='store_true',
                        help='Convert all frames of multi-frame DICOM')
     parser.add_argument('--frame', type=int, metavar='N',
                        help='Convert specific frame number (0-indexed) from multi-frame DICOM')
+    parser.add_argument('--max-memory', type=memory_budget.parse_size, metavar='SIZE',
+                       help='Memory budget, e.g. 1G; streams input and stops if exceeded')
+    parser.add_argument('--series-uid', metavar='UID',
+                       help='With a directory input, convert only this SeriesInstanceUID')
+    parser.add_argument('--workers', type=int, metavar='N',
+                       help='Parallel slice workers for directory input (default: CPU count)')
+    parser.add_argument('--catalog', metavar='DB',
+                       help='Plan directory input from a dicom_catalog.py database')
+    parser.add_argument('--raw', action='store_true',
+                       help='Keep full bit depth (lossless 16-bit PNG tiles) so the viewer can re-window')
+    parser.add_argument('--windows', metavar='SPEC',
+                       help='Render several window presets in one pass: comma-separated '
+                            '"dataset", site presets (' + ', '.join(SITE_WINDOWS) + ') '
+                            'or NAME=CENTER/WIDTH')
     
     args = parser.parse_args()
     
@@ -500,15 +1306,67 @@ Supported: Single-frame 2D and multi-frame DICOM files
         print("❌ Error: Quality must be between 1 and 100")
         sys.exit(1)
     
+    check_dependencies()
+    
+    if not tile_codecs.codec_available(args.codec):
+        print(f"❌ Error: This libvips build cannot encode {args.codec} tiles")
+        sys.exit(1)
+    
+    if args.raw and args.windows:
+        print("❌ Error: --raw and --windows are alternatives (raw tiles are windowed in the viewer)")
+        sys.exit(1)
+    
+    import dicom_wsi
+    
+    # Whole-slide microscopy is already tiled; map its frames directly
+    if dicom_wsi.is_wsi(args.input):
+        success = dicom_wsi.convert_wsi(
+            args.input,
+            args.output_name,
+            quality=args.quality
+        )
+    # A directory is a series of single-frame slices
+    elif os.path.isdir(args.input):
+        success = convert_dicom_series(
+            args.input,
+            args.output_name,
+            args.tile_size,
+            args.quality,
+            args.overlap,
+            series_uid=args.series_uid,
+            workers=args.workers,
+            catalog=args.catalog,
+            raw=args.raw,
+            windows=args.windows,
+            max_memory=args.max_memory,
+            codec=args.codec
+        )
+    # One decode feeding several window presets
+    elif args.windows:
+        success = convert_dicom_windows(
+            args.input,
+            args.output_name,
+            args.tile_size,
+            args.quality,
+            args.overlap,
+            windows=args.windows,
+            frame_number=args.frame,
+            all_frames=args.all_frames,
+            max_memory=args.max_memory,
+            codec=args.codec
+        )
     # Check if multi-frame options specified
-    if args.all_frames or args.frame is not None:
+    elif args.all_frames or args.frame is not None:
         success = convert_dicom_multiframe(
             args.input,
             args.output_name,
             args.tile_size,
             args.quality,
             args.overlap,
-            args.frame
+            args.frame,
+            max_memory=args.max_memory,
+            raw=args.raw,
+            codec=args.codec
         )
     else:
         # Regular single-frame conversion
@@ -517,10 +1375,13 @@ Supported: Single-frame 2D and multi-frame DICOM files
             args.output_name,
             args.tile_size,
             args.quality,
-            args.overlap
+            args.overlap,
+            max_memory=args.max_memory,
+            raw=args.raw,
+            codec=args.codec
         )
     
     sys.exit(0 if success else 1)
 
 if __name__ == '__main__':
-    main()
+    conversion_service.run_main('convert_dicom_to_dzi', main)
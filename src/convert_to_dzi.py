@@ -1,24 +1,37 @@
 #!/usr/bin/env python3
 """
 Convert any image format to Deep Zoom Image (DZI) tiles
-Supports: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF
+Supports: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF, and NPY/RAW arrays
 
 Usage:
     python3 convert_to_dzi.py input_image.jpg
     python3 convert_to_dzi.py input_image.jpg custom_name
     python3 convert_to_dzi.py input_image.jpg custom_name --tile-size 512 --quality 95
+    python3 convert_to_dzi.py huge_scan.tiff --progressive
+    python3 convert_to_dzi.py huge_scan.tiff --max-memory 2G
+    python3 convert_to_dzi.py slide_scan.tiff --sparse
+    python3 convert_to_dzi.py scan.tiff --codec webp --quality 80
+    python3 convert_to_dzi.py scan.tiff --compare-codecs
+    python3 convert_to_dzi.py huge_scan.tiff --plan
+    python3 convert_to_dzi.py scan.tiff --auto-tune --objective latency
+    python3 convert_to_dzi.py density.npy --window 0,3.5
 """
 
 import sys
 import os
 from pathlib import Path
 import argparse
-import pyvips
+
+import array_source
+import conversion_service
+import dzi_pyramid
+import memory_budget
+import tile_codecs
 
 # Supported image formats
 SUPPORTED_FORMATS = {
     '.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp', '.gif'
-}
+} | array_source.ARRAY_FORMATS
 
 def format_bytes(bytes_val):
     """Human-readable file size"""
@@ -28,7 +41,10 @@ def format_bytes(bytes_val):
         bytes_val /= 1024.0
     return f"{bytes_val:.1f} TB"
 
-def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, overlap=1):
+def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, overlap=1,
+                   progressive=False, overview_level=None, max_memory=None,
+                   sparse=False, sparse_tolerance=0, codec=tile_codecs.DEFAULT_CODEC,
+                   tuning=None, window=None, raw_dtype=None, raw_shape=None):
     """
     Convert image to DZI format
     
@@ -36,9 +52,20 @@ def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, over
         input_path: Path to input image
         output_name: Optional custom output name (without extension)
         tile_size: Size of each tile (default 256)
-        quality: JPEG quality 1-100 (default 90)
+        quality: Tile quality 1-100 (default 90)
         overlap: Pixel overlap between tiles (default 1)
+        progressive: Publish coarse levels first, then fill in the rest
+        overview_level: Deepest level of the early overview (default ~4096px)
+        max_memory: Memory budget in bytes; streams the input and sizes libvips to fit
+        sparse: Skip uniform tiles, listing them in <name>_sparse.json instead
+        sparse_tolerance: Per-channel deviation still counted as uniform
+        codec: Tile codec, see tile_codecs.CODECS
+        tuning: auto_tune.auto_tune() result to record in <name>_tuning.json
+        window: (low, high) values mapped to 0-255 for .npy/.raw arrays
+        raw_dtype, raw_shape: Layout of a .raw array (default: <file>.json)
     """
+    import pyvips
+
     input_path = Path(input_path)
     
     # Validate input
@@ -83,7 +110,16 @@ def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, over
     try:
         # Load image
         print(f"📂 Loading image...")
-        image = pyvips.Image.new_from_file(str(input_path))
+        # A budget forces top-to-bottom streaming instead of random access
+        access = 'sequential' if max_memory else 'random'
+        if input_path.suffix.lower() in array_source.ARRAY_FORMATS:
+            # Mapped rather than decoded; streamed top to bottom into dzsave
+            array = array_source.ArraySource(input_path, raw_dtype, raw_shape, window=window)
+            print(f"🧮 Array: {array.describe()}")
+            image = array.image()
+            access = 'sequential'
+        else:
+            image = pyvips.Image.new_from_file(str(input_path), access=access)
         
         width = image.width
         height = image.height
@@ -93,28 +129,31 @@ def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, over
         print(f"🖼️  Megapixels: {megapixels:.1f} MP")
         print(f"🎨 Channels: {image.bands} ({_get_format_name(image)})")
         print(f"\n🔧 Tile size: {tile_size}×{tile_size}")
+        print(f"🗜️  Codec: {codec}")
         print(f"📊 Quality: {quality}")
         print(f"🔗 Overlap: {overlap}px")
         
-        # Calculate expected tiles
-        import math
-        levels = math.ceil(math.log2(max(width, height))) + 1
+        # Exact pyramid geometry (dzsave halves with round-up down to 1×1)
+        levels = dzi_pyramid.max_level(width, height) + 1
         print(f"📚 Zoom levels: {levels}")
+        print(f"🧩 Tiles: {dzi_pyramid.count_tiles(width, height, tile_size):,}")
         
         # Convert to DZI
         print(f"\n⚙️  Converting to DZI format...")
-        image.dzsave(
-            str(dzi_path.with_suffix('')),  # pyvips adds .dzi
-            tile_size=tile_size,
-            overlap=overlap,
-            suffix='.jpg[Q={0}]'.format(quality),
-            depth='onepixel',
-            centre=False,
-            layout='dz'
-        )
+        budget = memory_budget.budget_context(max_memory, width, image.bands, tile_size, overlap)
+        with budget:
+            sparse_stats = _save_pyramid(image, input_path, dzi_path, tile_size, quality,
+                                         overlap, progressive, overview_level, access,
+                                         sparse, sparse_tolerance, codec)
+        if tuning:
+            import auto_tune
+            auto_tune.write_tuning(dzi_path.with_suffix(''), tuning)
+        else:
+            # Settings chosen by hand; an earlier tuning record no longer applies
+            dzi_pyramid.tuning_path(dzi_path.with_suffix('')).unlink(missing_ok=True)
         
         # Count generated tiles
-        tile_count = sum(1 for _ in tiles_dir.rglob('*.jpg'))
+        tile_count = sum(1 for f in tiles_dir.rglob('*') if f.suffix in tile_codecs.TILE_EXTENSIONS)
         
         # Get output size
         dzi_size = dzi_path.stat().st_size
@@ -125,6 +164,9 @@ def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, over
         print(f"\n📊 Results:")
         print(f"   DZI file: {format_bytes(dzi_size)}")
         print(f"   Tiles: {tile_count:,} files ({format_bytes(tiles_size)})")
+        if sparse_stats:
+            print(f"   Uniform tiles skipped: {sparse_stats['skipped']:,} of "
+                  f"{sparse_stats['tiles']:,} ({sparse_stats['fills']} fill colours)")
         print(f"   Total: {format_bytes(total_size)}")
         print(f"   Ratio: {total_size/input_size:.1f}x original")
         
@@ -143,6 +185,60 @@ def convert_to_dzi(input_path, output_name=None, tile_size=256, quality=90, over
         print(f"\n❌ Error during conversion: {e}")
         return False
 
+def _save_pyramid(image, input_path, dzi_path, tile_size, quality, overlap,
+                  progressive, overview_level, access, sparse=False, sparse_tolerance=0,
+                  codec=tile_codecs.DEFAULT_CODEC):
+    """
+    Write the tile pyramid, overview-first when progressive
+
+    Returns:
+        build_sparse stats when sparse, otherwise None
+    """
+    suffix = tile_codecs.tile_suffix(codec, quality)
+    if sparse:
+        return dzi_pyramid.build_sparse(
+            input_path,
+            dzi_path.with_suffix(''),
+            tile_size=tile_size,
+            overlap=overlap,
+            suffix=suffix,
+            tolerance=sparse_tolerance
+        )
+    # A full pyramid supersedes any index left by an earlier sparse build
+    dzi_pyramid.sparse_index_path(dzi_path.with_suffix('')).unlink(missing_ok=True)
+    if progressive:
+        dzi_pyramid.build_progressive(
+            input_path,
+            dzi_path.with_suffix(''),
+            tile_size=tile_size,
+            overlap=overlap,
+            suffix=suffix,
+            overview_level=overview_level,
+            on_overview=_announce_overview,
+            access=access
+        )
+    else:
+        with memory_budget.remove_on_stop(dzi_path, dzi_path.with_name(f"{dzi_path.stem}_files")):
+            image.dzsave(
+                str(dzi_path.with_suffix('')),  # pyvips adds .dzi
+                tile_size=tile_size,
+                overlap=overlap,
+                suffix=suffix,
+                depth='onepixel',
+                centre=False,
+                layout='dz'
+            )
+
+def _announce_overview(overview_level, top_level):
+    """Publish the gallery as soon as the overview levels are on disk"""
+    print(f"👀 Overview ready (levels 0-{overview_level} of {top_level}) - viewable now")
+    print(f"   Filling in deeper levels...")
+    try:
+        import generate_index
+        generate_index.generate_index_html()
+    except Exception as e:
+        print(f"   ⚠️  Gallery update skipped: {e}")
+
 def _get_format_name(image):
     """Get human-readable format name"""
     bands = image.bands
@@ -166,8 +262,17 @@ Examples:
   python3 convert_to_dzi.py photo.jpg
   python3 convert_to_dzi.py scan.tiff medical_scan
   python3 convert_to_dzi.py image.bmp --tile-size 512 --quality 95
+  python3 convert_to_dzi.py huge_scan.tiff --progressive --overview-level 11
+  python3 convert_to_dzi.py slide_scan.tiff --sparse --sparse-tolerance 2
+  python3 convert_to_dzi.py scan.tiff --codec avif --quality 60
+  python3 convert_to_dzi.py scan.tiff --compare-codecs
+  python3 convert_to_dzi.py huge_scan.tiff --plan --plan-json plan.json
+  python3 convert_to_dzi.py scan.tiff --auto-tune --quality-floor 40
+  python3 convert_to_dzi.py density.npy --window 0,3.5
+  python3 convert_to_dzi.py scan.raw --raw-dtype '>u2' --raw-shape 40000x50000
   
-Supported formats: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF
+Supported formats: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF, NPY, RAW
+  (RAW arrays take dtype/shape from --raw-dtype/--raw-shape or <file>.json)
         """
     )
     
@@ -176,9 +281,40 @@ Supported formats: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF
     parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
                        help='Tile size in pixels (default: 256)')
     parser.add_argument('--quality', type=int, default=90,
-                       help='JPEG quality 1-100 (default: 90)')
+                       help='Tile quality 1-100 (default: 90)')
+    parser.add_argument('--codec', default=tile_codecs.DEFAULT_CODEC, choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
+    parser.add_argument('--compare-codecs', action='store_true',
+                       help='Report encode speed, tile size and PSNR of every codec on a '
+                            'sample region instead of converting')
+    parser.add_argument('--plan', action='store_true',
+                       help='Print exact tile counts and sampled size/time estimates instead of converting')
+    parser.add_argument('--plan-json', metavar='FILE',
+                       help="With --plan: also write the plan as JSON ('-' for stdout only)")
+    parser.add_argument('--auto-tune', action='store_true',
+                       help='Benchmark tile sizes and qualities on sample regions and convert '
+                            'with the best for --objective (overrides --tile-size/--quality)')
     parser.add_argument('--overlap', type=int, default=1,
                        help='Pixel overlap between tiles (default: 1)')
+    parser.add_argument('--progressive', action='store_true',
+                       help='Write the .dzi and coarse levels first so the image is viewable early')
+    parser.add_argument('--overview-level', type=int, metavar='N',
+                       help='Deepest level written in the first pass (default: 12, about 4096px)')
+    parser.add_argument('--max-memory', type=memory_budget.parse_size, metavar='SIZE',
+                       help='Memory budget, e.g. 2G; streams input and stops if exceeded')
+    parser.add_argument('--sparse', action='store_true',
+                       help='Skip uniform tiles and list their fill colours in <name>_sparse.json')
+    parser.add_argument('--sparse-tolerance', type=int, default=0, metavar='N',
+                       help='Per-channel deviation still counted as uniform (default: 0)')
+    arrays = parser.add_argument_group('array inputs (.npy, .raw)')
+    arrays.add_argument('--window', type=array_source.parse_window, metavar='LOW,HIGH',
+                        help='Values mapped to black and white (default: the array\'s min/max)')
+    arrays.add_argument('--raw-dtype', metavar='DTYPE',
+                        help="Element type of a .raw file, e.g. float32, uint16, '>u2'")
+    arrays.add_argument('--raw-shape', type=array_source.parse_shape, metavar='HxW[xB]',
+                        help='Height, width and optional bands of a .raw file')
+    import auto_tune
+    auto_tune.add_arguments(parser.add_argument_group('auto-tune objective'))
     
     args = parser.parse_args()
     
@@ -187,16 +323,80 @@ Supported formats: PNG, JPG, JPEG, BMP, TIFF, TIF, WEBP, GIF
         print("❌ Error: Quality must be between 1 and 100")
         sys.exit(1)
     
+    is_array = Path(args.input).suffix.lower() in array_source.ARRAY_FORMATS
+    if is_array and (args.compare_codecs or args.auto_tune or args.plan or args.plan_json
+                     or args.progressive or args.sparse):
+        print("❌ Error: Array inputs convert in one streaming pass; --compare-codecs, "
+              "--auto-tune, --plan, --progressive and --sparse need an image file")
+        sys.exit(1)
+    if not is_array and (args.window or args.raw_dtype or args.raw_shape):
+        print("❌ Error: --window, --raw-dtype and --raw-shape apply to .npy/.raw inputs")
+        sys.exit(1)
+    
+    if args.compare_codecs:
+        if not Path(args.input).exists():
+            print(f"❌ Error: File not found: {args.input}")
+            sys.exit(1)
+        print(f"🧪 Comparing codecs on {Path(args.input).name} (quality {args.quality})")
+        tile_codecs.print_report(tile_codecs.compare_codecs(args.input, args.tile_size,
+                                                            args.quality))
+        sys.exit(0)
+    
+    tuning = None
+    if args.auto_tune:
+        if not Path(args.input).exists():
+            print(f"❌ Error: File not found: {args.input}")
+            sys.exit(1)
+        if not tile_codecs.codec_available(args.codec):
+            print(f"❌ Error: This libvips build cannot encode {args.codec} tiles")
+            sys.exit(1)
+        print(f"🧪 Tuning tile size and quality on {Path(args.input).name}...")
+        tuning = auto_tune.auto_tune(args.input, args.codec, args.objective, args.quality_floor,
+                                     args.viewport, args.rtt_ms, args.bandwidth_mbps)
+        auto_tune.print_tuning(tuning)
+        args.tile_size, args.quality = tuning['tile_size'], tuning['quality']
+    
+    if args.plan or args.plan_json:
+        import capacity_plan
+        if not Path(args.input).exists():
+            print(f"❌ Error: File not found: {args.input}")
+            sys.exit(1)
+        plan = capacity_plan.plan_file(args.input, args.tile_size, args.overlap, args.codec,
+                                       args.quality, verbose=args.plan_json != '-')
+        if args.plan_json != '-':
+            capacity_plan.print_plan(plan)
+        if args.plan_json:
+            capacity_plan.write_plan_json(plan, args.plan_json)
+        sys.exit(0)
+    
+    if not tile_codecs.codec_available(args.codec):
+        print(f"❌ Error: This libvips build cannot encode {args.codec} tiles")
+        sys.exit(1)
+    
+    if args.sparse and args.progressive:
+        print("❌ Error: --sparse cannot be combined with --progressive")
+        sys.exit(1)
+    
     # Convert
     success = convert_to_dzi(
         args.input,
         args.output_name,
         args.tile_size,
         args.quality,
-        args.overlap
+        args.overlap,
+        args.progressive,
+        args.overview_level,
+        args.max_memory,
+        args.sparse,
+        args.sparse_tolerance,
+        args.codec,
+        tuning,
+        args.window,
+        args.raw_dtype,
+        args.raw_shape
     )
     
     sys.exit(0 if success else 1)
 
 if __name__ == '__main__':
-    main()
+    conversion_service.run_main('convert_to_dzi', main)
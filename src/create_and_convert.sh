@@ -17,6 +17,58 @@ HEIGHT=${2:-40000}
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 OUTPUT_NAME=${3:-"image_${WIDTH}x${HEIGHT}_${TIMESTAMP}"}
 
+# PROGRESSIVE=1 publishes coarse levels first so the image is viewable early
+# CHECKPOINT=1 builds in resumable shards; RESUME=1 continues an interrupted
+# build (pass the same OUTPUT_NAME and the existing source image is reused)
+CONVERT_OPTS=""
+if [ -n "$RESUME" ]; then
+    CONVERT_OPTS="--resume"
+elif [ -n "$CHECKPOINT" ]; then
+    CONVERT_OPTS="--checkpoint"
+elif [ -n "$PROGRESSIVE" ]; then
+    CONVERT_OPTS="--progressive"
+    if [ -n "$OVERVIEW_LEVEL" ]; then
+        CONVERT_OPTS="--overview-level=${OVERVIEW_LEVEL}"
+    fi
+fi
+
+# SPARSE=1 skips uniform tiles and lists them in <name>_sparse.json
+if [ -n "$SPARSE" ]; then
+    CONVERT_OPTS="$CONVERT_OPTS --sparse"
+fi
+
+# CODEC=webp|avif|jxl|png picks the tile codec (default: jpeg)
+if [ -n "$CODEC" ]; then
+    CONVERT_OPTS="$CONVERT_OPTS --codec=${CODEC}"
+fi
+
+# AUTO_TUNE=1 picks tile size and quality from a sampled benchmark
+# (OBJECTIVE=bytes|latency); the choice is recorded in <name>_tuning.json
+if [ -n "$AUTO_TUNE" ]; then
+    CONVERT_OPTS="$CONVERT_OPTS --objective=${OBJECTIVE:-bytes}"
+fi
+
+# MAX_MEMORY=2G bounds the conversion's memory (cache, threads, streaming)
+if [ -n "$MAX_MEMORY" ]; then
+    CONVERT_OPTS="$CONVERT_OPTS --max-memory=${MAX_MEMORY}"
+fi
+
+# PLAN=1 only prints exact tile counts and sampled size/time estimates: a
+# small sample is generated and encoded in place of the full image
+if [ -n "$PLAN" ]; then
+    SAMPLE_SIDE=4096
+    SAMPLE_W=$(( WIDTH < SAMPLE_SIDE ? WIDTH : SAMPLE_SIDE ))
+    SAMPLE_H=$(( HEIGHT < SAMPLE_SIDE ? HEIGHT : SAMPLE_SIDE ))
+    SAMPLE_IMAGE=$(mktemp -d)/plan_sample.png
+    echo "Planning a ${WIDTH}x${HEIGHT} conversion from a ${SAMPLE_W}x${SAMPLE_H} sample..."
+    $PYTHON sample_creator.py $SAMPLE_W $SAMPLE_H "$SAMPLE_IMAGE" > /dev/null &&
+        $PYTHON capacity_plan.py --size "${WIDTH}x${HEIGHT}" --like "$SAMPLE_IMAGE" \
+            --codec "${CODEC:-jpeg}"
+    STATUS=$?
+    rm -rf "$(dirname "$SAMPLE_IMAGE")"
+    exit $STATUS
+fi
+
 # Ensure dzi directory exists
 mkdir -p ../output/dzi
 
@@ -29,7 +81,11 @@ echo ""
 
 # Generate the test image with timestamped name
 SOURCE_IMAGE="../output/dzi/${OUTPUT_NAME}.png"
-$PYTHON sample_creator.py $WIDTH $HEIGHT "$SOURCE_IMAGE"
+if [ -n "$RESUME" ] && [ -f "$SOURCE_IMAGE" ]; then
+    echo "Reusing existing source image for resume"
+else
+    $PYTHON sample_creator.py $WIDTH $HEIGHT "$SOURCE_IMAGE"
+fi
 
 if [ $? -eq 0 ]; then
     echo ""
@@ -38,7 +94,7 @@ if [ $? -eq 0 ]; then
     echo ""
     
     # Convert to DZI (output will be in dzi/ directory)
-    $PYTHON png_to_dzi.py "$SOURCE_IMAGE" "../output/dzi/${OUTPUT_NAME}"
+    $PYTHON png_to_dzi.py "$SOURCE_IMAGE" "../output/dzi/${OUTPUT_NAME}" $CONVERT_OPTS
     
     if [ $? -eq 0 ]; then
         echo ""
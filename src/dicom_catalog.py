@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Header-only DICOM metadata catalog (SQLite)
+
+Scans an input tree once, reading DICOM headers only (stop_before_pixels),
+and stores the fields conversion planning, deduplication and the gallery
+need - modality, study, dimensions, UIDs, frame counts and the file offset
+of the pixel data - so they can be queried without re-reading files.
+Rebuilds are incremental: files whose size and mtime are unchanged are
+skipped.
+
+Usage:
+    python3 dicom_catalog.py build /data/dicom
+    python3 dicom_catalog.py query --modality CT
+    python3 dicom_catalog.py series
+    python3 dicom_catalog.py duplicates
+"""
+
+import sys
+import os
+import sqlite3
+import time
+from pathlib import Path
+import argparse
+
+DEFAULT_CATALOG = '../output/dicom_catalog.sqlite'
+
+# (column, SQL type) - the first group mirrors extract_dicom_metadata
+COLUMNS = [
+    ('patient_id', 'TEXT'),
+    ('patient_name', 'TEXT'),
+    ('study_date', 'TEXT'),
+    ('study_description', 'TEXT'),
+    ('modality', 'TEXT'),
+    ('rows', 'INTEGER'),
+    ('columns', 'INTEGER'),
+    ('bits_stored', 'INTEGER'),
+    ('photometric', 'TEXT'),
+    ('sop_instance_uid', 'TEXT'),
+    ('study_instance_uid', 'TEXT'),
+    ('series_instance_uid', 'TEXT'),
+    ('series_number', 'INTEGER'),
+    ('series_description', 'TEXT'),
+    ('instance_number', 'INTEGER'),
+    ('number_of_frames', 'INTEGER'),
+    ('slice_position', 'REAL'),
+    ('transfer_syntax', 'TEXT'),
+    ('pixel_data_offset', 'INTEGER'),
+]
+
+def open_catalog(db_path=DEFAULT_CATALOG):
+    """Open (creating if needed) the catalog database"""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    columns = ',\n    '.join(f"{name} {kind}" for name, kind in COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            {columns}
+        )""")
+    for column in ('series_instance_uid', 'study_instance_uid', 'sop_instance_uid', 'modality'):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{column} ON files({column})")
+    return conn
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def read_header_record(path):
+    """
+    Read one file's header into a catalog row
+
+    Returns:
+        dict of column values, or None if the file is not a DICOM image
+    """
+    import pydicom
+    from convert_dicom_to_dzi import extract_dicom_metadata, slice_position
+
+    try:
+        with open(path, 'rb') as f:
+            ds = pydicom.dcmread(f, stop_before_pixels=True)
+            # dcmread rewinds to the PixelData tag when it stops there
+            pixel_data_offset = f.tell() if f.tell() < os.fstat(f.fileno()).st_size else None
+    except Exception:
+        return None
+    if 'Rows' not in ds:
+        return None
+
+    record = extract_dicom_metadata(ds)
+    record = {key: (str(value) if key in ('patient_name', 'patient_id', 'study_date',
+                                           'study_description', 'modality', 'photometric')
+                    else _int_or_none(value))
+              for key, value in record.items()}
+    file_meta = getattr(ds, 'file_meta', None)
+    record.update({
+        'sop_instance_uid': str(getattr(ds, 'SOPInstanceUID', '')) or None,
+        'study_instance_uid': str(getattr(ds, 'StudyInstanceUID', '')) or None,
+        'series_instance_uid': str(getattr(ds, 'SeriesInstanceUID', '')) or None,
+        'series_number': _int_or_none(getattr(ds, 'SeriesNumber', None)),
+        'series_description': str(getattr(ds, 'SeriesDescription', '')),
+        'instance_number': _int_or_none(getattr(ds, 'InstanceNumber', None)),
+        'number_of_frames': _int_or_none(getattr(ds, 'NumberOfFrames', 1)) or 1,
+        'slice_position': slice_position(ds),
+        'transfer_syntax': str(getattr(file_meta, 'TransferSyntaxUID', '')) or None,
+        'pixel_data_offset': pixel_data_offset,
+    })
+    return record
+
+def _path_range(directory):
+    """
+    (low, high) bounds of the paths under a directory, for path >= ? AND path < ?
+
+    A range on the primary key rather than LIKE, whose _ and % wildcards
+    would also match sibling directories (ct_1 vs ctX1).
+    """
+    prefix = f"{directory}{os.sep}"
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+def _read_job(job):
+    path, size, mtime = job
+    return path, size, mtime, read_header_record(path)
+
+def build_catalog(root, db_path=DEFAULT_CATALOG, workers=None):
+    """
+    Scan a tree and bring the catalog up to date
+
+    Args:
+        root: Directory to scan recursively
+        db_path: Catalog database path
+        workers: Header-reading processes (default: CPU count)
+
+    Returns:
+        dict with scanned, updated, unchanged, skipped and removed counts
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    root = Path(root).resolve()
+    conn = open_catalog(db_path)
+    known = {row['path']: (row['size'], row['mtime'])
+             for row in conn.execute("SELECT path, size, mtime FROM files "
+                                     "WHERE path >= ? AND path < ?", _path_range(root))}
+
+    stats = {'scanned': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'removed': 0}
+    jobs = []
+    seen = set()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats['scanned'] += 1
+            seen.add(path)
+            if known.get(path) == (st.st_size, st.st_mtime):
+                stats['unchanged'] += 1
+                continue
+            jobs.append((path, st.st_size, st.st_mtime))
+
+    names = ['path', 'size', 'mtime'] + [name for name, _ in COLUMNS]
+    insert = (f"INSERT OR REPLACE INTO files ({', '.join(names)}) "
+              f"VALUES ({', '.join('?' for _ in names)})")
+
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for path, size, mtime, record in pool.map(_read_job, jobs, chunksize=64):
+            if record is None:
+                stats['skipped'] += 1
+                continue
+            batch.append([path, size, mtime] + [record.get(name) for name, _ in COLUMNS])
+            if len(batch) >= 1000:
+                conn.executemany(insert, batch)
+                conn.commit()
+                stats['updated'] += len(batch)
+                batch = []
+    if batch:
+        conn.executemany(insert, batch)
+        stats['updated'] += len(batch)
+
+    gone = [(path,) for path in known if path not in seen]
+    conn.executemany("DELETE FROM files WHERE path = ?", gone)
+    stats['removed'] = len(gone)
+    conn.commit()
+    conn.close()
+    return stats
+
+def series_in_directory(directory, db_path=DEFAULT_CATALOG):
+    """
+    Group cataloged files under a directory by series, slices in order
+
+    Returns:
+        dict mapping SeriesInstanceUID to a list of sqlite3.Row, sorted the
+        same way convert_dicom_to_dzi.scan_dicom_series sorts slices
+    """
+    from convert_dicom_to_dzi import slice_sort_key
+
+    directory = Path(directory).resolve()
+    conn = open_catalog(db_path)
+    rows = conn.execute("SELECT * FROM files WHERE path >= ? AND path < ?",
+                        _path_range(directory)).fetchall()
+    conn.close()
+    series = {}
+    for row in rows:
+        series.setdefault(row['series_instance_uid'] or 'unknown', []).append(row)
+    for entries in series.values():
+        entries.sort(key=lambda row: slice_sort_key(row['slice_position'], row['instance_number'],
+                                                    os.path.basename(row['path'])))
+    return series
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build and query a header-only DICOM metadata catalog',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 dicom_catalog.py build /data/dicom --workers 16
+  python3 dicom_catalog.py query --modality CT --study-date 20240115
+  python3 dicom_catalog.py series
+  python3 dicom_catalog.py duplicates
+        """
+    )
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG,
+                       help=f'Catalog database (default: {DEFAULT_CATALOG})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Scan a directory tree into the catalog')
+    build.add_argument('root', help='Directory to scan recursively')
+    build.add_argument('--workers', type=int, help='Header-reading processes (default: CPU count)')
+
+    query = commands.add_parser('query', help='List cataloged files')
+    query.add_argument('--modality')
+    query.add_argument('--study-date')
+    query.add_argument('--study-uid')
+    query.add_argument('--series-uid')
+    query.add_argument('--patient-id')
+
+    commands.add_parser('series', help='Summarise series (files, frames, dimensions)')
+    commands.add_parser('duplicates', help='List SOPInstanceUIDs stored in more than one file')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.isdir(args.root):
+            print(f"❌ Error: Directory not found: {args.root}")
+            sys.exit(1)
+        print(f"🔍 Cataloging {args.root}...")
+        start = time.time()
+        stats = build_catalog(args.root, args.catalog, args.workers)
+        elapsed = time.time() - start
+        print(f"\n✅ Catalog updated in {elapsed:.1f}s")
+        print(f"   Scanned: {stats['scanned']:,} files")
+        print(f"   Updated: {stats['updated']:,}")
+        print(f"   Unchanged: {stats['unchanged']:,}")
+        print(f"   Not DICOM images: {stats['skipped']:,}")
+        print(f"   Removed: {stats['removed']:,}")
+        print(f"   {os.path.abspath(args.catalog)}")
+        sys.exit(0)
+
+    if not os.path.exists(args.catalog):
+        print(f"❌ Error: Catalog not found: {args.catalog}")
+        print(f"   Build one with: python3 dicom_catalog.py build <directory>")
+        sys.exit(1)
+    conn = open_catalog(args.catalog)
+
+    if args.command == 'query':
+        filters = {
+            'modality': args.modality,
+            'study_date': args.study_date,
+            'study_instance_uid': args.study_uid,
+            'series_instance_uid': args.series_uid,
+            'patient_id': args.patient_id,
+        }
+        where = [f"{column} = ?" for column, value in filters.items() if value]
+        values = [value for value in filters.values() if value]
+        sql = "SELECT path, modality, rows, columns, number_of_frames FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        for row in conn.execute(sql + " ORDER BY path", values):
+            print(f"{row['modality'] or '?':<4} {row['columns']}×{row['rows']} "
+                  f"{row['number_of_frames']:>4}f  {row['path']}")
+    elif args.command == 'series':
+        for row in conn.execute("""
+                SELECT series_instance_uid, modality, study_description, series_description,
+                       COUNT(*) AS files, SUM(number_of_frames) AS frames,
+                       MAX(columns) AS columns, MAX(rows) AS rows
+                FROM files GROUP BY series_instance_uid ORDER BY study_description"""):
+            print(f"{row['modality'] or '?':<4} {row['files']:>5} files {row['frames']:>6} frames "
+                  f"{row['columns']}×{row['rows']}  {row['study_description']} / "
+                  f"{row['series_description']}  {row['series_instance_uid']}")
+    elif args.command == 'duplicates':
+        for row in conn.execute("""
+                SELECT sop_instance_uid, COUNT(*) AS copies, GROUP_CONCAT(path, '\n    ') AS paths
+                FROM files WHERE sop_instance_uid IS NOT NULL
+                GROUP BY sop_instance_uid HAVING copies > 1"""):
+            print(f"{row['sop_instance_uid']} ({row['copies']} copies)\n    {row['paths']}")
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Multi-planar (axial/coronal/sagittal) DZI series from a DICOM volume
+
+Decodes and windows a multi-frame DICOM file or a directory of slices once
+into a memory-mapped .npy volume on disk, then cuts coronal and sagittal
+slices out of it with strided views, reading the volume in blocks so memory
+stays bounded by the page cache rather than the volume size. Each plane is
+written as its own <base>_<plane> series that multiframe_viewer.html opens.
+
+Usage:
+    python3 dicom_volume.py ct_series_dir/ chest_ct
+    python3 dicom_volume.py multi.dcm study --planes coronal,sagittal
+"""
+
+import sys
+import os
+import json
+import time
+from pathlib import Path
+import argparse
+
+import numpy as np
+import pydicom
+import pyvips
+
+import cine_proxy
+import tile_dedup
+from convert_dicom_to_dzi import (dataset_window, extract_dicom_metadata, rescale_pixels,
+                                  scan_dicom_series, slice_position, window_to_uint8)
+
+PLANES = ('axial', 'coronal', 'sagittal')
+
+# Slices cut per pass over the volume for the strided planes
+BLOCK_SLICES = 64
+
+def _spacing(header, positions=None):
+    """
+    Physical spacing in mm
+
+    Returns:
+        (slice_spacing, row_spacing, col_spacing) tuple
+    """
+    pixel_spacing = getattr(header, 'PixelSpacing', None) or [1.0, 1.0]
+    row_spacing, col_spacing = float(pixel_spacing[0]), float(pixel_spacing[1])
+    slice_spacing = None
+    if positions and len(positions) > 1 and None not in positions:
+        steps = np.abs(np.diff(positions))
+        steps = steps[steps > 0]
+        if steps.size:
+            slice_spacing = float(np.median(steps))
+    if slice_spacing is None:
+        for attribute in ('SpacingBetweenSlices', 'SliceThickness'):
+            value = getattr(header, attribute, None)
+            if value:
+                slice_spacing = float(value)
+                break
+    return slice_spacing or col_spacing, row_spacing, col_spacing
+
+def open_frame_source(input_path, series_uid=None):
+    """
+    Describe the frames of a multi-frame file or a directory of slices
+
+    Returns:
+        (header, frame_count, frames, spacing, paths) where frames() yields
+        (dataset, raw_pixel_array) one frame at a time in acquisition order
+        and paths lists the files read
+    """
+    input_path = Path(input_path)
+    if input_path.is_dir():
+        series = scan_dicom_series(input_path)
+        if not series:
+            raise ValueError(f"No DICOM images found in {input_path}")
+        if series_uid is not None:
+            if series_uid not in series:
+                raise ValueError(f"Series {series_uid} not found")
+            header, paths = series[series_uid]
+        else:
+            # The largest series is almost always the one to reformat
+            header, paths = max(series.values(), key=lambda entry: len(entry[1]))
+        positions = [slice_position(pydicom.dcmread(path, stop_before_pixels=True))
+                     for path in paths]
+
+        def frames():
+            for path in paths:
+                ds = pydicom.dcmread(path)
+                yield ds, ds.pixel_array
+
+        return header, len(paths), frames, _spacing(header, positions), paths
+
+    header = pydicom.dcmread(input_path, stop_before_pixels=True)
+    frame_count = int(getattr(header, 'NumberOfFrames', 1) or 1)
+
+    def frames():
+        try:
+            from pydicom.pixels import iter_pixels
+        except ImportError:
+            # pydicom < 3 can only decode the whole pixel array at once
+            ds = pydicom.dcmread(input_path)
+            pixel_array = ds.pixel_array
+            for frame in (pixel_array if frame_count > 1 else [pixel_array]):
+                yield ds, frame
+            return
+        for frame in iter_pixels(str(input_path)):
+            yield header, frame
+
+    return header, frame_count, frames, _spacing(header), [input_path]
+
+def volume_key_path(volume_path):
+    """JSON sidecar recording what a cached volume was decoded from"""
+    return Path(volume_path).with_suffix('.json')
+
+def _source_key(header, paths, shape):
+    """Identity of a volume's inputs: series, files (size, mtime), shape and window"""
+    sources = []
+    for path in paths:
+        st = os.stat(path)
+        sources.append([str(Path(path).resolve()), st.st_size, st.st_mtime_ns])
+    window = dataset_window(header)
+    return {
+        'series_instance_uid': str(getattr(header, 'SeriesInstanceUID', '') or ''),
+        'sources': sources,
+        'shape': list(shape),
+        'window': [float(v) for v in window] if window else None,
+    }
+
+def build_volume(input_path, volume_path, series_uid=None):
+    """
+    Decode and window every frame once into a memory-mapped uint8 volume
+
+    All frames share one intensity mapping (the dataset window, or the
+    global min/max found in a first streaming pass) so reformatted planes
+    don't band.
+
+    A volume left by an earlier run is reused only if its sidecar (see
+    volume_key_path) matches the series, every input file's size and
+    mtime, and the window; anything else decodes again.
+
+    Returns:
+        (volume, header, spacing) with volume a read-only (Z, Y, X) memmap
+    """
+    header, frame_count, frames, spacing, paths = open_frame_source(input_path, series_uid)
+    rows, columns = int(header.Rows), int(header.Columns)
+    if int(getattr(header, 'SamplesPerPixel', 1) or 1) != 1:
+        raise ValueError("Multi-planar reformatting needs greyscale (single-sample) images")
+
+    volume_path = Path(volume_path)
+    key_path = volume_key_path(volume_path)
+    shape = (frame_count, rows, columns)
+    key = _source_key(header, paths, shape)
+    if volume_path.exists() and key_path.exists():
+        try:
+            cached = json.loads(key_path.read_text())
+        except ValueError:
+            cached = {}
+        if all(cached.get(name) == value for name, value in key.items()):
+            volume = np.load(volume_path, mmap_mode='r')
+            if volume.shape == shape and volume.dtype == np.uint8:
+                print(f"♻️  Reusing decoded volume {volume_path.name}")
+                return volume, header, spacing
+            del volume
+    # Without a matching key the cached volume belongs to other inputs
+    key_path.unlink(missing_ok=True)
+
+    value_range = dataset_window(header)
+    if value_range is None:
+        print(f"🔎 No window in dataset - finding global intensity range...")
+        low, high = np.inf, -np.inf
+        for ds, frame in frames():
+            frame = rescale_pixels(frame, ds)
+            low, high = min(low, float(np.min(frame))), max(high, float(np.max(frame)))
+        value_range = (low, high)
+
+    volume_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = volume_path.with_name(volume_path.stem + '.partial.npy')
+    volume = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+    for index, (ds, frame) in enumerate(frames()):
+        volume[index] = window_to_uint8(frame, ds, value_range)
+        if (index + 1) % 50 == 0:
+            print(f"   Decoded {index + 1}/{frame_count} frames...")
+    volume.flush()
+    del volume
+    os.replace(tmp_path, volume_path)
+    key['value_range'] = [float(v) for v in value_range]
+    tmp_key = key_path.with_name(key_path.name + '.tmp')
+    tmp_key.write_text(json.dumps(key, indent=2))
+    os.replace(tmp_key, key_path)
+    return np.load(volume_path, mmap_mode='r'), header, spacing
+
+def iter_plane(volume, plane, block=BLOCK_SLICES):
+    """
+    Yield the 2D slices of one plane, top of the image = last acquired slice
+
+    Coronal and sagittal slices are strided views; reading them in blocks
+    turns one pass over the volume into `block` slices instead of one.
+    """
+    depth, rows, columns = volume.shape
+    if plane == 'axial':
+        for z in range(depth):
+            yield np.asarray(volume[z])
+    elif plane == 'coronal':
+        for y0 in range(0, rows, block):
+            chunk = np.asarray(volume[::-1, y0:y0 + block, :])
+            for j in range(chunk.shape[1]):
+                yield np.ascontiguousarray(chunk[:, j, :])
+    elif plane == 'sagittal':
+        for x0 in range(0, columns, block):
+            chunk = np.asarray(volume[::-1, :, x0:x0 + block])
+            for j in range(chunk.shape[2]):
+                yield np.ascontiguousarray(chunk[:, :, j])
+    else:
+        raise ValueError(f"Unknown plane: {plane}")
+
+def plane_aspect(plane, spacing):
+    """Vertical stretch that makes a plane's pixels physically square"""
+    slice_spacing, row_spacing, col_spacing = spacing
+    if plane == 'axial':
+        return row_spacing / col_spacing
+    if plane == 'coronal':
+        return slice_spacing / col_spacing
+    return slice_spacing / row_spacing
+
+def write_plane(volume, plane, base_name, output_dir, spacing, metadata,
+                tile_size=256, quality=90, overlap=1):
+    """Tile every slice of one plane as <base>_<plane>_frame_NNNN pyramids"""
+    series_name = f"{base_name}_{plane}"
+    aspect = plane_aspect(plane, spacing)
+    slice_count = {'axial': volume.shape[0], 'coronal': volume.shape[1],
+                   'sagittal': volume.shape[2]}[plane]
+
+    print(f"\n🧭 {plane.capitalize()}: {slice_count} slices")
+    converted_count = 0
+    pool = tile_dedup.pool_dir(output_dir, series_name)
+    for index, pixels in enumerate(iter_plane(volume, plane)):
+        dzi_path = output_dir / f"{series_name}_frame_{index:04d}.dzi"
+        if dzi_path.exists():
+            converted_count += 1
+            continue
+        tiles_dir = output_dir / f"{series_name}_frame_{index:04d}_files"
+        tile_dedup.discard_tree(tiles_dir)
+        height, width = pixels.shape
+        image = pyvips.Image.new_from_memory(pixels.tobytes(), width, height, 1, 'uchar')
+        if abs(aspect - 1) > 0.01:
+            image = image.resize(1, vscale=aspect)
+        image.dzsave(
+            str(dzi_path.with_suffix('')),
+            tile_size=tile_size,
+            overlap=overlap,
+            suffix=f'.jpg[Q={quality}]',
+            depth='onepixel',
+            centre=False,
+            layout='dz'
+        )
+        tile_dedup.add_tree(pool, tiles_dir)
+        converted_count += 1
+        if converted_count % 50 == 0:
+            print(f"   ✅ Converted {converted_count}/{slice_count} slices...")
+    tile_dedup.prune_pool(pool)
+
+    series_data = {
+        "base_name": series_name,
+        "total_frames": slice_count,
+        "converted_frames": converted_count,
+        "metadata": metadata,
+        "tile_size": tile_size,
+        "quality": quality,
+        "plane": plane,
+        "spacing_mm": dict(zip(('slice', 'row', 'column'), spacing)),
+        "dedup": tile_dedup.series_summary(output_dir, series_name, slice_count),
+    }
+    series_file = output_dir / f"{series_name}_series.json"
+    with open(series_file, 'w') as f:
+        json.dump(series_data, f, indent=2)
+    cine_proxy.add_to_series(series_file)
+    print(f"   {series_file}")
+    return converted_count
+
+def convert_volume(input_path, output_name=None, planes=PLANES, tile_size=256, quality=90,
+                   overlap=1, series_uid=None):
+    """
+    Convert a DICOM volume to one multi-frame series per plane
+
+    Args:
+        input_path: Multi-frame DICOM file or directory of slices
+        output_name: Base name for output files (default: input name)
+        planes: Planes to write (axial, coronal, sagittal)
+        tile_size: Size of each tile
+        quality: JPEG quality
+        overlap: Pixel overlap
+        series_uid: For directory input, the series to use (default: largest)
+
+    Returns:
+        True if successful, False otherwise
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        print(f"❌ Error: Not found: {input_path}")
+        return False
+    base_name = output_name or input_path.stem
+
+    output_dir = Path('../output/dzi')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    volume_path = Path('../output/volumes') / f"{base_name}.npy"
+
+    print(f"\n{'='*60}")
+    print(f"Multi-Planar Conversion: {input_path.name}")
+    print(f"{'='*60}\n")
+
+    try:
+        start_time = time.time()
+        print(f"🏥 Decoding volume to {volume_path}...")
+        volume, header, spacing = build_volume(input_path, volume_path, series_uid)
+        depth, rows, columns = volume.shape
+        print(f"📦 Volume: {columns} × {rows} × {depth} "
+              f"(spacing {spacing[2]:.2f} × {spacing[1]:.2f} × {spacing[0]:.2f} mm)")
+
+        metadata = extract_dicom_metadata(header)
+        for plane in planes:
+            write_plane(volume, plane, base_name, output_dir, spacing, metadata,
+                        tile_size, quality, overlap)
+
+        print(f"\n✅ Multi-planar conversion complete in {time.time() - start_time:.1f}s")
+        print(f"\n🎯 Next steps:")
+        print(f"   1. Run: make gallery")
+        for plane in planes:
+            print(f"   2. Open: multiframe_viewer.html?series={base_name}_{plane}")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error during conversion: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a DICOM volume to axial/coronal/sagittal DZI series',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 dicom_volume.py ct_series_dir/ chest_ct
+  python3 dicom_volume.py multi.dcm study --planes coronal,sagittal
+        """
+    )
+
+    parser.add_argument('input', help='Multi-frame DICOM file or directory of slices')
+    parser.add_argument('output_name', nargs='?', help='Optional output name (default: input name)')
+    parser.add_argument('--planes', default=','.join(PLANES),
+                       help='Comma-separated planes to write (default: axial,coronal,sagittal)')
+    parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
+                       help='Tile size in pixels (default: 256)')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='JPEG quality 1-100 (default: 90)')
+    parser.add_argument('--overlap', type=int, default=1,
+                       help='Pixel overlap between tiles (default: 1)')
+    parser.add_argument('--series-uid', metavar='UID',
+                       help='For directory input, the series to use (default: largest)')
+
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print("❌ Error: Quality must be between 1 and 100")
+        sys.exit(1)
+
+    planes = [plane.strip() for plane in args.planes.split(',') if plane.strip()]
+    unknown = [plane for plane in planes if plane not in PLANES]
+    if unknown:
+        print(f"❌ Error: Unknown plane(s): {', '.join(unknown)}")
+        sys.exit(1)
+
+    success = convert_volume(args.input, args.output_name, planes, args.tile_size,
+                             args.quality, args.overlap, args.series_uid)
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+DICOM whole-slide microscopy (VL WSI) to DZI without assembling the slide
+
+Whole-slide images are stored pre-tiled: each resolution level is an
+instance whose frames are tiles of a TotalPixelMatrix, usually already
+JPEG-compressed. Levels whose size and tile size line up with a DZI level
+have their frames copied byte-for-byte into tiles; only partial edge tiles
+are decoded, cropped and re-encoded. Levels the slide does not contain are
+built one tile row at a time from the level above, so memory stays bounded
+by a strip rather than the gigapixel plane.
+
+Usage:
+    python3 dicom_wsi.py slide_dir/ biopsy_42
+    python3 dicom_wsi.py slide_dir/ biopsy_42 --quality 85
+"""
+
+import sys
+import os
+import math
+import shutil
+import time
+from pathlib import Path
+import argparse
+
+import pydicom
+import pydicom.encaps
+import pyvips
+
+import dzi_pyramid
+import memory_budget
+
+WSI_SOP_CLASS = '1.2.840.10008.5.1.4.1.1.77.1.6'
+
+# Encapsulated syntaxes libvips can decode, and the extension it sniffs them as
+FRAME_EXTENSIONS = {
+    '1.2.840.10008.1.2.4.50': 'jpg',   # JPEG Baseline
+    '1.2.840.10008.1.2.4.51': 'jpg',   # JPEG Extended
+    '1.2.840.10008.1.2.4.90': 'j2k',   # JPEG 2000 Lossless
+    '1.2.840.10008.1.2.4.91': 'j2k',   # JPEG 2000
+}
+
+# Frames browsers display correctly as-is: baseline JPEG in YCbCr or grey
+PASSTHROUGH_SYNTAX = '1.2.840.10008.1.2.4.50'
+PASSTHROUGH_PHOTOMETRIC = ('YBR_FULL_422', 'YBR_FULL', 'MONOCHROME2')
+
+def _dicom_files(input_path):
+    input_path = Path(input_path)
+    if input_path.is_file():
+        return [input_path]
+    return sorted(Path(dirpath) / name
+                  for dirpath, _, filenames in os.walk(input_path) for name in filenames)
+
+def is_wsi(input_path):
+    """True if the file (or the first DICOM file in a directory) is a VL WSI instance"""
+    for path in _dicom_files(input_path):
+        try:
+            ds = pydicom.dcmread(path, stop_before_pixels=True)
+        except Exception:
+            continue
+        return str(getattr(ds, 'SOPClassUID', '')) == WSI_SOP_CLASS
+    return False
+
+def _frame_positions(ds, tile_width, tile_height):
+    """
+    Map frame index to (col, row) in the level's tile grid
+
+    TILED_FULL frames run row-major across the first focal plane; sparse
+    levels give each frame's position in PerFrameFunctionalGroupsSequence.
+    Only the first focal plane and optical path are used.
+    """
+    across = math.ceil(int(ds.TotalPixelMatrixColumns) / tile_width)
+    down = math.ceil(int(ds.TotalPixelMatrixRows) / tile_height)
+    frames = int(getattr(ds, 'NumberOfFrames', 1) or 1)
+    per_frame = getattr(ds, 'PerFrameFunctionalGroupsSequence', None)
+    if getattr(ds, 'DimensionOrganizationType', '') == 'TILED_FULL' or not per_frame:
+        return {index: (index % across, index // across)
+                for index in range(min(frames, across * down))}
+
+    positions, seen = {}, set()
+    first_z = None
+    for index, item in enumerate(per_frame):
+        plane = item.PlanePositionSlideSequence[0]
+        z = getattr(plane, 'ZOffsetInSlideCoordinateSystem', None)
+        if first_z is None:
+            first_z = z
+        if z != first_z:
+            continue
+        position = ((int(plane.ColumnPositionInTotalImagePixelMatrix) - 1) // tile_width,
+                    (int(plane.RowPositionInTotalImagePixelMatrix) - 1) // tile_height)
+        if position not in seen:
+            seen.add(position)
+            positions[index] = position
+    return positions
+
+def read_wsi_level(path):
+    """
+    Read one instance's header into a level description
+
+    Returns:
+        dict with geometry, frame layout and pixel-data location, or None if
+        the file is not a pyramid level of a whole-slide image
+    """
+    try:
+        with open(path, 'rb') as f:
+            ds = pydicom.dcmread(f, stop_before_pixels=True)
+            # dcmread rewinds to the PixelData tag when it stops there
+            pixel_data_offset = f.tell()
+    except Exception:
+        return None
+    if str(getattr(ds, 'SOPClassUID', '')) != WSI_SOP_CLASS:
+        return None
+    image_type = [str(value).upper() for value in getattr(ds, 'ImageType', [])]
+    if 'LABEL' in image_type or 'OVERVIEW' in image_type:
+        return None
+
+    syntax = str(ds.file_meta.TransferSyntaxUID)
+    tile_width, tile_height = int(ds.Columns), int(ds.Rows)
+    samples = int(getattr(ds, 'SamplesPerPixel', 1) or 1)
+    return {
+        'path': Path(path),
+        'series_instance_uid': str(getattr(ds, 'SeriesInstanceUID', '')),
+        'width': int(ds.TotalPixelMatrixColumns),
+        'height': int(ds.TotalPixelMatrixRows),
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'bands': samples,
+        'frames': int(getattr(ds, 'NumberOfFrames', 1) or 1),
+        'positions': _frame_positions(ds, tile_width, tile_height),
+        'transfer_syntax': syntax,
+        'encapsulated': ds.file_meta.TransferSyntaxUID.is_encapsulated,
+        'photometric': str(getattr(ds, 'PhotometricInterpretation', '')),
+        'frame_bytes': tile_width * tile_height * samples * (int(ds.BitsAllocated) // 8),
+        'pixel_data_offset': pixel_data_offset,
+    }
+
+def find_wsi_levels(input_path):
+    """
+    Pyramid levels of the slide under input_path, largest first
+
+    Levels from other series than the largest one are ignored, as are
+    repeats of a size already seen (extra focal planes or optical paths
+    stored as separate instances).
+    """
+    levels = [level for level in map(read_wsi_level, _dicom_files(input_path)) if level]
+    if not levels:
+        return []
+    levels.sort(key=lambda level: level['width'] * level['height'], reverse=True)
+    series_uid = levels[0]['series_instance_uid']
+    unique = {}
+    for level in levels:
+        if level['series_instance_uid'] == series_uid:
+            unique.setdefault((level['width'], level['height']), level)
+    return list(unique.values())
+
+def iter_frames(level):
+    """Yield (frame index, frame bytes) in file order without reading the whole PixelData"""
+    with open(level['path'], 'rb') as f:
+        # Skip the PixelData element header: tag, then VR + reserved + length
+        # (explicit VR) or just the length (implicit VR)
+        f.seek(level['pixel_data_offset'] + 4)
+        f.seek(6 if f.read(2) in (b'OB', b'OW') else 2, os.SEEK_CUR)
+        if level['encapsulated']:
+            if hasattr(pydicom.encaps, 'generate_frames'):
+                frames = pydicom.encaps.generate_frames(f, number_of_frames=level['frames'])
+            else:
+                # pydicom < 3 only parses frames out of bytes, so the
+                # encapsulated value is read whole
+                frames = pydicom.encaps.generate_pixel_data_frame(f.read(), level['frames'])
+            for index, data in enumerate(frames):
+                # Fragments are padded to even length; copied tiles must end
+                # at the codestream's EOI marker or they read as truncated
+                if data.endswith(b'\xff\xd9\x00'):
+                    data = data[:-1]
+                yield index, data
+        else:
+            for index in range(level['frames']):
+                yield index, f.read(level['frame_bytes'])
+
+def decode_frame(level, data):
+    """Decode one frame's bytes to a pyvips image"""
+    if level['encapsulated']:
+        return pyvips.Image.new_from_buffer(data, '')
+    return pyvips.Image.new_from_memory(data, level['tile_width'], level['tile_height'],
+                                        level['bands'], 'uchar')
+
+def can_pass_through(level, tile_size):
+    """True if the level's frames can be served unchanged as DZI tiles"""
+    return (level['transfer_syntax'] == PASSTHROUGH_SYNTAX
+            and level['photometric'] in PASSTHROUGH_PHOTOMETRIC
+            and level['tile_width'] == level['tile_height'] == tile_size)
+
+def _blank_tile(width, height, bands):
+    """White tile for regions a sparse level does not cover"""
+    return (pyvips.Image.black(width, height, bands=bands) + 255).cast('uchar')
+
+def copy_level(level, level_dir, tile_size, quality, stats):
+    """
+    Write a DZI level straight from a matching slide level
+
+    Full-size frames are copied byte-for-byte. Right and bottom edge frames
+    are padded to the full tile size in DICOM but must be cropped in DZI,
+    so only those are decoded and re-encoded.
+    """
+    width, height = level['width'], level['height']
+    level_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f".jpg[Q={quality},strip=true]"
+    written = set()
+    for index, data in iter_frames(level):
+        position = level['positions'].get(index)
+        if position is None:
+            continue
+        col, row = position
+        x, y, tile_w, tile_h = dzi_pyramid.tile_bounds(col, row, tile_size, 0, width, height)
+        if tile_w <= 0 or tile_h <= 0:
+            continue
+        if (tile_w, tile_h) == (tile_size, tile_size):
+            (level_dir / f"{col}_{row}.jpg").write_bytes(data)
+            stats['copied'] += 1
+        else:
+            tile = decode_frame(level, data).crop(0, 0, tile_w, tile_h)
+            tile.write_to_file(str(level_dir / f"{col}_{row}{suffix}"))
+            stats['reencoded'] += 1
+        written.add(position)
+
+    # Sparse levels leave empty glass out
+    cols, rows = dzi_pyramid.tile_grid(width, height, tile_size)
+    for row in range(rows):
+        for col in range(cols):
+            if (col, row) not in written:
+                _, _, tile_w, tile_h = dzi_pyramid.tile_bounds(col, row, tile_size, 0, width, height)
+                _blank_tile(tile_w, tile_h, level['bands']).write_to_file(
+                    str(level_dir / f"{col}_{row}{suffix}"))
+                stats['blank'] += 1
+
+def spool_frames(level, spool_dir):
+    """
+    Write each frame to its own file, still compressed, for strip assembly
+
+    Returns:
+        dict mapping (col, row) to the spooled file
+    """
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    if level['encapsulated']:
+        extension = FRAME_EXTENSIONS.get(level['transfer_syntax'])
+        if extension is None:
+            raise ValueError(f"Transfer syntax {level['transfer_syntax']} cannot be decoded here")
+    spooled = {}
+    for index, data in iter_frames(level):
+        position = level['positions'].get(index)
+        if position is None:
+            continue
+        col, row = position
+        if level['encapsulated']:
+            path = spool_dir / f"{col}_{row}.{extension}"
+            path.write_bytes(data)
+        else:
+            path = spool_dir / f"{col}_{row}.v"
+            decode_frame(level, data).write_to_file(str(path))
+        spooled[position] = path
+    return spooled
+
+def _band_from_grid(tiles, cols, first_row, last_row, cell_width, cell_height, bands):
+    """Join one or more rows of a tile grid; missing cells are blank"""
+    images = []
+    for row in range(first_row, last_row + 1):
+        for col in range(cols):
+            path = tiles.get((col, row))
+            images.append(pyvips.Image.new_from_file(str(path)) if path
+                          else _blank_tile(cell_width, cell_height, bands))
+    return pyvips.Image.arrayjoin(images, across=cols)
+
+def write_level_by_rows(level_dir, width, height, tile_size, quality, band_source):
+    """
+    Write a DZI level one tile row at a time
+
+    Args:
+        band_source: Called with (y, band_height), returns an image of the
+            level's width covering those rows
+    """
+    level_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f".jpg[Q={quality},strip=true]"
+    cols, rows = dzi_pyramid.tile_grid(width, height, tile_size)
+    for row in range(rows):
+        y = row * tile_size
+        band_height = min(tile_size, height - y)
+        band = band_source(y, band_height).copy_memory()
+        for col in range(cols):
+            x = col * tile_size
+            tile = band.crop(x, 0, min(tile_size, width - x), band_height)
+            tile.write_to_file(str(level_dir / f"{col}_{row}{suffix}"))
+
+def _existing_tiles(level_dir):
+    tiles = {}
+    for path in level_dir.iterdir():
+        col, row = path.stem.split('_')
+        tiles[(int(col), int(row))] = path
+    return tiles
+
+def convert_wsi(input_path, output_name=None, tile_size=None, quality=90):
+    """
+    Convert a VL whole-slide image to a DZI pyramid
+
+    Args:
+        input_path: Directory of the slide's instances, or one instance
+        output_name: Base name for output files (default: input name)
+        tile_size: DZI tile size (default: the slide's frame size, so frames
+            pass straight through)
+        quality: JPEG quality for tiles that have to be re-encoded
+
+    Returns:
+        True if successful, False otherwise
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        print(f"❌ Error: Not found: {input_path}")
+        return False
+
+    base_name = output_name or input_path.stem
+    output_dir = Path('../output/dzi')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    dzi_path = output_dir / f"{base_name}.dzi"
+    tiles_dir = output_dir / f"{base_name}_files"
+    work_dir = output_dir / f".{base_name}_wsi"
+
+    print(f"\n{'='*60}")
+    print(f"Converting DICOM Whole-Slide Image: {input_path.name}")
+    print(f"Output: {base_name}.dzi")
+    print(f"{'='*60}\n")
+
+    try:
+        start_time = time.time()
+        print(f"🔬 Reading slide headers...")
+        levels = find_wsi_levels(input_path)
+        if not levels:
+            print(f"❌ Error: No VL Whole Slide Microscopy images found in {input_path}")
+            return False
+
+        base = levels[0]
+        width, height = base['width'], base['height']
+        if tile_size is None:
+            tile_size = base['tile_width'] if base['tile_width'] == base['tile_height'] else 256
+        print(f"📐 Slide: {width:,} × {height:,} pixels ({width * height / 1e9:.2f} gigapixels)")
+        print(f"   {len(levels)} stored levels, {base['tile_width']}×{base['tile_height']} frames")
+        for level in levels:
+            passes = '✓ pass-through' if can_pass_through(level, tile_size) else 'decode'
+            print(f"   {level['width']:>8,} × {level['height']:<8,} {level['frames']:>7,} frames  {passes}")
+        print(f"\n🔧 Tile size: {tile_size}×{tile_size}, overlap 0")
+
+        if work_dir.exists():
+            shutil.rmtree(work_dir)
+        work_tiles = work_dir / 'tiles'
+        by_size = {(level['width'], level['height']): level for level in levels}
+        stats = {'copied': 0, 'reencoded': 0, 'blank': 0, 'retiled': 0, 'generated_levels': 0}
+        top_level = dzi_pyramid.max_level(width, height)
+
+        for level in range(top_level, -1, -1):
+            level_width, level_height = dzi_pyramid.level_dimensions(width, height, level)
+            level_dir = work_tiles / str(level)
+            source = by_size.get((level_width, level_height))
+
+            if source is not None and can_pass_through(source, tile_size):
+                print(f"   Level {level}: copying scanner tiles")
+                copy_level(source, level_dir, tile_size, quality, stats)
+
+            elif level == top_level:
+                print(f"   Level {level}: re-tiling scanner frames")
+                spooled = spool_frames(base, work_dir / 'frames')
+                frame_cols = math.ceil(width / base['tile_width'])
+
+                def band_source(y, band_height):
+                    first = y // base['tile_height']
+                    last = (y + band_height - 1) // base['tile_height']
+                    band = _band_from_grid(spooled, frame_cols, first, last,
+                                           base['tile_width'], base['tile_height'], base['bands'])
+                    return band.crop(0, y - first * base['tile_height'], width, band_height)
+
+                write_level_by_rows(level_dir, level_width, level_height, tile_size,
+                                    quality, band_source)
+                cols, rows = dzi_pyramid.tile_grid(level_width, level_height, tile_size)
+                stats['retiled'] += cols * rows
+                shutil.rmtree(work_dir / 'frames', ignore_errors=True)
+
+            else:
+                # Halve the level above, two of its tile rows per output row
+                finer = _existing_tiles(work_tiles / str(level + 1))
+                finer_width, finer_height = dzi_pyramid.level_dimensions(width, height, level + 1)
+                finer_cols, _ = dzi_pyramid.tile_grid(finer_width, finer_height, tile_size)
+
+                def band_source(y, band_height):
+                    top = 2 * y
+                    bottom = min(2 * (y + band_height), finer_height)
+                    first, last = top // tile_size, (bottom - 1) // tile_size
+                    band = _band_from_grid(finer, finer_cols, first, last,
+                                           tile_size, tile_size, base['bands'])
+                    band = band.crop(0, top - first * tile_size, finer_width, bottom - top)
+                    band = band.shrink(2, 2)
+                    if (band.width, band.height) != (level_width, band_height):
+                        band = band.resize(level_width / band.width, vscale=band_height / band.height)
+                    return band
+
+                write_level_by_rows(level_dir, level_width, level_height, tile_size,
+                                    quality, band_source)
+                stats['generated_levels'] += 1
+
+        dzi_pyramid.replace_dir(work_tiles, tiles_dir)
+        dzi_pyramid.write_dzi(dzi_path, width, height, tile_size, 0, 'jpg')
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+        tiles_size = sum(f.stat().st_size for f in tiles_dir.rglob('*') if f.is_file())
+        total_tiles = dzi_pyramid.count_tiles(width, height, tile_size)
+        elapsed = time.time() - start_time
+        print(f"\n✅ Conversion complete in {elapsed:.1f}s")
+        print(f"   Tiles: {total_tiles:,} ({memory_budget.format_bytes(tiles_size)})")
+        print(f"   Copied unchanged: {stats['copied']:,}")
+        print(f"   Edge tiles re-encoded: {stats['reencoded']:,}")
+        if stats['retiled']:
+            print(f"   Re-tiled from decoded frames: {stats['retiled']:,}")
+        print(f"   Levels downsampled here: {stats['generated_levels']} of {top_level + 1}")
+        if stats['blank']:
+            print(f"   Blank (not scanned): {stats['blank']:,}")
+        print(f"\n📁 Output location:")
+        print(f"   {dzi_path}")
+        print(f"   {tiles_dir}/")
+        print(f"\n🎯 Next steps:")
+        print(f"   1. Run: make gallery")
+        print(f"   2. Run: make view")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error during conversion: {e}")
+        import traceback
+        traceback.print_exc()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert DICOM whole-slide microscopy images to DZI, passing tiles through',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 dicom_wsi.py slide_dir/ biopsy_42
+  python3 dicom_wsi.py slide_dir/ biopsy_42 --tile-size 256
+        """
+    )
+
+    parser.add_argument('input', help='Directory of the slide\'s DICOM instances (or one instance)')
+    parser.add_argument('output_name', nargs='?', help='Optional output name (default: input name)')
+    parser.add_argument('--tile-size', type=int, choices=[128, 256, 512, 1024],
+                       help='Tile size (default: the slide\'s frame size, which allows pass-through)')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='JPEG quality 1-100 for re-encoded tiles (default: 90)')
+
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print("❌ Error: Quality must be between 1 and 100")
+        sys.exit(1)
+
+    success = convert_wsi(args.input, args.output_name, args.tile_size, args.quality)
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+"""
+Deep Zoom pyramid geometry and build helpers shared by the converters
+
+Level numbering follows the DZI spec used by OpenSeadragon and by
+pyvips dzsave(layout='dz', depth='onepixel'): level 0 is 1×1 and the
+highest level is the full-resolution image.
+"""
+
+import json
+import math
+import os
+import shutil
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import memory_budget
+
+DZI_NAMESPACE = 'http://schemas.microsoft.com/deepzoom/2008'
+
+def max_level(width, height):
+    """Index of the full-resolution level for an image of this size"""
+    return math.ceil(math.log2(max(width, height, 1)))
+
+def level_dimensions(width, height, level):
+    """Pixel dimensions of a pyramid level (each level halves, rounding up)"""
+    scale = 2 ** (max_level(width, height) - level)
+    return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+def tile_grid(level_width, level_height, tile_size):
+    """Number of tile columns and rows needed to cover a level"""
+    return math.ceil(level_width / tile_size), math.ceil(level_height / tile_size)
+
+def tile_bounds(col, row, tile_size, overlap, level_width, level_height):
+    """
+    Pixel rectangle covered by one tile, including overlap
+
+    Returns:
+        (x, y, width, height) tuple in level coordinates
+    """
+    x0 = max(0, col * tile_size - overlap)
+    y0 = max(0, row * tile_size - overlap)
+    x1 = min(level_width, (col + 1) * tile_size + overlap)
+    y1 = min(level_height, (row + 1) * tile_size + overlap)
+    return x0, y0, x1 - x0, y1 - y0
+
+def level_region(x, y, width, height, level, top_level):
+    """
+    Scale a full-resolution rectangle down to a pyramid level
+
+    Rounds outward so every level pixel influenced by the rectangle is kept.
+
+    Returns:
+        (x, y, width, height) tuple in level coordinates
+    """
+    scale = 2 ** (top_level - level)
+    x0, y0 = x // scale, y // scale
+    x1, y1 = math.ceil((x + width) / scale), math.ceil((y + height) / scale)
+    return x0, y0, x1 - x0, y1 - y0
+
+def tiles_in_region(x, y, width, height, level_width, level_height, tile_size, overlap):
+    """
+    Tiles whose pixels (overlap included) intersect a rectangle of a level
+
+    Returns:
+        (col_range, row_range) tuple of range objects
+    """
+    cols, rows = tile_grid(level_width, level_height, tile_size)
+    if width <= 0 or height <= 0:
+        return range(0), range(0)
+    col_start = max(0, (x - overlap) // tile_size)
+    row_start = max(0, (y - overlap) // tile_size)
+    col_end = min(cols, math.ceil((x + width + overlap) / tile_size))
+    row_end = min(rows, math.ceil((y + height + overlap) / tile_size))
+    return range(col_start, col_end), range(row_start, row_end)
+
+def count_tiles(width, height, tile_size):
+    """Exact number of tiles in a full pyramid"""
+    total = 0
+    for level in range(max_level(width, height) + 1):
+        cols, rows = tile_grid(*level_dimensions(width, height, level), tile_size)
+        total += cols * rows
+    return total
+
+def read_dzi(dzi_path):
+    """
+    Parse a .dzi descriptor
+
+    Returns:
+        dict with width, height, tile_size, overlap and format keys
+    """
+    root = ET.parse(dzi_path).getroot()
+    namespace = {'dzi': DZI_NAMESPACE}
+    size = root.find('dzi:Size', namespace)
+    if size is None:
+        size = root.find('Size')
+    if size is None:
+        raise ValueError(f"No Size element in {dzi_path}")
+    return {
+        'width': int(size.get('Width')),
+        'height': int(size.get('Height')),
+        'tile_size': int(root.get('TileSize')),
+        'overlap': int(root.get('Overlap', 0)),
+        'format': root.get('Format', 'jpg'),
+    }
+
+def write_dzi(dzi_path, width, height, tile_size, overlap, tile_format='jpg'):
+    """Write a .dzi descriptor in the same layout pyvips produces"""
+    dzi_path = Path(dzi_path)
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<Image xmlns="{DZI_NAMESPACE}"\n'
+        f'  Format="{tile_format}"\n'
+        f'  Overlap="{overlap}"\n'
+        f'  TileSize="{tile_size}"\n'
+        '  >\n'
+        '  <Size \n'
+        f'    Height="{height}"\n'
+        f'    Width="{width}"\n'
+        '  />\n'
+        '</Image>\n'
+    )
+    # Write-then-rename so a viewer never sees a truncated descriptor
+    tmp_path = dzi_path.with_name(dzi_path.name + '.tmp')
+    tmp_path.write_text(xml)
+    os.replace(tmp_path, dzi_path)
+
+def tile_format_from_suffix(suffix):
+    """Map a dzsave suffix such as '.jpg[Q=90]' to the DZI Format attribute"""
+    return suffix.split('[', 1)[0].lstrip('.')
+
+def build_status_path(base_path):
+    """Sidecar JSON that tells viewers which levels exist during a build"""
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.name}_build.json")
+
+def write_build_status(base_path, available_level, top_level):
+    """Record the deepest level a viewer may request while a build runs"""
+    status_path = build_status_path(base_path)
+    tmp_path = status_path.with_name(status_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'available_level': available_level,
+            'max_level': top_level,
+            'complete': available_level >= top_level,
+        }, f, indent=2)
+    os.replace(tmp_path, status_path)
+
+def replace_dir(src, dst):
+    """Move a directory into place, swapping out any existing one"""
+    src, dst = Path(src), Path(dst)
+    if dst.exists():
+        trash = dst.with_name(dst.name + '.old')
+        if trash.exists():
+            shutil.rmtree(trash)
+        os.replace(dst, trash)
+        os.replace(src, dst)
+        shutil.rmtree(trash)
+    else:
+        os.replace(src, dst)
+
+def row_reader(image):
+    """
+    Read bands of rows of an 8-bit image, top to bottom, in one pipeline
+
+    Each crop(...).write_to_memory() of a sequential image is a new
+    pipeline, and the loader decodes ahead in chunks, so a band starting
+    above the line it reached fails with "out of order read"; any band
+    height that is not a multiple of the chunk does that. Fetches through
+    one pyvips.Region share the loader's position.
+
+    Returns:
+        read(y, height) returning a (height, width, bands) uint8 array; y
+        must not go back above the previous band's end
+    """
+    import numpy as np
+    import pyvips
+
+    region = pyvips.Region.new(image)
+
+    def read(y, height):
+        data = region.fetch(0, y, image.width, height)
+        return np.frombuffer(data, np.uint8).reshape(height, image.width, image.bands)
+
+    return read
+
+def default_overview_level(width, height, max_side=4096):
+    """Deepest level whose longer side fits within max_side pixels"""
+    return max(0, min(max_level(width, height), int(math.log2(max_side))))
+
+def build_progressive(input_path, base_path, tile_size=256, overlap=1,
+                      suffix='.jpg[Q=90]', overview_level=None,
+                      on_overview=None, access='sequential'):
+    """
+    Build a DZI pyramid overview-first
+
+    Levels 0..overview_level are rendered from a downsampled copy and
+    published together with the .dzi descriptor before the full-resolution
+    pass starts, so the image can be opened within seconds. The deeper
+    levels are then built in a hidden staging directory and moved into
+    place one level at a time, updating <base>_build.json so viewers only
+    request levels that exist and upsample their parents meanwhile.
+
+    Args:
+        input_path: Path to the source image
+        base_path: Output path without extension (pyvips adds .dzi)
+        tile_size: Size of each tile
+        overlap: Pixel overlap between tiles
+        suffix: dzsave tile suffix including save options
+        overview_level: Deepest level to publish first (default: ~4096px)
+        on_overview: Optional callback run once the overview is published
+        access: pyvips access mode for the full-resolution pass
+
+    Returns:
+        (overview_level, top_level) tuple
+    """
+    import pyvips
+
+    input_path = str(input_path)
+    base_path = Path(base_path)
+    dzi_path = base_path.with_name(base_path.name + '.dzi')
+    tiles_dir = base_path.with_name(base_path.name + '_files')
+    staging = base_path.with_name(f".{base_path.name}_building")
+
+    image = pyvips.Image.new_from_file(input_path, access=access)
+    width, height = image.width, image.height
+    top_level = max_level(width, height)
+    if overview_level is None:
+        overview_level = default_overview_level(width, height)
+    overview_level = max(0, min(overview_level, top_level))
+
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+
+    save_options = dict(tile_size=tile_size, overlap=overlap, suffix=suffix,
+                        depth='onepixel', centre=False, layout='dz')
+
+    with memory_budget.remove_on_stop(staging, tiles_dir, dzi_path, build_status_path(base_path)):
+        try:
+            # Pass 1: coarse levels from a shrink-on-load thumbnail. Its level
+            # geometry matches the full pyramid because both round up per level.
+            overview_width, overview_height = level_dimensions(width, height, overview_level)
+            overview = pyvips.Image.thumbnail(input_path, overview_width,
+                                              height=overview_height, size='force')
+            overview.dzsave(str(staging / 'overview'), **save_options)
+
+            if tiles_dir.exists():
+                shutil.rmtree(tiles_dir)
+            os.replace(staging / 'overview_files', tiles_dir)
+            write_build_status(base_path, overview_level, top_level)
+            write_dzi(dzi_path, width, height, tile_size, overlap,
+                      tile_format_from_suffix(suffix))
+            if on_overview:
+                on_overview(overview_level, top_level)
+
+            # Pass 2: the full pyramid, published level by level once encoded
+            if overview_level < top_level:
+                image.dzsave(str(staging / 'full'), **save_options)
+                full_dir = staging / 'full_files'
+                for level in range(overview_level + 1, top_level + 1):
+                    replace_dir(full_dir / str(level), tiles_dir / str(level))
+                    write_build_status(base_path, level, top_level)
+                # Swap in full-quality coarse levels rendered from the real source
+                for level in range(overview_level + 1):
+                    replace_dir(full_dir / str(level), tiles_dir / str(level))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    build_status_path(base_path).unlink(missing_ok=True)
+    return overview_level, top_level
+
+def checkpoint_path(base_path):
+    """Checkpoint JSON recording which shards of a resumable build are done"""
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.name}_checkpoint.json")
+
+def tuning_path(base_path):
+    """Sidecar JSON recording how --auto-tune chose the tile size and quality"""
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.name}_tuning.json")
+
+def _write_json_atomic(path, data):
+    tmp_path = Path(path).with_name(Path(path).name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def tile_looks_complete(path):
+    """Cheap truncation check: non-empty and ends with the format's trailer"""
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return False
+        suffix = Path(path).suffix.lower()
+        trailer = {'.jpg': b'\xff\xd9', '.jpeg': b'\xff\xd9', '.png': b'IEND\xaeB`\x82'}.get(suffix)
+        if trailer is None:
+            return True
+        with open(path, 'rb') as f:
+            f.seek(max(0, size - len(trailer)))
+            return f.read() == trailer
+    except OSError:
+        return False
+
+def build_checkpointed(input_path, base_path, tile_size=256, overlap=1,
+                       suffix='.jpg[Q=90]', resume=False, strip_levels=2,
+                       strip_rows=8, on_progress=None):
+    """
+    Build a DZI pyramid in resumable shards
+
+    The source is decoded once, top to bottom, and each level is produced
+    from a few buffered tile rows of the level above it, as in build_sparse.
+    The finest strip_levels levels are written in horizontal strips of
+    strip_rows tile rows; the remaining coarse levels (a small fraction of
+    the tiles) are spooled to a raw file and written by a single dzsave.
+    Each finished shard is recorded in <base>_checkpoint.json; a resumed
+    build streams the source again but does not re-encode recorded strips.
+    Everything is built under a hidden staging directory and the .dzi is
+    written last, so a partial tree is never visible to the gallery. An
+    interrupted build keeps its staging tree and checkpoint for --resume; a
+    build that fails with an error removes them.
+
+    Args:
+        input_path: Path to the source image
+        base_path: Output path without extension
+        tile_size: Size of each tile
+        overlap: Pixel overlap between tiles
+        suffix: Tile suffix including save options
+        resume: Continue from an existing checkpoint instead of starting over
+        strip_levels: Number of finest levels built strip by strip
+        strip_rows: Tile rows per checkpointed strip
+        on_progress: Optional callback(done_shards, total_shards)
+
+    Returns:
+        dict with shards_total, shards_reused and tiles_rechecked counts
+    """
+    import numpy as np
+    import pyvips
+    from concurrent.futures import ThreadPoolExecutor
+
+    input_path = str(input_path)
+    base_path = Path(base_path)
+    staging = base_path.with_name(f".{base_path.name}_building")
+    staged_files = staging / f"{base_path.name}_files"
+    ckpt_path = checkpoint_path(base_path)
+    tile_ext = '.' + tile_format_from_suffix(suffix)
+
+    image = pyvips.Image.new_from_file(input_path, access='sequential')
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    width, height, bands = image.width, image.height, image.bands
+    top_level = max_level(width, height)
+    strip_levels = max(0, min(strip_levels, top_level))
+    coarse_top = top_level - strip_levels
+
+    source_stat = os.stat(input_path)
+    settings = {
+        'input': os.path.abspath(input_path),
+        'input_size': source_stat.st_size,
+        'input_mtime': source_stat.st_mtime,
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'overlap': overlap,
+        'suffix': suffix,
+        'strip_levels': strip_levels,
+        'strip_rows': strip_rows,
+    }
+
+    checkpoint = None
+    if resume and ckpt_path.exists() and staged_files.exists():
+        with open(ckpt_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('settings') != settings:
+            raise ValueError(
+                "Checkpoint was written for a different source or settings; "
+                "run without --resume to start over"
+            )
+    if checkpoint is None:
+        if staging.exists():
+            shutil.rmtree(staging)
+        staged_files.mkdir(parents=True)
+        checkpoint = {'settings': settings, 'strips': {}, 'coarse_done': False}
+        _write_json_atomic(ckpt_path, checkpoint)
+
+    stats = {'shards_total': 0, 'shards_reused': 0, 'tiles_rechecked': 0}
+    state = {}
+    for level in range(top_level, coarse_top, -1):
+        level_width, level_height = level_dimensions(width, height, level)
+        cols, rows = tile_grid(level_width, level_height, tile_size)
+        state[level] = {
+            'width': level_width,
+            'height': level_height,
+            'grid': (cols, rows),
+            'strips': math.ceil(rows / strip_rows),
+            'dir': staged_files / str(level),
+            'buffer': np.zeros((0, level_width, bands), np.uint8),
+            'buffer_y': 0,
+            'next_row': 0,
+            'carry': None,
+        }
+    stats['shards_total'] = sum(s['strips'] for s in state.values()) + 1
+    progress = {'done': 0}
+
+    def strip_tiles(level, strip):
+        cols, rows = state[level]['grid']
+        for row in range(strip * strip_rows, min(rows, (strip + 1) * strip_rows)):
+            for col in range(cols):
+                yield col, row
+
+    # Keep only strips whose tiles all survived the crash intact
+    for level, s in state.items():
+        s['dir'].mkdir(exist_ok=True)
+        s['completed'] = set(checkpoint['strips'].get(str(level), []))
+        for strip in sorted(s['completed']):
+            tiles = list(strip_tiles(level, strip))
+            stats['tiles_rechecked'] += len(tiles)
+            if all(tile_looks_complete(s['dir'] / f"{c}_{r}{tile_ext}") for c, r in tiles):
+                stats['shards_reused'] += 1
+            else:
+                s['completed'].discard(strip)
+        checkpoint['strips'][str(level)] = sorted(s['completed'])
+        progress['done'] += len(s['completed'])
+    if checkpoint['coarse_done']:
+        stats['shards_reused'] += 1
+        progress['done'] += 1
+
+    def shard_done():
+        _write_json_atomic(ckpt_path, checkpoint)
+        progress['done'] += 1
+        if on_progress:
+            on_progress(progress['done'], stats['shards_total'])
+
+    def save(tile, path):
+        tile = np.ascontiguousarray(tile)
+        pyvips.Image.new_from_memory(tile.data, tile.shape[1], tile.shape[0], bands,
+                                     'uchar').write_to_file(path)
+
+    def push(level, rows, final):
+        if level == coarse_top:
+            if spool is not None:
+                spool.write(rows.tobytes())
+            return
+        s = state[level]
+        buffer = np.concatenate([s['buffer'], rows], axis=0) if len(s['buffer']) else rows
+        cols, tile_rows = s['grid']
+        while s['next_row'] < tile_rows:
+            row = s['next_row']
+            _, y, _, h = tile_bounds(0, row, tile_size, overlap, s['width'], s['height'])
+            if y + h > s['buffer_y'] + len(buffer):
+                break
+            strip = row // strip_rows
+            if strip not in s['completed']:
+                band = buffer[y - s['buffer_y']:y - s['buffer_y'] + h]
+                jobs = []
+                for col in range(cols):
+                    x, _, w, _ = tile_bounds(col, row, tile_size, overlap, s['width'], s['height'])
+                    jobs.append((band[:, x:x + w], str(s['dir'] / f"{col}_{row}{suffix}")))
+                list(pool.map(lambda job: save(*job), jobs))
+                if row == min(tile_rows, (strip + 1) * strip_rows) - 1:
+                    s['completed'].add(strip)
+                    checkpoint['strips'][str(level)] = sorted(s['completed'])
+                    shard_done()
+            s['next_row'] += 1
+            # Rows above the next tile row (less its overlap) are done with
+            keep_from = max(0, s['next_row'] * tile_size - overlap) - s['buffer_y']
+            buffer = buffer[keep_from:]
+            s['buffer_y'] += keep_from
+        s['buffer'] = buffer
+
+        if s['carry'] is not None:
+            rows = np.concatenate([s['carry'], rows], axis=0)
+            s['carry'] = None
+        if len(rows) % 2 and not final:
+            rows, s['carry'] = rows[:-1], rows[-1:]
+        if len(rows):
+            push(level - 1, _halve(rows), final)
+
+    coarse_width, coarse_height = level_dimensions(width, height, coarse_top)
+    coarse_raw = staging / 'coarse.raw'
+    pending = not checkpoint['coarse_done'] or \
+        any(len(s['completed']) < s['strips'] for s in state.values())
+    # Honour a thread count chosen by memory_budget.configure_vips
+    workers = pyvips.concurrency_get() if hasattr(pyvips, 'concurrency_get') else (os.cpu_count() or 4)
+    try:
+        if pending:
+            spool = None if checkpoint['coarse_done'] else open(coarse_raw, 'wb')
+            try:
+                read = row_reader(image)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for y in range(0, height, tile_size):
+                        strip_height = min(tile_size, height - y)
+                        push(top_level, read(y, strip_height), y + strip_height >= height)
+            finally:
+                if spool is not None:
+                    spool.close()
+
+        if not checkpoint['coarse_done']:
+            coarse = pyvips.Image.rawload(str(coarse_raw), coarse_width, coarse_height, bands)
+            coarse_base = staging / 'coarse'
+            if coarse_base.with_name('coarse_files').exists():
+                shutil.rmtree(coarse_base.with_name('coarse_files'))
+            coarse.dzsave(str(coarse_base), tile_size=tile_size, overlap=overlap,
+                          suffix=suffix, depth='onepixel', centre=False, layout='dz')
+            for level in range(coarse_top + 1):
+                replace_dir(staging / 'coarse_files' / str(level), staged_files / str(level))
+            coarse_raw.unlink()
+            checkpoint['coarse_done'] = True
+            shard_done()
+    except Exception:
+        # An error would recur on resume; only interruptions are worth keeping
+        shutil.rmtree(staging, ignore_errors=True)
+        ckpt_path.unlink(missing_ok=True)
+        raise
+
+    # Publish: tiles first, descriptor last
+    tiles_dir = base_path.with_name(f"{base_path.name}_files")
+    replace_dir(staged_files, tiles_dir)
+    write_dzi(base_path.with_name(base_path.name + '.dzi'), width, height,
+              tile_size, overlap, tile_format_from_suffix(suffix))
+    shutil.rmtree(staging, ignore_errors=True)
+    ckpt_path.unlink(missing_ok=True)
+    return stats
+
+def build_packed16(image, base_path, tile_size=256, overlap=1):
+    """
+    Build a lossless 16-bit pyramid as 8-bit RGB PNG tiles
+
+    Browsers reduce 16-bit PNGs to 8 bits when drawing to a canvas, so each
+    16-bit code is split across the red (high byte) and green (low byte)
+    channels of an ordinary PNG. Levels are downsampled at 16 bits and only
+    packed afterwards; averaging packed bytes would corrupt the values.
+
+    Args:
+        image: Single-band ushort pyvips image of codes
+        base_path: Output path without extension
+        tile_size: Size of each tile
+        overlap: Pixel overlap between tiles
+    """
+    base_path = Path(base_path)
+    tiles_dir = base_path.with_name(f"{base_path.name}_files")
+    staging = base_path.with_name(f".{base_path.name}_packing")
+    if staging.exists():
+        shutil.rmtree(staging)
+    staged_files = staging / 'tiles'
+    staged_files.mkdir(parents=True)
+
+    width, height = image.width, image.height
+    with memory_budget.remove_on_stop(staging):
+        try:
+            level_image = image
+            for level in range(max_level(width, height), -1, -1):
+                level_width, level_height = level_dimensions(width, height, level)
+                if (level_image.width, level_image.height) != (level_width, level_height):
+                    level_image = level_image.resize(level_width / level_image.width,
+                                                     vscale=level_height / level_image.height)
+                high = (level_image >> 8).cast('uchar')
+                low = (level_image & 255).cast('uchar')
+                packed = high.bandjoin([low, low * 0]).copy(interpretation='srgb')
+                packed.dzsave(str(staging / str(level)), tile_size=tile_size, overlap=overlap,
+                              suffix='.png[compression=6,strip=true]', depth='one',
+                              centre=False, layout='dz')
+                # depth='one' writes its only level as directory 0
+                os.replace(staging / f"{level}_files" / '0', staged_files / str(level))
+                if level > 0:
+                    level_image = level_image.shrink(2, 2)
+            # Publish the whole tree at once; a failed build leaves the old one
+            replace_dir(staged_files, tiles_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    write_dzi(base_path.with_name(base_path.name + '.dzi'), width, height,
+              tile_size, overlap, 'png')
+
+def sparse_index_path(base_path):
+    """Sidecar JSON listing the uniform tiles a sparse build did not write"""
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.name}_sparse.json")
+
+def _halve(rows):
+    """2×2 box downsample of a uint8 (rows, columns, bands) array"""
+    import numpy as np
+
+    # An odd last row/column averages with itself, as level_dimensions rounds up
+    if rows.shape[0] % 2:
+        rows = np.concatenate([rows, rows[-1:]], axis=0)
+    if rows.shape[1] % 2:
+        rows = np.concatenate([rows, rows[:, -1:]], axis=1)
+    total = (rows[0::2, 0::2].astype(np.uint16) + rows[1::2, 0::2]
+             + rows[0::2, 1::2] + rows[1::2, 1::2])
+    return ((total + 2) // 4).astype(np.uint8)
+
+def _uniform_fill(tile, tolerance):
+    """Fill colour of a tile whose pixels all lie within tolerance, else None"""
+    import numpy as np
+
+    first = tile[0, 0]
+    if tolerance:
+        if np.abs(tile.astype(np.int16) - first).max() > tolerance:
+            return None
+        return tuple(int(v) for v in tile.reshape(-1, tile.shape[2]).mean(axis=0).round())
+    if not (tile == first).all():
+        return None
+    return tuple(int(v) for v in first)
+
+def build_sparse(input_path, base_path, tile_size=256, overlap=1,
+                 suffix='.jpg[Q=90]', tolerance=0, on_level=None):
+    """
+    Build a DZI pyramid that leaves uniform tiles out
+
+    The source is decoded once, top to bottom, and every level is produced
+    from a few buffered tile rows of the level above it. A tile whose pixels
+    (overlap included) are all one colour, within tolerance, is never
+    encoded; it is recorded in <base>_sparse.json instead, as runs of
+    row-major tile indices per level with an index into a fill palette.
+    Viewers synthesize those tiles from the fill colour.
+
+    Args:
+        input_path: Path to the source image
+        base_path: Output path without extension
+        tile_size: Size of each tile
+        overlap: Pixel overlap between tiles
+        suffix: Tile suffix including save options
+        tolerance: Largest per-channel deviation still treated as uniform
+        on_level: Optional callback(level, written, skipped) as levels finish
+
+    Returns:
+        dict with tiles, written and skipped counts and the fill palette size
+    """
+    import numpy as np
+    import pyvips
+    from concurrent.futures import ThreadPoolExecutor
+
+    base_path = Path(base_path)
+    staging = base_path.with_name(f".{base_path.name}_building")
+    staged_files = staging / f"{base_path.name}_files"
+    if staging.exists():
+        shutil.rmtree(staging)
+    staged_files.mkdir(parents=True)
+
+    image = pyvips.Image.new_from_file(str(input_path), access='sequential')
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    width, height, bands = image.width, image.height, image.bands
+    top_level = max_level(width, height)
+
+    # Sparse palettes are indexed by one byte; later colours are written as tiles
+    palette = {}
+    runs = {level: [] for level in range(top_level + 1)}
+    stats = {'tiles': 0, 'written': 0, 'skipped': 0}
+    state = {}
+    for level in range(top_level + 1):
+        level_width, level_height = level_dimensions(width, height, level)
+        level_dir = staged_files / str(level)
+        level_dir.mkdir()
+        state[level] = {
+            'width': level_width,
+            'height': level_height,
+            'grid': tile_grid(level_width, level_height, tile_size),
+            'dir': level_dir,
+            'buffer': np.zeros((0, level_width, bands), np.uint8),
+            'buffer_y': 0,
+            'next_row': 0,
+            'carry': None,
+            'written': 0,
+            'skipped': 0,
+        }
+
+    def save(tile, path):
+        tile = np.ascontiguousarray(tile)
+        pyvips.Image.new_from_memory(tile.data, tile.shape[1], tile.shape[0], bands,
+                                     'uchar').write_to_file(path)
+
+    def record(level, index, fill):
+        level_runs = runs[level]
+        if level_runs and level_runs[-1][2] == fill and sum(level_runs[-1][:2]) == index:
+            level_runs[-1][1] += 1
+        else:
+            level_runs.append([index, 1, fill])
+
+    def push(level, rows, final):
+        s = state[level]
+        buffer = np.concatenate([s['buffer'], rows], axis=0) if len(s['buffer']) else rows
+        cols, tile_rows = s['grid']
+        while s['next_row'] < tile_rows:
+            row = s['next_row']
+            _, y, _, h = tile_bounds(0, row, tile_size, overlap, s['width'], s['height'])
+            if y + h > s['buffer_y'] + len(buffer):
+                break
+            band = buffer[y - s['buffer_y']:y - s['buffer_y'] + h]
+            jobs = []
+            for col in range(cols):
+                x, _, w, _ = tile_bounds(col, row, tile_size, overlap, s['width'], s['height'])
+                tile = band[:, x:x + w]
+                fill = _uniform_fill(tile, tolerance)
+                if fill is not None and (fill in palette or len(palette) < 255):
+                    record(level, row * cols + col, palette.setdefault(fill, len(palette)))
+                    s['skipped'] += 1
+                else:
+                    jobs.append((tile, str(s['dir'] / f"{col}_{row}{suffix}")))
+            list(pool.map(lambda job: save(*job), jobs))
+            s['written'] += len(jobs)
+            s['next_row'] += 1
+            # Rows above the next tile row (less its overlap) are done with
+            keep_from = max(0, s['next_row'] * tile_size - overlap) - s['buffer_y']
+            buffer = buffer[keep_from:]
+            s['buffer_y'] += keep_from
+        s['buffer'] = buffer
+
+        if level > 0:
+            if s['carry'] is not None:
+                rows = np.concatenate([s['carry'], rows], axis=0)
+                s['carry'] = None
+            if len(rows) % 2 and not final:
+                rows, s['carry'] = rows[:-1], rows[-1:]
+            if len(rows):
+                push(level - 1, _halve(rows), final)
+            elif final:
+                push(level - 1, np.zeros((0, state[level - 1]['width'], bands), np.uint8), final)
+        if final and on_level:
+            on_level(level, s['written'], s['skipped'])
+
+    workers = pyvips.concurrency_get() if hasattr(pyvips, 'concurrency_get') else (os.cpu_count() or 4)
+    with memory_budget.remove_on_stop(staging):
+        try:
+            read = row_reader(image)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for y in range(0, height, tile_size):
+                    strip_height = min(tile_size, height - y)
+                    push(top_level, read(y, strip_height), y + strip_height >= height)
+
+            for s in state.values():
+                stats['written'] += s['written']
+                stats['skipped'] += s['skipped']
+            stats['tiles'] = stats['written'] + stats['skipped']
+            stats['fills'] = len(palette)
+
+            # Publish: tiles, then the index, descriptor last
+            tiles_dir = base_path.with_name(f"{base_path.name}_files")
+            replace_dir(staged_files, tiles_dir)
+            _write_json_atomic(sparse_index_path(base_path), {
+                'tolerance': tolerance,
+                'skipped': stats['skipped'],
+                'fills': [list(fill) for fill in sorted(palette, key=palette.get)],
+                'levels': {str(level): level_runs for level, level_runs in runs.items() if level_runs},
+            })
+            write_dzi(base_path.with_name(base_path.name + '.dzi'), width, height,
+                      tile_size, overlap, tile_format_from_suffix(suffix))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return stats
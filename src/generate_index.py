@@ -12,6 +12,8 @@ from pathlib import Path
 import shutil
 import re
 
+import tile_codecs
+
 def parse_dzi_info(dzi_path):
     """Extract image info from DZI file"""
     try:
@@ -58,7 +60,7 @@ def count_tiles(tiles_dir):
     total_size = 0
     for root, dirs, files in os.walk(tiles_dir):
         for f in files:
-            if f.endswith('.jpg'):
+            if f.endswith(tile_codecs.TILE_EXTENSIONS):
                 count += 1
                 total_size += os.path.getsize(os.path.join(root, f))
     return count, total_size
@@ -115,6 +117,10 @@ def get_dzi_files():
         if base_name in series_base_names:
             continue
         
+        # Skip trees left behind by an interrupted checkpointed build
+        if (dzi_dir / f"{base_name}_checkpoint.json").exists():
+            continue
+        
         # Parse DZI for dimensions
         width, height = parse_dzi_info(dzi_file)
         
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Memory budget shared by the converters (--max-memory)
+
+Sizes the libvips operation cache and worker thread count to fit a budget,
+watches resident memory while a conversion runs and stops it if the budget
+is exceeded, then reports measured peak RSS so a scheduler can pack jobs.
+"""
+
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# Interpreter, numpy/pydicom/pyvips and libvips itself before any pixels
+BASELINE_BYTES = 150 * 1024 ** 2
+
+# Rough working set of one libvips worker (regions, resample buffers)
+PER_THREAD_BYTES = 32 * 1024 ** 2
+
+# Partial outputs to delete if the budget stops the process (remove_on_stop)
+_stop_paths = []
+_stop_lock = threading.Lock()
+
+_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_size(text):
+    """Parse a size such as '512M', '2G' or '1.5GB' into bytes"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)I?B?\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"Invalid size '{text}' (use e.g. 512M, 4G)")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+def format_bytes(bytes_val):
+    """Human-readable file size"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes_val < 1024.0:
+            return f"{bytes_val:.1f} {unit}"
+        bytes_val /= 1024.0
+    return f"{bytes_val:.1f} TB"
+
+def pyramid_buffer_bytes(width, bands=3, tile_size=256, overlap=1):
+    """
+    Estimate the buffers dzsave keeps while streaming a pyramid
+
+    Each level holds about two tile rows across its width and the levels
+    halve in width, so the total is roughly twice the top-level strip.
+    """
+    strip = width * (tile_size + 2 * overlap) * max(bands, 1)
+    return 2 * 2 * strip
+
+def configure_vips(budget, width=0, bands=3, tile_size=256, overlap=1):
+    """
+    Size the libvips cache and concurrency to a memory budget
+
+    Args:
+        budget: Memory budget in bytes
+        width: Width of the widest image the pipeline will stream
+        bands: Bands of that image
+        tile_size: Tile size, which sets the dzsave strip height
+        overlap: Tile overlap
+
+    Returns:
+        dict with the chosen cache_bytes, threads and the estimated floor
+    """
+    import pyvips
+
+    floor = BASELINE_BYTES + pyramid_buffer_bytes(width, bands, tile_size, overlap)
+    spare = max(0, budget - floor)
+
+    # The operation cache rarely helps a one-shot streaming conversion
+    cache_bytes = min(100 * 1024 ** 2, spare // 10)
+    pyvips.cache_set_max_mem(cache_bytes)
+    pyvips.cache_set_max(100 if budget >= 1024 ** 3 else 10)
+
+    threads = max(1, min(os.cpu_count() or 1, (spare - cache_bytes) // PER_THREAD_BYTES))
+    if hasattr(pyvips, 'concurrency_set'):
+        pyvips.concurrency_set(threads)
+
+    return {'cache_bytes': cache_bytes, 'threads': threads, 'floor': floor}
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+@contextmanager
+def remove_on_stop(*paths):
+    """
+    Delete these paths if enforce() stops the process inside the block
+
+    Builders register their staging directories, and converters that
+    dzsave straight into the output register the tree and descriptor, so
+    a stopped run leaves nothing half-written behind. Resumable staging
+    (build_checkpointed) is deliberately not registered.
+    """
+    paths = [Path(path) for path in paths]
+    with _stop_lock:
+        _stop_paths.extend(paths)
+    try:
+        yield
+    finally:
+        with _stop_lock:
+            for path in paths:
+                _stop_paths.remove(path)
+
+def _remove_stop_paths():
+    """Delete the registered partial outputs (called from the watcher)"""
+    with _stop_lock:
+        paths = list(_stop_paths)
+    # Twice: libvips threads are still running and may create a level
+    # directory again while the first pass deletes
+    for _ in range(2):
+        for path in paths:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+@contextmanager
+def enforce(budget, interval=0.25, report=True):
+    """
+    Stop the process if resident memory exceeds the budget
+
+    Exiting early (status 3) is deliberate: on a shared node it is better
+    to fail one job than let the kernel OOM-kill a neighbour. Paths
+    registered with remove_on_stop are deleted first; checkpointed builds
+    keep their staging and can be resumed afterwards.
+    """
+    stop = threading.Event()
+
+    def watch():
+        while not stop.wait(interval):
+            rss = current_rss()
+            if rss is not None and rss > budget:
+                print(f"\n❌ Memory budget exceeded: {format_bytes(rss)} > {format_bytes(budget)}",
+                      flush=True)
+                _remove_stop_paths()
+                os._exit(3)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    start = time.time()
+    watcher.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        watcher.join()
+        peak = peak_rss()
+        if report and peak is not None:
+            print(f"📈 Peak RSS: {format_bytes(peak)} of {format_bytes(budget)} budget "
+                  f"({time.time() - start:.1f}s)")
+
+def budget_context(budget, width=0, bands=3, tile_size=256, overlap=1):
+    """
+    Configure libvips for a budget and return the enforcing context
+
+    Returns a no-op context when no budget was given, so callers can wrap
+    their dzsave unconditionally.
+    """
+    if not budget:
+        return nullcontext()
+    settings = configure_vips(budget, width, bands, tile_size, overlap)
+    print(f"🧠 Memory budget: {format_bytes(budget)} "
+          f"({settings['threads']} threads, {format_bytes(settings['cache_bytes'])} vips cache)")
+    if settings['floor'] > budget:
+        print(f"⚠️  This image needs about {format_bytes(settings['floor'])} to stream; "
+              f"the conversion will likely be stopped")
+    return enforce(budget)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Stitch many images into one DZI pyramid without assembling the canvas
+
+A layout file places each input on a shared canvas. The canvas is never
+materialized: it is a lazy libvips composite built from insert
+operations, so while dzsave streams it top to bottom each output tile
+only reads the inputs that overlap it. Inputs are opened for sequential
+access and decoded strip by strip. Memory stays bounded by the tile rows
+in flight, not by the canvas size.
+
+Layout files are either JSON:
+
+    [{"path": "field_001.tiff", "x": 0, "y": 0},
+     {"path": "field_002.tiff", "x": 9800, "y": 0, "scale": 0.5}]
+
+or text, one input per line (commas or whitespace, # comments):
+
+    # path            x      y   [scale]
+    field_001.tiff     0      0
+    field_002.tiff  9800      0   0.5
+
+x and y are the canvas position of the input's top-left corner, after
+scaling. Relative paths are resolved against the layout file's directory.
+Where inputs overlap, later lines are drawn over earlier ones.
+
+Usage:
+    python3 mosaic.py slides.layout slide_mosaic
+    python3 mosaic.py fields.json plate_7 --background 0 --codec webp
+    python3 mosaic.py fields.json plate_7 --max-memory 2G
+"""
+
+import sys
+import json
+import time
+from pathlib import Path
+import argparse
+
+import conversion_service
+import dzi_pyramid
+import memory_budget
+import tile_codecs
+
+# Inputs inserted into one intermediate canvas; keeps the operation
+# chain a canvas-wide request passes through short for large layouts
+GROUP_SIZE = 64
+
+def read_layout(layout_path):
+    """
+    Parse a layout file
+
+    Returns:
+        list of dicts with path (resolved), x, y and scale
+
+    Raises:
+        ValueError on a malformed entry
+    """
+    layout_path = Path(layout_path)
+    base = layout_path.parent
+    text = layout_path.read_text()
+
+    entries = []
+    if layout_path.suffix.lower() == '.json':
+        for number, item in enumerate(json.loads(text), 1):
+            try:
+                entries.append((item['path'], item['x'], item['y'], item.get('scale', 1)))
+            except (KeyError, TypeError):
+                raise ValueError(f"Entry {number} needs path, x and y")
+    else:
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.split('#', 1)[0].replace(',', ' ').split()
+            if not line:
+                continue
+            if len(line) not in (3, 4):
+                raise ValueError(f"Line {number}: expected 'path x y [scale]'")
+            entries.append((line[0], *line[1:]))
+
+    layout = []
+    for number, (path, x, y, *scale) in enumerate(entries, 1):
+        try:
+            x, y = round(float(x)), round(float(y))
+            scale = float(scale[0]) if scale else 1.0
+        except ValueError:
+            raise ValueError(f"Entry {number} ({path}): x, y and scale must be numbers")
+        if scale <= 0:
+            raise ValueError(f"Entry {number} ({path}): scale must be positive")
+        path = Path(path)
+        layout.append({'path': path if path.is_absolute() else base / path,
+                       'x': x, 'y': y, 'scale': scale})
+    if not layout:
+        raise ValueError("Layout lists no images")
+    return layout
+
+def _open_input(entry, bands, access):
+    """Open one input, scaled and converted to the canvas's bands and format"""
+    import pyvips
+
+    image = pyvips.Image.new_from_file(str(entry['path']), access=access)
+    if image.hasalpha():
+        image = image.flatten(background=[255])
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    if image.bands != bands:
+        image = image.colourspace('srgb' if bands == 3 else 'b-w')
+    if entry['scale'] != 1:
+        image = image.resize(entry['scale'])
+    return image
+
+def build_canvas(layout, background=255, access='sequential'):
+    """
+    Lazy composite of every input at its layout position
+
+    Negative positions are allowed; the canvas is shifted so the layout's
+    top-left corner is (0, 0). Runs of up to GROUP_SIZE consecutive inputs
+    are inserted into an intermediate canvas covering the run's bounding
+    box, and those into the full canvas, so a region request checks a few
+    dozen operations rather than one per input. Layouts listed in scan
+    order keep those boxes small.
+
+    Returns:
+        (canvas image, placements) where placements lists each input's
+        (x, y, width, height) on the canvas
+    """
+    import pyvips
+
+    # Greyscale only if every input is; anything else composes in sRGB
+    bands = 1
+    for entry in layout:
+        header = pyvips.Image.new_from_file(str(entry['path']))
+        if header.bands - header.hasalpha() > 1:
+            bands = 3
+            break
+
+    images = [_open_input(entry, bands, access) for entry in layout]
+    left = min(entry['x'] for entry in layout)
+    top = min(entry['y'] for entry in layout)
+    placements = [(entry['x'] - left, entry['y'] - top, image.width, image.height)
+                  for entry, image in zip(layout, images)]
+    width = max(x + w for x, _, w, _ in placements)
+    height = max(y + h for _, y, _, h in placements)
+
+    groups = [range(start, min(start + GROUP_SIZE, len(images)))
+              for start in range(0, len(images), GROUP_SIZE)]
+    canvas = (pyvips.Image.black(width, height, bands=bands) + background).cast('uchar')
+    for group in groups:
+        if len(group) == 1:
+            index = group[0]
+            canvas = canvas.insert(images[index], *placements[index][:2])
+            continue
+        gx = min(placements[i][0] for i in group)
+        gy = min(placements[i][1] for i in group)
+        gw = max(placements[i][0] + placements[i][2] for i in group) - gx
+        gh = max(placements[i][1] + placements[i][3] for i in group) - gy
+        # Start from what is already drawn there so overlaps stay ordered
+        part = canvas.crop(gx, gy, gw, gh)
+        for index in group:
+            part = part.insert(images[index], placements[index][0] - gx, placements[index][1] - gy)
+        canvas = canvas.insert(part, gx, gy)
+    return canvas, placements
+
+def build_mosaic(layout_path, output_name, tile_size=256, quality=90, overlap=1,
+                 codec=tile_codecs.DEFAULT_CODEC, background=255, max_memory=None):
+    """
+    Build one DZI pyramid from every image of a layout
+
+    Args:
+        layout_path: Layout file, see the module docstring
+        output_name: Output name without extension, in ../output/dzi
+        tile_size: Size of each tile (default 256)
+        quality: Tile quality 1-100 (default 90)
+        overlap: Pixel overlap between tiles (default 1)
+        codec: Tile codec, see tile_codecs.CODECS
+        background: Grey level of canvas not covered by any input
+        max_memory: Memory budget in bytes; sizes libvips and stops if exceeded
+
+    Returns:
+        True if successful, False otherwise
+    """
+    layout_path = Path(layout_path)
+    if not layout_path.exists():
+        print(f"❌ Error: Layout not found: {layout_path}")
+        return False
+    try:
+        layout = read_layout(layout_path)
+    except ValueError as e:
+        print(f"❌ Error: {layout_path.name}: {e}")
+        return False
+    missing = [str(entry['path']) for entry in layout if not entry['path'].exists()]
+    if missing:
+        print(f"❌ Error: {len(missing)} input(s) not found:")
+        for path in missing[:10]:
+            print(f"   {path}")
+        return False
+
+    output_dir = Path('../output/dzi')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    dzi_path = output_dir / f"{output_name}.dzi"
+
+    print(f"\n{'='*60}")
+    print(f"Mosaic: {layout_path.name} ({len(layout)} images)")
+    print(f"Output: {output_name}.dzi")
+    print(f"{'='*60}\n")
+
+    try:
+        start_time = time.time()
+        canvas, placements = build_canvas(layout, background)
+        covered = sum(w * h for _, _, w, h in placements)
+        print(f"📐 Canvas: {canvas.width:,} × {canvas.height:,} pixels "
+              f"({canvas.width * canvas.height / 1_000_000:,.0f} MP, "
+              f"{min(1.0, covered / (canvas.width * canvas.height)):.0%} covered)")
+        print(f"🧩 Tiles: {dzi_pyramid.count_tiles(canvas.width, canvas.height, tile_size):,}")
+        print(f"🗜️  Codec: {codec} (quality {quality})")
+
+        print("\n⚙️  Streaming the composite into DZI tiles...")
+        budget = memory_budget.budget_context(max_memory, canvas.width, canvas.bands,
+                                              tile_size, overlap)
+        tiles_dir = dzi_path.with_name(f"{dzi_path.stem}_files")
+        with budget, memory_budget.remove_on_stop(dzi_path, tiles_dir):
+            dzi_pyramid.sparse_index_path(dzi_path.with_suffix('')).unlink(missing_ok=True)
+            canvas.dzsave(
+                str(dzi_path.with_suffix('')),
+                tile_size=tile_size,
+                overlap=overlap,
+                suffix=tile_codecs.tile_suffix(codec, quality),
+                depth='onepixel',
+                centre=False,
+                layout='dz'
+            )
+
+        elapsed = time.time() - start_time
+        print("\n✅ Mosaic complete!")
+        print(f"   {dzi_path}")
+        print(f"   Time: {elapsed:.1f}s")
+        print(f"   Peak memory: {memory_budget.format_bytes(memory_budget.peak_rss())}")
+        print("\n🎯 Next steps: make gallery && make view")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error building mosaic: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Stitch the images of a layout file into one DZI pyramid',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 mosaic.py slides.layout slide_mosaic
+  python3 mosaic.py fields.json plate_7 --background 0 --codec webp
+  python3 mosaic.py fields.json plate_7 --max-memory 2G
+
+Layout lines: path x y [scale]   (or a JSON list of {"path", "x", "y", "scale"})
+        """
+    )
+    parser.add_argument('layout', help='Layout file (.json, or text lines of path x y [scale])')
+    parser.add_argument('output_name', nargs='?', help='Output name (default: layout filename)')
+    parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
+                       help='Tile size in pixels (default: 256)')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='Tile quality 1-100 (default: 90)')
+    parser.add_argument('--codec', default=tile_codecs.DEFAULT_CODEC, choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
+    parser.add_argument('--overlap', type=int, default=1,
+                       help='Pixel overlap between tiles (default: 1)')
+    parser.add_argument('--background', type=int, default=255, metavar='0-255',
+                       help='Grey level of canvas no image covers (default: 255, white)')
+    parser.add_argument('--max-memory', type=memory_budget.parse_size, metavar='SIZE',
+                       help='Memory budget, e.g. 2G; stops if exceeded')
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print("❌ Error: Quality must be between 1 and 100")
+        sys.exit(1)
+    if not 0 <= args.background <= 255:
+        print("❌ Error: Background must be between 0 and 255")
+        sys.exit(1)
+    if not tile_codecs.codec_available(args.codec):
+        print(f"❌ Error: This libvips build cannot encode {args.codec} tiles")
+        sys.exit(1)
+
+    success = build_mosaic(args.layout, args.output_name or Path(args.layout).stem,
+                           args.tile_size, args.quality, args.overlap, args.codec,
+                           args.background, args.max_memory)
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    conversion_service.run_main('mosaic', main)
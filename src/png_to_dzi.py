@@ -1,22 +1,39 @@
-import pyvips
 import sys
 import os
 from pathlib import Path
 import time
+import argparse
 
-def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, overlap=1):
+import conversion_service
+import dzi_pyramid
+import memory_budget
+import tile_codecs
+
+def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, overlap=1,
+                   progressive=False, overview_level=None, checkpoint=False, resume=False,
+                   max_memory=None, sparse=False, codec=tile_codecs.DEFAULT_CODEC, tuning=None):
     """Convert an image to Deep Zoom Image (DZI) format for OpenSeadragon.
     
     Args:
         input_file: Path to input image (PNG, JPEG, TIFF, etc.)
         output_name: Output name without extension (defaults to input filename)
         tile_size: Size of each tile in pixels (default 256, recommended 256 or 512)
-        quality: JPEG quality 1-100 (default 90, higher = better quality but larger files)
+        quality: Tile quality 1-100 (default 90, higher = better quality but larger files)
         overlap: Pixel overlap between tiles (default 1, helps prevent seams)
+        progressive: Publish the .dzi and coarse levels first, then the rest
+        overview_level: Deepest level published in the first pass
+        checkpoint: Build in resumable shards recorded in <name>_checkpoint.json
+        resume: Continue an interrupted checkpointed build
+        max_memory: Memory budget in bytes; sizes libvips and stops if exceeded
+        sparse: Skip uniform tiles, listing them in <name>_sparse.json instead
+        codec: Tile codec, see tile_codecs.CODECS
+        tuning: auto_tune.auto_tune() result to record in <name>_tuning.json
     
     Returns:
         True if successful, False otherwise
     """
+    import pyvips
+
     print("=" * 70)
     print("DZI CONVERTER FOR OPENSEADRAGON")
     print("=" * 70)
@@ -47,31 +64,16 @@ def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, over
         print(f"  Channels: {image.bands}")
         print(f"  Format: {image.format}")
         
-        # Calculate pyramid levels
-        max_dimension = max(image.width, image.height)
-        levels = 0
-        temp_size = max_dimension
-        while temp_size > tile_size:
-            temp_size = temp_size / 2
-            levels += 1
-        levels += 1
-        
-        # Estimate number of tiles
-        total_pixels = 0
-        for level in range(levels):
-            scale = 2 ** level
-            level_width = max(1, image.width // scale)
-            level_height = max(1, image.height // scale)
-            tiles_x = (level_width + tile_size - 1) // tile_size
-            tiles_y = (level_height + tile_size - 1) // tile_size
-            total_pixels += tiles_x * tiles_y
+        # Exact pyramid geometry (dzsave halves with round-up down to 1×1)
+        levels = dzi_pyramid.max_level(image.width, image.height) + 1
+        total_tiles = dzi_pyramid.count_tiles(image.width, image.height, tile_size)
         
         print(f"\nConversion settings:")
         print(f"  Tile size: {tile_size}x{tile_size} pixels")
-        print(f"  JPEG quality: {quality}")
+        print(f"  Codec: {codec} (quality {quality})")
         print(f"  Tile overlap: {overlap} pixel(s)")
         print(f"  Pyramid levels: {levels}")
-        print(f"  Estimated tiles: ~{total_pixels:,}")
+        print(f"  Tiles: {total_tiles:,}")
         
         print(f"\nConverting to DZI format...")
         print("(This may take several minutes for very large images)")
@@ -79,12 +81,72 @@ def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, over
         convert_start = time.time()
         
         # Convert to DZI
-        image.dzsave(output_name, 
-                     suffix=f'.jpg[Q={quality},optimize_coding=true,strip=true]',
-                     tile_size=tile_size,
-                     overlap=overlap,
-                     depth='onepixel',  # More efficient pyramid
-                     centre=False)
+        suffix = tile_codecs.tile_suffix(codec, quality)
+        budget = memory_budget.budget_context(max_memory, image.width, image.bands,
+                                              tile_size, overlap)
+        with budget:
+            # A full pyramid supersedes any index left by an earlier sparse build
+            if not sparse:
+                dzi_pyramid.sparse_index_path(output_name).unlink(missing_ok=True)
+            if sparse:
+                stats = dzi_pyramid.build_sparse(input_file, output_name,
+                                                 tile_size=tile_size,
+                                                 overlap=overlap,
+                                                 suffix=suffix)
+                print(f"  Skipped {stats['skipped']:,} uniform tiles of {stats['tiles']:,} "
+                      f"({stats['fills']} fill colours)")
+            elif checkpoint or resume:
+                ckpt = dzi_pyramid.checkpoint_path(output_name)
+                if ckpt.exists() and not resume:
+                    print(f"⚠ Found an interrupted build ({ckpt.name}); starting over")
+                    print(f"  Use --resume to continue it instead")
+                elif resume and ckpt.exists():
+                    print(f"Resuming from {ckpt.name}...")
+            
+                def report(done, total):
+                    elapsed = time.time() - convert_start
+                    print(f"  Shard {done}/{total} done ({elapsed:.0f}s)")
+            
+                stats = dzi_pyramid.build_checkpointed(input_file, output_name,
+                                                       tile_size=tile_size,
+                                                       overlap=overlap,
+                                                       suffix=suffix,
+                                                       resume=resume,
+                                                       on_progress=report)
+                if stats['shards_reused']:
+                    print(f"  Reused {stats['shards_reused']} of {stats['shards_total']} shards "
+                          f"({stats['tiles_rechecked']:,} tiles verified)")
+            elif progressive:
+                def announce(level, top_level):
+                    elapsed = time.time() - convert_start
+                    print(f"✓ Overview ready in {elapsed:.1f}s (levels 0-{level} of {top_level})")
+                    print(f"  {output_name}.dzi can be opened now; deeper levels are still building")
+                    try:
+                        import generate_index
+                        generate_index.generate_index_html()
+                    except Exception as e:
+                        print(f"  Gallery update skipped: {e}")
+            
+                dzi_pyramid.build_progressive(input_file, output_name,
+                                              tile_size=tile_size,
+                                              overlap=overlap,
+                                              suffix=suffix,
+                                              overview_level=overview_level,
+                                              on_overview=announce)
+            else:
+                with memory_budget.remove_on_stop(f"{output_name}.dzi", f"{output_name}_files"):
+                    image.dzsave(output_name, 
+                                 suffix=suffix,
+                                 tile_size=tile_size,
+                                 overlap=overlap,
+                                 depth='onepixel',  # More efficient pyramid
+                                 centre=False)
+        if tuning:
+            import auto_tune
+            auto_tune.write_tuning(output_name, tuning)
+        else:
+            # Settings chosen by hand; an earlier tuning record no longer applies
+            dzi_pyramid.tuning_path(output_name).unlink(missing_ok=True)
         
         convert_time = time.time() - convert_start
         total_time = time.time() - start_time
@@ -103,13 +165,13 @@ def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, over
             tile_count = 0
             dir_size = 0
             for root, dirs, files in os.walk(tiles_dir):
-                tile_count += len([f for f in files if f.endswith('.jpg')])
+                tile_count += len([f for f in files if f.endswith(tile_codecs.TILE_EXTENSIONS)])
                 for file in files:
                     dir_size += os.path.getsize(os.path.join(root, file))
             
             print(f"  Total tiles: {tile_count:,}")
             print(f"  Tiles size: {dir_size / 1024 / 1024:.1f} MB")
-            print(f"  Avg tile size: {dir_size / tile_count / 1024:.1f} KB")
+            print(f"  Avg tile size: {dir_size / max(tile_count, 1) / 1024:.1f} KB")
             print(f"  Compression ratio: {file_size / (dir_size / 1024 / 1024):.1f}x")
         
         print(f"\nNext step: Update your index.html tileSources to '{output_name}.dzi'")
@@ -123,24 +185,99 @@ def convert_to_dzi(input_file, output_name=None, tile_size=256, quality=90, over
         return False
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python png_to_dzi.py <input_file> [output_name] [tile_size] [quality]")
-        print("\nExample:")
-        print("  python png_to_dzi.py huge_test_image.png")
-        print("  python png_to_dzi.py my_image.jpg custom_output 512 95")
+    import auto_tune
+
+    parser = argparse.ArgumentParser(
+        description='Convert a large image to DZI tiles',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python png_to_dzi.py huge_test_image.png
+  python png_to_dzi.py my_image.jpg custom_output 512 95
+  python png_to_dzi.py huge_test_image.png --progressive
+  python png_to_dzi.py huge_test_image.png --checkpoint   # later: --resume
+  python png_to_dzi.py huge_test_image.png --sparse       # skip blank tiles
+  python png_to_dzi.py huge_test_image.png --codec webp
+  python png_to_dzi.py huge_test_image.png --plan         # estimate only
+  python png_to_dzi.py huge_test_image.png --auto-tune    # pick size/quality
+        """
+    )
+    parser.add_argument('input_file', nargs='?', help='Input image (default: huge_test_image.png)')
+    parser.add_argument('output_name', nargs='?', help='Output name (default: input filename)')
+    parser.add_argument('tile_size', nargs='?', type=int, default=256,
+                       help='Tile size in pixels (default: 256)')
+    parser.add_argument('quality', nargs='?', type=int, default=90,
+                       help='Tile quality 1-100 (default: 90)')
+    parser.add_argument('--progressive', action='store_true',
+                       help='Publish coarse levels first so the image is viewable early')
+    parser.add_argument('--overview-level', type=int, metavar='N',
+                       help='Last level of the first progressive pass (implies --progressive)')
+    parser.add_argument('--checkpoint', action='store_true',
+                       help='Build in resumable shards')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continue an interrupted --checkpoint build')
+    parser.add_argument('--max-memory', type=memory_budget.parse_size, metavar='SIZE',
+                       help='Memory budget, e.g. 2G; stops if exceeded')
+    parser.add_argument('--sparse', action='store_true',
+                       help='Skip uniform tiles and list them in <name>_sparse.json')
+    parser.add_argument('--codec', type=str.lower, default=tile_codecs.DEFAULT_CODEC,
+                       choices=list(tile_codecs.CODECS),
+                       help=f'Tile codec (default: {tile_codecs.DEFAULT_CODEC})')
+    parser.add_argument('--plan', action='store_true',
+                       help='Print tile counts and size/time estimates, then exit')
+    parser.add_argument('--auto-tune', action='store_true',
+                       help='Pick tile size and quality from a sampled benchmark')
+    parser.add_argument('--objective', type=str.lower, choices=auto_tune.OBJECTIVES,
+                       help='Auto-tune objective (implies --auto-tune; default: bytes)')
+    # Options may appear anywhere between the positional arguments
+    args = parser.parse_intermixed_args()
+    
+    progressive = args.progressive or args.overview_level is not None
+    checkpoint = args.checkpoint or args.resume
+    tune = args.auto_tune or args.objective is not None
+    objective = args.objective or 'bytes'
+    codec = args.codec
+    input_file = args.input_file
+    output_name, tile_size, quality = args.output_name, args.tile_size, args.quality
+    if input_file is None:
+        parser.print_usage()
         print("\nUsing default: huge_test_image.png")
         input_file = 'huge_test_image.png'
-        output_name = None
-        tile_size = 256
-        quality = 90
-    else:
-        input_file = sys.argv[1]
-        output_name = sys.argv[2] if len(sys.argv) > 2 else None
-        tile_size = int(sys.argv[3]) if len(sys.argv) > 3 else 256
-        quality = int(sys.argv[4]) if len(sys.argv) > 4 else 90
     
-    success = convert_to_dzi(input_file, output_name, tile_size, quality)
+    if progressive and checkpoint:
+        print("✗ Error: --progressive cannot be combined with --checkpoint/--resume")
+        sys.exit(1)
+    if not tile_codecs.codec_available(codec):
+        print(f"✗ Error: This libvips build cannot encode {codec} tiles")
+        sys.exit(1)
+    if args.sparse and (progressive or checkpoint):
+        print("✗ Error: --sparse cannot be combined with --progressive or --checkpoint")
+        sys.exit(1)
+    
+    tuning = None
+    if tune:
+        if not os.path.exists(input_file):
+            print(f"✗ Error: Input file '{input_file}' not found")
+            sys.exit(1)
+        print(f"Tuning tile size and quality on {input_file}...")
+        tuning = auto_tune.auto_tune(input_file, codec, objective)
+        auto_tune.print_tuning(tuning)
+        tile_size, quality = tuning['tile_size'], tuning['quality']
+    
+    if args.plan:
+        import capacity_plan
+        if not os.path.exists(input_file):
+            print(f"✗ Error: Input file '{input_file}' not found")
+            sys.exit(1)
+        capacity_plan.print_plan(capacity_plan.plan_file(input_file, tile_size, 1, codec, quality))
+        sys.exit(0)
+    
+    success = convert_to_dzi(input_file, output_name, tile_size, quality,
+                             progressive=progressive, overview_level=args.overview_level,
+                             checkpoint=checkpoint, resume=args.resume,
+                             max_memory=args.max_memory, sparse=args.sparse, codec=codec,
+                             tuning=tuning)
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    conversion_service.run_main("png_to_dzi", main)
\ No newline at end of file
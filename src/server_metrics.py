@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics and a sampling profiler for tile_server.py
+
+tile_server.py exposes /metrics in the Prometheus text format: request
+counts and latency histograms per route (tile, dzi, series, iiif, gallery,
+metrics), response bytes, in-flight requests, response cache hits, misses
+and evictions, and the process's open file descriptors.
+
+The sampling profiler is off until switched on at runtime with
+/debug/profile/start; /debug/profile/stop returns the sampled stacks in
+collapsed ("flame graph") format. Both only answer loopback clients.
+
+Run as a script, this is a scrape client: it fetches /metrics, checks that
+every line parses and prints the per-route summary.
+
+Usage:
+    python3 server_metrics.py
+    python3 server_metrics.py http://localhost:8080/metrics
+    curl -s localhost:8000/debug/profile/start; sleep 30
+    curl -s localhost:8000/debug/profile/stop > tile_server.folded
+"""
+
+import sys
+import os
+import threading
+import time
+from collections import Counter
+import argparse
+
+# Latency histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+ROUTES = ('tile', 'dzi', 'series', 'iiif', 'gallery', 'metrics', 'debug')
+
+def route_of(path, tile_pattern):
+    """Metrics route of a request path (already unquoted, no query)"""
+    if path == '/metrics':
+        return 'metrics'
+    if path.startswith('/iiif/'):
+        return 'iiif'
+    if path.startswith('/debug/'):
+        return 'debug'
+    if tile_pattern.match(path):
+        return 'tile'
+    if path.endswith('.dzi'):
+        return 'dzi'
+    if path.endswith('_series.json'):
+        return 'series'
+    return 'gallery'
+
+def open_fds():
+    """Open file descriptors of this process, or None where unknown"""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+class ServerMetrics:
+    """Request counters, latency histograms and gauges, safe across threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()            # (route, code) -> count
+        self.buckets = {route: [0] * (len(LATENCY_BUCKETS) + 1) for route in ROUTES}
+        self.latency_sum = Counter()         # route -> seconds
+        self.latency_count = Counter()       # route -> count
+        self.response_bytes = Counter()      # route -> bytes
+        self.in_flight = 0
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, route, code, seconds, size):
+        with self.lock:
+            self.in_flight -= 1
+            self.requests[(route, code)] += 1
+            self.latency_sum[route] += seconds
+            self.latency_count[route] += 1
+            self.response_bytes[route] += size
+            buckets = self.buckets[route]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+                    break
+            else:
+                buckets[-1] += 1
+
+    def render(self, cache=None, profiler=None):
+        """Prometheus text exposition (format 0.0.4) of every metric"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self.lock:
+            metric('dzi_http_requests_total', 'counter', 'HTTP requests by route and status code',
+                   [((('route', route), ('code', code)), count)
+                    for (route, code), count in sorted(self.requests.items())])
+
+            lines.append('# HELP dzi_http_request_duration_seconds Request latency by route')
+            lines.append('# TYPE dzi_http_request_duration_seconds histogram')
+            for route in ROUTES:
+                if not self.latency_count[route]:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets[route]):
+                    cumulative += count
+                    lines.append(f'dzi_http_request_duration_seconds_bucket'
+                                 f'{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'dzi_http_request_duration_seconds_sum{{route="{route}"}} '
+                             f'{self.latency_sum[route]:.6f}')
+                lines.append(f'dzi_http_request_duration_seconds_count{{route="{route}"}} '
+                             f'{self.latency_count[route]}')
+
+            metric('dzi_http_response_bytes_total', 'counter', 'Response body bytes by route',
+                   [((('route', route),), size) for route, size in sorted(self.response_bytes.items())])
+            metric('dzi_http_requests_in_flight', 'gauge', 'Requests being handled', [((), self.in_flight)])
+
+        if cache is not None:
+            with cache.lock:
+                hits, misses, evictions = cache.hits, cache.misses, cache.evictions
+                size, entries = cache.bytes, len(cache.entries)
+            metric('dzi_cache_hits_total', 'counter', 'Response cache hits', [((), hits)])
+            metric('dzi_cache_misses_total', 'counter', 'Response cache misses', [((), misses)])
+            metric('dzi_cache_evictions_total', 'counter', 'Response cache evictions', [((), evictions)])
+            metric('dzi_cache_bytes', 'gauge', 'Bytes held by the response cache', [((), size)])
+            metric('dzi_cache_entries', 'gauge', 'Responses held by the response cache', [((), entries)])
+
+        fds = open_fds()
+        if fds is not None:
+            metric('process_open_fds', 'gauge', 'Open file descriptors', [((), fds)])
+        if profiler is not None:
+            metric('dzi_profiler_running', 'gauge', '1 while the sampling profiler runs',
+                   [((), int(profiler.running))])
+        return '\n'.join(lines) + '\n'
+
+class SamplingProfiler:
+    """Samples every thread's stack at an interval while switched on"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start sampling; False if already running"""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.stacks = Counter()
+            self.thread = threading.Thread(target=self._sample, daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        """
+        Stop sampling
+
+        Returns:
+            Collapsed stacks, one 'outer;...;inner count' line per stack
+        """
+        with self.lock:
+            self.running = False
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _sample(self):
+        own = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+def parse_metrics(text):
+    """
+    Parse Prometheus text exposition
+
+    Returns:
+        dict mapping (name, frozenset of label items) to float value
+
+    Raises:
+        ValueError on a malformed sample line
+    """
+    samples = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line or line.startswith('#'):
+            continue
+        try:
+            series, value = line.rsplit(' ', 1)
+            labels = {}
+            if '{' in series:
+                series, _, label_text = series.partition('{')
+                for pair in label_text.rstrip('}').split(','):
+                    key, _, val = pair.partition('=')
+                    labels[key] = val.strip('"')
+            samples[(series, frozenset(labels.items()))] = float(value)
+        except ValueError:
+            raise ValueError(f"Line {number} is not a valid sample: {line!r}")
+    return samples
+
+def main():
+    import urllib.request
+
+    parser = argparse.ArgumentParser(
+        description='Scrape and check the tile server /metrics endpoint',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 server_metrics.py
+  python3 server_metrics.py http://localhost:8080/metrics
+        """
+    )
+    parser.add_argument('url', nargs='?', default='http://localhost:8000/metrics',
+                       help='Metrics URL (default: http://localhost:8000/metrics)')
+    args = parser.parse_args()
+
+    try:
+        with urllib.request.urlopen(args.url, timeout=10) as response:
+            text = response.read().decode()
+    except OSError as e:
+        print(f"❌ Error: Could not scrape {args.url}: {e}")
+        sys.exit(1)
+    try:
+        samples = parse_metrics(text)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    def value(name, **labels):
+        return samples.get((name, frozenset(labels.items())), 0)
+
+    print(f"📈 {len(samples)} samples from {args.url}")
+    print(f"\n{'Route':<10} {'Requests':>9} {'Mean ms':>8} {'Bytes':>12}")
+    for route in ROUTES:
+        count = value('dzi_http_request_duration_seconds_count', route=route)
+        if not count:
+            continue
+        mean = value('dzi_http_request_duration_seconds_sum', route=route) / count * 1000
+        print(f"{route:<10} {int(count):>9,} {mean:>8.2f} "
+              f"{int(value('dzi_http_response_bytes_total', route=route)):>12,}")
+    hits, misses = value('dzi_cache_hits_total'), value('dzi_cache_misses_total')
+    if hits + misses:
+        print(f"\nCache: {hits / (hits + misses):.1%} hit ratio, "
+              f"{int(value('dzi_cache_evictions_total')):,} evictions")
+    print(f"In flight: {int(value('dzi_http_requests_in_flight'))}, "
+          f"open fds: {int(value('process_open_fds'))}")
+
+if __name__ == '__main__':
+    main()
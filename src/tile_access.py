@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Tile access logs: heat maps, cache hit ratios and cache warm-up
+
+tile_server.py --access-log appends one short line per tile request:
+
+    <unix time> <name> <level> <col> <row> <bytes> <H|M>
+
+(H when the response cache answered). This module aggregates those logs
+into a per-image report (requests, cache hit ratio, the cache size that
+would have held the tiles behind 50/90/99% of requests), heat maps of
+where viewers looked, and the list of tiles tile_server.py --warm loads
+into its cache at startup: every coarse level of the images people open,
+then their hottest tiles.
+
+Usage:
+    python3 tile_access.py ../output/logs/tile_access.log
+    python3 tile_access.py ../output/logs/tile_access.log --heat-maps ../output/logs/heat
+    python3 tile_access.py access.log.1 access.log --json access_report.json
+"""
+
+import sys
+import json
+import math
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import memory_budget
+
+# Levels no larger than this (pixels on the long side) count as coarse;
+# every viewer opening an image requests them
+COARSE_MAX_SIDE = 1024
+
+# Request shares the cache coverage report is computed for
+COVERAGE_SHARES = (0.5, 0.9, 0.99)
+
+# Heat map cells on the long side
+HEAT_MAP_CELLS = 128
+
+class AccessLog:
+    """
+    Buffered, thread-safe writer of per-tile access lines
+
+    Lines are flushed every flush_lines lines and at least every
+    flush_seconds, so a server that is killed loses at most that much.
+    """
+
+    def __init__(self, path, flush_lines=256, flush_seconds=1.0):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, 'a', buffering=1024 * 1024)
+        self.flush_lines = flush_lines
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_every, args=(flush_seconds,),
+                                        daemon=True)
+        self.flusher.start()
+
+    def _flush_every(self, interval):
+        while not self.stop.wait(interval):
+            with self.lock:
+                if self.pending:
+                    self.file.flush()
+                    self.pending = 0
+
+    def record(self, name, level, col, row, size, hit):
+        line = f"{int(time.time())} {name} {level} {col} {row} {size} {'H' if hit else 'M'}\n"
+        with self.lock:
+            self.file.write(line)
+            self.pending += 1
+            if self.pending >= self.flush_lines:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        self.stop.set()
+        self.flusher.join()
+        with self.lock:
+            self.file.close()
+
+def read_logs(paths):
+    """
+    Yield (name, level, col, row, bytes, hit) for every line of the logs
+
+    Lines that do not parse (a crash mid-write) are skipped.
+    """
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 7 or not all(p.isdigit() for p in parts[2:6]):
+                    continue
+                yield (parts[1], int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]),
+                       parts[6] == 'H')
+
+def aggregate(records):
+    """
+    Per-image request statistics
+
+    Returns:
+        dict mapping image name to a dict with requests, hits, a Counter of
+        (level, col, row) requests and a dict of tile sizes in bytes
+    """
+    images = {}
+    for name, level, col, row, size, hit in records:
+        image = images.get(name)
+        if image is None:
+            image = images[name] = {'requests': 0, 'hits': 0, 'tiles': Counter(), 'sizes': {}}
+        image['requests'] += 1
+        image['hits'] += hit
+        key = (level, col, row)
+        image['tiles'][key] += 1
+        image['sizes'][key] = size
+    return images
+
+def cache_coverage(image, shares=COVERAGE_SHARES):
+    """
+    Bytes a cache needs to hold the hottest tiles behind each request share
+
+    Returns:
+        dict mapping share to bytes
+    """
+    coverage, served, cached = {}, 0, 0
+    remaining = sorted(shares)
+    for key, count in image['tiles'].most_common():
+        served += count
+        cached += image['sizes'][key]
+        while remaining and served >= remaining[0] * image['requests']:
+            coverage[remaining.pop(0)] = cached
+    return coverage
+
+def coarse_levels(width, height, max_side=COARSE_MAX_SIDE):
+    """Levels whose long side is at most max_side pixels"""
+    return [level for level in range(dzi_pyramid.max_level(width, height) + 1)
+            if max(dzi_pyramid.level_dimensions(width, height, level)) <= max_side]
+
+def warm_tiles(images, dzi_dir):
+    """
+    Tiles worth preloading, most valuable first
+
+    Every coarse-level tile of each logged image comes first (cheap, and
+    requested by every open), then all logged tiles by request count.
+
+    Returns:
+        list of (name, level, col, row)
+    """
+    coarse, hot = [], []
+    for name, image in sorted(images.items(), key=lambda item: -item[1]['requests']):
+        dzi_path = Path(dzi_dir) / f"{name}.dzi"
+        if not dzi_path.exists():
+            continue
+        info = dzi_pyramid.read_dzi(dzi_path)
+        for level in coarse_levels(info['width'], info['height']):
+            cols, rows = dzi_pyramid.tile_grid(*dzi_pyramid.level_dimensions(
+                info['width'], info['height'], level), info['tile_size'])
+            coarse.extend((name, level, col, row) for row in range(rows) for col in range(cols))
+        hot.extend((count, name, *key) for key, count in image['tiles'].items())
+    seen = set(coarse)
+    ordered = coarse + [tile for _, *tile in sorted(hot, key=lambda t: -t[0])
+                        if tuple(tile) not in seen]
+    return [tuple(tile) for tile in ordered]
+
+def heat_map(dzi_path, image, output_path, cells=HEAT_MAP_CELLS, max_side=1024):
+    """
+    Write a PNG of where viewers looked over a faded view of the image
+
+    Each request is spread over the full-resolution area of its tile and
+    accumulated on a grid of about cells × cells; coarse-level requests
+    (which every open makes) are left out so the deep zooms stand out.
+    """
+    import numpy as np
+    import pyvips
+
+    info = dzi_pyramid.read_dzi(dzi_path)
+    width, height = info['width'], info['height']
+    top_level = dzi_pyramid.max_level(width, height)
+    cell = max(1, math.ceil(max(width, height) / cells))
+    grid = np.zeros((math.ceil(height / cell), math.ceil(width / cell)), dtype=np.float64)
+    coarse = set(coarse_levels(width, height))
+
+    for (level, col, row), count in image['tiles'].items():
+        if level in coarse:
+            continue
+        span = info['tile_size'] * 2 ** (top_level - level)
+        x0, y0 = col * span // cell, row * span // cell
+        x1 = max(x0 + 1, min(width, (col + 1) * span) // cell)
+        y1 = max(y0 + 1, min(height, (row + 1) * span) // cell)
+        grid[y0:y1, x0:x1] += count
+
+    # Log scale so a few very hot tiles do not wash out the rest
+    heat = np.log1p(grid)
+    heat = heat / heat.max() if heat.max() > 0 else heat
+    rgb = np.stack([np.clip(heat * 3, 0, 1), np.clip(heat * 3 - 1, 0, 1),
+                    np.clip(heat * 3 - 2, 0, 1)], axis=2)
+    scale = max_side / max(grid.shape)
+    out_width, out_height = max(1, round(grid.shape[1] * scale)), max(1, round(grid.shape[0] * scale))
+    heat_image = pyvips.Image.new_from_memory(
+        np.ascontiguousarray((rgb * 255).astype(np.uint8)).tobytes(),
+        grid.shape[1], grid.shape[0], 3, 'uchar')
+    alpha_image = pyvips.Image.new_from_memory(
+        np.ascontiguousarray((np.sqrt(heat) * 200).astype(np.uint8)).tobytes(),
+        grid.shape[1], grid.shape[0], 1, 'uchar')
+    heat_image = heat_image.resize(out_width / grid.shape[1], vscale=out_height / grid.shape[0],
+                                   kernel='nearest')
+    alpha_image = alpha_image.resize(out_width / grid.shape[1], vscale=out_height / grid.shape[0],
+                                     kernel='nearest')
+    out_width, out_height = heat_image.width, heat_image.height
+
+    try:
+        import tile_server
+
+        backdrop = tile_server.Pyramid(dzi_path).render(0, 0, width, height, out_width, out_height)
+        if backdrop.bands < 3:
+            backdrop = backdrop.colourspace('srgb')
+        backdrop = backdrop.extract_band(0, n=3) * 0.5 + 64
+    except Exception:
+        backdrop = pyvips.Image.black(out_width, out_height, bands=3) + 32
+
+    alpha = alpha_image.cast('float') / 255
+    composite = backdrop * (1 - alpha) + heat_image.cast('float') * alpha
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    composite.cast('uchar').write_to_file(str(output_path))
+
+def build_report(images):
+    """JSON-ready summary of aggregate() output, busiest images first"""
+    report = []
+    for name, image in sorted(images.items(), key=lambda item: -item[1]['requests']):
+        report.append({
+            'name': name,
+            'requests': image['requests'],
+            'hit_ratio': image['hits'] / image['requests'],
+            'distinct_tiles': len(image['tiles']),
+            'distinct_bytes': sum(image['sizes'].values()),
+            'cache_bytes_for_share': {str(share): size
+                                      for share, size in cache_coverage(image).items()},
+        })
+    return report
+
+def print_report(report):
+    """Print build_report() output as a table"""
+    shares = ' '.join(f"{f'{share:.0%} in':>10}" for share in COVERAGE_SHARES)
+    print(f"\n{'Image':<24} {'Requests':>9} {'Hit %':>6} {'Tiles':>8} {shares}")
+    print(f"{'-' * 24} {'-' * 9} {'-' * 6} {'-' * 8} {' '.join('-' * 10 for _ in COVERAGE_SHARES)}")
+    for row in report:
+        coverage = ' '.join(
+            f"{memory_budget.format_bytes(row['cache_bytes_for_share'].get(str(share), 0)):>10}"
+            for share in COVERAGE_SHARES)
+        print(f"{row['name'][:24]:<24} {row['requests']:>9,} {row['hit_ratio']:>6.1%} "
+              f"{row['distinct_tiles']:>8,} {coverage}")
+    print("\n'N% in' is the cache size that holds the hottest tiles behind N% of requests.")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Aggregate tile access logs into hit-ratio reports and heat maps',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 tile_access.py ../output/logs/tile_access.log
+  python3 tile_access.py ../output/logs/tile_access.log --heat-maps ../output/logs/heat
+  python3 tile_access.py access.log.1 access.log --json access_report.json
+        """
+    )
+    parser.add_argument('logs', nargs='+', help='Access logs written by tile_server.py --access-log')
+    parser.add_argument('--dzi-dir', default='../output/dzi',
+                       help='Directory of the pyramids (default: ../output/dzi)')
+    parser.add_argument('--heat-maps', metavar='DIR', help='Write a <name>.png heat map per image')
+    parser.add_argument('--json', metavar='FILE', help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    missing = [path for path in args.logs if not Path(path).exists()]
+    if missing:
+        print(f"❌ Error: Log not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    images = aggregate(read_logs(args.logs))
+    if not images:
+        print("⚠️  No tile requests in the log(s)")
+        return
+    report = build_report(images)
+    print(f"📈 {sum(row['requests'] for row in report):,} tile requests over {len(report)} image(s)")
+    print_report(report)
+
+    if args.heat_maps:
+        for name, image in images.items():
+            dzi_path = Path(args.dzi_dir) / f"{name}.dzi"
+            if not dzi_path.exists():
+                print(f"   ⚠️  {name}: pyramid no longer exists, no heat map")
+                continue
+            heat_map(dzi_path, image, Path(args.heat_maps) / f"{name}.png")
+        print(f"\n🔥 Heat maps: {args.heat_maps}/")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report: {args.json}")
+
+if __name__ == '__main__':
+    main()
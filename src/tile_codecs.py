@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Tile codecs shared by the converters (--codec) and a codec comparison
+
+Every converter builds its dzsave suffix from CODECS, so the same codec and
+quality give the same tiles whichever converter wrote them. Which codecs
+work depends on how libvips was built (AVIF needs libheif with an AV1
+encoder, JPEG XL needs libjxl); codec_available() tries a real encode.
+
+The comparison tiles a sample region of an image with each codec and
+reports encode speed, bytes per tile and PSNR against the source pixels,
+plus the size of the whole pyramid extrapolated from the sample.
+
+Usage:
+    python3 tile_codecs.py scan.tiff
+    python3 tile_codecs.py scan.tiff --codecs jpeg,webp,avif --quality 80
+    python3 tile_codecs.py scan.tiff --region 20000,15000,2048,2048 --report codecs.json
+"""
+
+import sys
+import json
+import math
+import time
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import memory_budget
+
+# Save options per codec; {quality} is filled in for the lossy ones
+CODECS = {
+    'jpeg': {'format': 'jpg', 'options': 'Q={quality},optimize_coding=true,strip=true'},
+    'webp': {'format': 'webp', 'options': 'Q={quality},strip=true'},
+    'avif': {'format': 'avif', 'options': 'Q={quality},compression=av1,strip=true'},
+    'jxl': {'format': 'jxl', 'options': 'Q={quality},strip=true'},
+    'png': {'format': 'png', 'options': 'compression=6,strip=true'},
+}
+
+DEFAULT_CODEC = 'jpeg'
+
+# File extensions of every tile format a converter may write
+TILE_EXTENSIONS = tuple(f".{codec['format']}" for codec in CODECS.values())
+
+# Side of the default comparison region, in tiles
+SAMPLE_TILES = 4
+
+def tile_suffix(codec, quality=90):
+    """dzsave suffix for a codec, e.g. '.webp[Q=90,strip=true]'"""
+    spec = CODECS[codec]
+    return f".{spec['format']}[{spec['options'].format(quality=quality)}]"
+
+def codec_for_format(tile_format):
+    """Codec name for a DZI Format attribute (jpg, webp, ...)"""
+    tile_format = 'jpg' if tile_format == 'jpeg' else tile_format
+    for name, spec in CODECS.items():
+        if spec['format'] == tile_format:
+            return name
+    raise ValueError(f"Unknown tile format '{tile_format}'")
+
+def codec_available(codec):
+    """True if this libvips build can encode the codec"""
+    import pyvips
+
+    try:
+        pyvips.Image.black(16, 16, bands=3).write_to_buffer(tile_suffix(codec))
+        return True
+    except pyvips.Error:
+        return False
+
+def available_codecs():
+    """Names of the codecs this libvips build can encode"""
+    return [name for name in CODECS if codec_available(name)]
+
+def sample_region(width, height, tile_size, tiles=SAMPLE_TILES):
+    """Centred square of tiles×tiles tiles, clamped to the image"""
+    side = tile_size * tiles
+    sample_width, sample_height = min(side, width), min(side, height)
+    return ((width - sample_width) // 2, (height - sample_height) // 2,
+            sample_width, sample_height)
+
+def psnr(reference, decoded):
+    """Peak signal-to-noise ratio in dB of 8-bit images (inf if identical)"""
+    difference = reference.cast('float') - decoded.cast('float')
+    mse = (difference * difference).avg()
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def compare_codecs(input_path, tile_size=256, quality=90, codecs=None, region=None):
+    """
+    Encode the tiles of a sample region with each codec
+
+    Args:
+        input_path: Path to the source image
+        tile_size: Tile size used to cut the region
+        quality: Quality setting passed to the lossy codecs
+        codecs: Codec names to try (default: every available codec)
+        region: (x, y, width, height) sample; default a centred 4×4 tiles
+
+    Returns:
+        list of dicts with codec, tiles, encode_mps, bytes_per_tile, psnr
+        and pyramid_bytes (the sample's bytes per tile times every tile of
+        the full pyramid), one per codec
+    """
+    import pyvips
+
+    image = pyvips.Image.new_from_file(str(input_path))
+    if image.hasalpha():
+        image = image.flatten(background=[255])
+    if image.format != 'uchar':
+        image = image.cast('uchar', shift=image.format in ('ushort', 'short'))
+    if region is None:
+        region = sample_region(image.width, image.height, tile_size)
+    sample = image.crop(*region).copy_memory()
+    tiles = [sample.crop(x, y, min(tile_size, sample.width - x), min(tile_size, sample.height - y))
+             for y in range(0, sample.height, tile_size)
+             for x in range(0, sample.width, tile_size)]
+    pyramid_tiles = dzi_pyramid.count_tiles(image.width, image.height, tile_size)
+
+    results = []
+    for codec in codecs or available_codecs():
+        if not codec_available(codec):
+            results.append({'codec': codec, 'available': False})
+            continue
+        suffix = tile_suffix(codec, quality)
+        start = time.perf_counter()
+        encoded = [tile.write_to_buffer(suffix) for tile in tiles]
+        elapsed = time.perf_counter() - start
+
+        try:
+            errors = [psnr(tile, pyvips.Image.new_from_buffer(data, '').copy_memory())
+                      for tile, data in zip(tiles, encoded)]
+            finite = [value for value in errors if value != math.inf]
+            quality_db = min(finite) if finite else math.inf
+        except pyvips.Error:
+            quality_db = None   # Encoder present but no decoder to check with
+
+        bytes_per_tile = sum(len(data) for data in encoded) / len(encoded)
+        results.append({
+            'codec': codec,
+            'available': True,
+            'tiles': len(encoded),
+            'encode_mps': sample.width * sample.height / 1_000_000 / max(elapsed, 1e-9),
+            'bytes_per_tile': bytes_per_tile,
+            'psnr': quality_db,
+            'pyramid_bytes': bytes_per_tile * pyramid_tiles,
+        })
+    return results
+
+def print_report(results):
+    """Print compare_codecs results as a table, smallest tiles first"""
+    print(f"\n{'Codec':<6} {'Encode':>10} {'Per tile':>10} {'PSNR':>9} {'Pyramid':>10}")
+    print(f"{'-' * 6} {'-' * 10} {'-' * 10} {'-' * 9} {'-' * 10}")
+    for result in sorted(results, key=lambda r: r.get('bytes_per_tile', math.inf)):
+        if not result['available']:
+            print(f"{result['codec']:<6} {'not available in this libvips build':>42}")
+            continue
+        if result['psnr'] is None:
+            quality_db = 'n/a'
+        elif result['psnr'] == math.inf:
+            quality_db = 'lossless'
+        else:
+            quality_db = f"{result['psnr']:.1f} dB"
+        print(f"{result['codec']:<6} {result['encode_mps']:>6.1f} MP/s "
+              f"{memory_budget.format_bytes(result['bytes_per_tile']):>10} {quality_db:>9} "
+              f"{memory_budget.format_bytes(result['pyramid_bytes']):>10}")
+    print("\nPSNR is the worst tile of the sample; Pyramid extrapolates bytes per tile")
+    print("to every tile of the full image.")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare tile codecs on a sample region of an image',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 tile_codecs.py scan.tiff
+  python3 tile_codecs.py scan.tiff --codecs jpeg,webp,avif --quality 80
+  python3 tile_codecs.py scan.tiff --region 20000,15000,2048,2048 --report codecs.json
+        """
+    )
+    parser.add_argument('input', help='Input image file path')
+    parser.add_argument('--codecs', help=f"Comma-separated codecs (default: all available of "
+                                         f"{', '.join(CODECS)})")
+    parser.add_argument('--tile-size', type=int, default=256, choices=[128, 256, 512],
+                       help='Tile size in pixels (default: 256)')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='Quality 1-100 for the lossy codecs (default: 90)')
+    parser.add_argument('--region', metavar='X,Y,W,H',
+                       help=f'Sample region (default: centred {SAMPLE_TILES}×{SAMPLE_TILES} tiles)')
+    parser.add_argument('--report', metavar='FILE', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    codecs = None
+    if args.codecs:
+        codecs = [name.strip().lower() for name in args.codecs.split(',')]
+        unknown = [name for name in codecs if name not in CODECS]
+        if unknown:
+            print(f"❌ Error: Unknown codec(s): {', '.join(unknown)}")
+            print(f"   Choose from: {', '.join(CODECS)}")
+            sys.exit(1)
+    region = tuple(int(part) for part in args.region.split(',')) if args.region else None
+
+    if not Path(args.input).exists():
+        print(f"❌ Error: File not found: {args.input}")
+        sys.exit(1)
+    print(f"🧪 Comparing codecs on {Path(args.input).name} (quality {args.quality})")
+    results = compare_codecs(args.input, args.tile_size, args.quality, codecs, region)
+    print_report(results)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"\n📄 Report: {args.report}")
+
+if __name__ == '__main__':
+    main()
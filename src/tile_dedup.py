@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Cross-frame tile deduplication for multi-frame series
+
+Background, collimator borders and padding produce byte-identical tiles in
+frame after frame. As each frame's pyramid is written its tiles are
+content-hashed into a shared pool (<base>_tilepool/) and every duplicate is
+replaced with a hardlink to the pooled copy, so the <base>_frame_NNNN_files
+layout viewers read is unchanged while each distinct tile is stored once.
+
+Pooled files are shared between frames, so a frame's tree must be removed
+(discard_tree) before it is written again: dzsave overwrites tiles in
+place, which would change every frame linked to them. Tiles only the old
+tree linked to are left in the pool with no other link; prune_pool deletes
+them once the rewritten frames are pooled.
+
+Usage:
+    python3 tile_dedup.py cardiac
+"""
+
+import sys
+import errno
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+import argparse
+
+import memory_budget
+
+def pool_dir(output_dir, base_name):
+    """Shared tile pool of a series"""
+    return Path(output_dir) / f"{base_name}_tilepool"
+
+def discard_tree(tiles_dir):
+    """Remove a frame's (possibly partial) tile tree before rewriting it"""
+    if Path(tiles_dir).exists():
+        shutil.rmtree(tiles_dir)
+
+def _link_over(source, target):
+    """Atomically replace target with a hardlink to source"""
+    # rename() is a no-op between links to the same file, leaving tmp behind
+    if target.exists() and os.path.samefile(source, target):
+        return
+    tmp_path = target.with_name(target.name + '.link')
+    os.link(source, tmp_path)
+    os.replace(tmp_path, target)
+
+def add_tree(pool, tiles_dir):
+    """
+    Move a freshly written frame's tiles into the pool
+
+    Returns:
+        False if the filesystem cannot hardlink (the tree is left as is)
+    """
+    pool = Path(pool)
+    for path in Path(tiles_dir).rglob('*'):
+        if not path.is_file():
+            continue
+        digest = hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+        pooled = pool / digest[:2] / f"{digest}{path.suffix}"
+        try:
+            if pooled.exists():
+                try:
+                    _link_over(pooled, path)
+                except OSError as e:
+                    if e.errno != errno.EMLINK:
+                        raise
+                    # Link limit reached: later duplicates link to this copy
+                    _link_over(path, pooled)
+            else:
+                pooled.parent.mkdir(parents=True, exist_ok=True)
+                _link_over(path, pooled)
+        except OSError as e:
+            if e.errno in (errno.EPERM, errno.EXDEV, errno.ENOTSUP, errno.EOPNOTSUPP):
+                return False
+            raise
+    return True
+
+def prune_pool(pool):
+    """
+    Delete pooled tiles that no frame links to any more
+
+    Returns:
+        Number of tiles removed
+    """
+    removed = 0
+    pool = Path(pool)
+    if not pool.is_dir():
+        return removed
+    for shard in pool.iterdir():
+        if not shard.is_dir():
+            continue
+        for path in shard.iterdir():
+            # The pool's own link is the only one left
+            if path.is_file() and path.stat().st_nlink == 1:
+                path.unlink()
+                removed += 1
+        if not any(shard.iterdir()):
+            shard.rmdir()
+    return removed
+
+def series_summary(output_dir, base_name, frame_count):
+    """
+    Tile counts and sizes before and after deduplication
+
+    Returns:
+        dict for the series JSON "dedup" key
+    """
+    tiles, tile_bytes = 0, 0
+    stored = {}
+    for index in range(frame_count):
+        tiles_dir = Path(output_dir) / f"{base_name}_frame_{index:04d}_files"
+        for path in tiles_dir.rglob('*'):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            tiles += 1
+            tile_bytes += st.st_size
+            stored[(st.st_dev, st.st_ino)] = st.st_size
+    stored_bytes = sum(stored.values())
+    return {
+        'tiles': tiles,
+        'unique_tiles': len(stored),
+        'ratio': round(tiles / len(stored), 2) if stored else 1.0,
+        'tile_bytes': tile_bytes,
+        'stored_bytes': stored_bytes,
+        'saved_bytes': tile_bytes - stored_bytes,
+    }
+
+def dedup_series(series_file):
+    """
+    Deduplicate every frame of an existing series and record the summary
+
+    Returns:
+        The summary dict
+    """
+    series_file = Path(series_file)
+    with open(series_file) as f:
+        series = json.load(f)
+    output_dir, base_name = series_file.parent, series['base_name']
+    pool = pool_dir(output_dir, base_name)
+    # Frame numbers run to total_frames; converted_frames is a count and
+    # falls short of the last frames whenever earlier ones are missing
+    for index in range(series['total_frames']):
+        tiles_dir = output_dir / f"{base_name}_frame_{index:04d}_files"
+        if tiles_dir.exists() and not add_tree(pool, tiles_dir):
+            break
+    prune_pool(pool)
+    series['dedup'] = series_summary(output_dir, base_name, series['total_frames'])
+    tmp_path = series_file.with_name(series_file.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(series, f, indent=2)
+    os.replace(tmp_path, series_file)
+    return series['dedup']
+
+def describe(summary):
+    """One-line report of a series summary"""
+    return (f"{summary['tiles']:,} tiles, {summary['unique_tiles']:,} distinct "
+            f"({summary['ratio']:.2f}×), "
+            f"{memory_budget.format_bytes(summary['saved_bytes'])} saved")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Deduplicate identical tiles across the frames of a series',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 tile_dedup.py cardiac
+  python3 tile_dedup.py cardiac chest_ct_axial
+        """
+    )
+    parser.add_argument('series', nargs='+', help='Series base names in ../output/dzi')
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.series:
+        series_file = Path('../output/dzi') / f"{name}_series.json"
+        if not series_file.exists():
+            print(f"❌ Error: Series not found: {series_file}")
+            ok = False
+            continue
+        print(f"🧩 {name}: {describe(dedup_series(series_file))}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
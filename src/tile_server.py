@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""
+Tile server: the gallery, DZI tiles and a IIIF Image API over output/
+
+Serves ../output like `python3 -m http.server` does, and adds a IIIF Image
+API 3.0 endpoint for every pyramid in output/dzi:
+
+    /iiif/<name>/info.json
+    /iiif/<name>/<region>/<size>/<rotation>/<quality>.<format>
+
+A IIIF request never touches the source image. The server picks the
+coarsest pyramid level that still has enough pixels for the requested
+size, decodes only the <level>/<col>_<row> tiles that intersect the
+region, stitches and resamples them. Encoded responses are kept in an
+in-memory LRU cache, and so are plain DZI tiles. Tiles left out of sparse
+pyramids (<name>_sparse.json) are synthesized from their fill colour, both
+for IIIF and for plain tile requests.
+
+With --access-log every tile request is logged for tile_access.py, and
+--warm loads the coarse levels and hottest tiles from such logs into the
+cache at startup, so the images people open are fast right after a restart.
+
+/metrics serves Prometheus metrics (see server_metrics.py), and a sampling
+profiler can be switched on and off at runtime from loopback clients with
+/debug/profile/start and /debug/profile/stop.
+
+Usage:
+    python3 tile_server.py
+    python3 tile_server.py --port 8080 --cache-size 1G
+    python3 tile_server.py --access-log ../output/logs/tile_access.log \
+                           --warm ../output/logs/tile_access.log
+    curl http://localhost:8000/iiif/scan/info.json
+    curl -o crop.jpg http://localhost:8000/iiif/scan/20000,15000,4096,4096/1024,/0/default.jpg
+    curl http://localhost:8000/metrics
+"""
+
+import sys
+import json
+import math
+import re
+import signal
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote
+import argparse
+
+import dzi_pyramid
+import memory_budget
+import server_metrics
+
+IIIF_CONTEXT = 'http://iiif.io/api/image/3/context.json'
+
+# IIIF output formats: save suffix and content type
+OUTPUT_FORMATS = {
+    'jpg': ('.jpg[Q=90,optimize_coding=true,strip=true]', 'image/jpeg'),
+    'png': ('.png[compression=6,strip=true]', 'image/png'),
+    'webp': ('.webp[Q=90,strip=true]', 'image/webp'),
+}
+
+QUALITIES = ('default', 'color', 'gray', 'bitonal')
+
+# Largest IIIF response, in pixels, so one request cannot exhaust memory
+MAX_AREA = 64 * 1024 * 1024
+
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2
+
+# Share of the cache --warm may fill, leaving room for live traffic
+WARM_SHARE = 0.75
+
+_TILE_PATH = re.compile(r'^/dzi/(?P<name>[^/]+)_files/(?P<level>\d+)/(?P<col>\d+)_(?P<row>\d+)\.\w+$')
+
+class IIIFError(Exception):
+    """A IIIF request that cannot be served, with its HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def parse_region(text, width, height):
+    """
+    Resolve a IIIF region against the full image
+
+    Returns:
+        (x, y, width, height) tuple clipped to the image
+    """
+    if text == 'full':
+        x, y, w, h = 0, 0, width, height
+    elif text == 'square':
+        side = min(width, height)
+        x, y, w, h = (width - side) // 2, (height - side) // 2, side, side
+    else:
+        percent = text.startswith('pct:')
+        try:
+            values = [float(v) for v in text[4 if percent else 0:].split(',')]
+        except ValueError:
+            values = []
+        if len(values) != 4:
+            raise IIIFError(400, f"Invalid region '{text}'")
+        if percent:
+            values = [values[0] * width / 100, values[1] * height / 100,
+                      values[2] * width / 100, values[3] * height / 100]
+        x, y, w, h = (int(round(v)) for v in values)
+    if w <= 0 or h <= 0 or x >= width or y >= height or x < 0 or y < 0:
+        raise IIIFError(400, f"Region '{text}' lies outside the image")
+    return x, y, min(w, width - x), min(h, height - y)
+
+def parse_size(text, region_width, region_height):
+    """
+    Resolve a IIIF size against the region
+
+    Returns:
+        (width, height) tuple of the output image
+    """
+    upscale = text.startswith('^')
+    text = text[1:] if upscale else text
+    aspect = region_width / region_height
+    if text == 'max':
+        w, h = region_width, region_height
+        if w * h > MAX_AREA:
+            scale = math.sqrt(MAX_AREA / (w * h))
+            w, h = int(w * scale), int(h * scale)
+    elif text.startswith('pct:'):
+        try:
+            scale = float(text[4:]) / 100
+        except ValueError:
+            raise IIIFError(400, f"Invalid size '{text}'")
+        w, h = round(region_width * scale), round(region_height * scale)
+    else:
+        confined = text.startswith('!')
+        match = re.fullmatch(r'(\d*),(\d*)', text[1:] if confined else text)
+        if not match or not (match.group(1) or match.group(2)):
+            raise IIIFError(400, f"Invalid size '{text}'")
+        w = int(match.group(1)) if match.group(1) else None
+        h = int(match.group(2)) if match.group(2) else None
+        if confined:
+            if w is None or h is None:
+                raise IIIFError(400, f"Invalid size '{text}'")
+            scale = min(w / region_width, h / region_height)
+            w, h = round(region_width * scale), round(region_height * scale)
+        elif w is None:
+            w = round(h * aspect)
+        elif h is None:
+            h = round(w / aspect)
+    if w < 1 or h < 1:
+        raise IIIFError(400, f"Size '{text}' is empty")
+    if not upscale and (w > region_width or h > region_height):
+        raise IIIFError(400, f"Size '{text}' is larger than the region (use ^ to upscale)")
+    if w * h > MAX_AREA:
+        raise IIIFError(400, f"Size {w}×{h} exceeds the {MAX_AREA:,} pixel limit")
+    return w, h
+
+def parse_rotation(text):
+    """
+    Resolve a IIIF rotation
+
+    Returns:
+        (mirror, degrees) with degrees one of 0, 90, 180, 270
+    """
+    mirror = text.startswith('!')
+    try:
+        degrees = float(text[1:] if mirror else text)
+    except ValueError:
+        raise IIIFError(400, f"Invalid rotation '{text}'")
+    if degrees % 90 or not 0 <= degrees < 360:
+        raise IIIFError(400, f"Only rotations by multiples of 90 are supported, not '{text}'")
+    return mirror, int(degrees)
+
+class Pyramid:
+    """One DZI pyramid on disk, with its sparse index if it has one"""
+
+    def __init__(self, dzi_path):
+        self.dzi_path = Path(dzi_path)
+        self.mtime = self.dzi_path.stat().st_mtime_ns
+        info = dzi_pyramid.read_dzi(self.dzi_path)
+        self.width, self.height = info['width'], info['height']
+        self.tile_size, self.overlap = info['tile_size'], info['overlap']
+        self.format = info['format']
+        self.content_type = f"image/{'jpeg' if self.format == 'jpg' else self.format}"
+        self.top_level = dzi_pyramid.max_level(self.width, self.height)
+        base_path = self.dzi_path.with_suffix('')
+        self.tiles_dir = base_path.with_name(f"{base_path.name}_files")
+
+        self.fills, self.sparse = [], {}
+        sparse_path = dzi_pyramid.sparse_index_path(base_path)
+        if sparse_path.exists():
+            with open(sparse_path) as f:
+                index = json.load(f)
+            self.fills = index['fills']
+            self.sparse = {int(level): runs for level, runs in index['levels'].items()}
+
+    def sparse_fill(self, level, col, row):
+        """Fill colour of a tile the sparse build left out, else None"""
+        runs = self.sparse.get(level)
+        if not runs:
+            return None
+        cols, _ = dzi_pyramid.tile_grid(*dzi_pyramid.level_dimensions(
+            self.width, self.height, level), self.tile_size)
+        index = row * cols + col
+        low, high = 0, len(runs) - 1
+        while low <= high:
+            middle = (low + high) // 2
+            start, count, fill = runs[middle]
+            if index < start:
+                high = middle - 1
+            elif index >= start + count:
+                low = middle + 1
+            else:
+                return self.fills[fill]
+        return None
+
+    def fill_image(self, fill, width, height, bands):
+        """Solid tile of a sparse fill colour"""
+        import pyvips
+
+        fill = fill[:1] if bands < 3 else fill[:3]
+        return (pyvips.Image.black(width, height, bands=bands) + fill).cast('uchar')
+
+    def tile(self, level, col, row):
+        """
+        Core pixels of one tile (overlap trimmed off)
+
+        Returns:
+            pyvips image, or a fill colour list for a sparse tile
+        """
+        import pyvips
+
+        level_width, level_height = dzi_pyramid.level_dimensions(self.width, self.height, level)
+        core_width = min(self.tile_size, level_width - col * self.tile_size)
+        core_height = min(self.tile_size, level_height - row * self.tile_size)
+        path = self.tiles_dir / str(level) / f"{col}_{row}.{self.format}"
+        if not path.exists():
+            fill = self.sparse_fill(level, col, row)
+            if fill is None:
+                raise IIIFError(404, f"Tile {level}/{col}_{row} is missing")
+            return fill
+        # From the bytes: libvips caches loads by filename and would keep
+        # serving a tile that update_dzi_region.py has since replaced
+        image = pyvips.Image.new_from_buffer(path.read_bytes(), '')
+        left = self.overlap if col > 0 else 0
+        top = self.overlap if row > 0 else 0
+        return image.crop(left, top, core_width, core_height)
+
+    def render(self, x, y, width, height, out_width, out_height):
+        """
+        Compose a full-resolution region at an output size from the tiles
+
+        The coarsest level with at least out_width × out_height pixels over
+        the region is used, so only its few intersecting tiles are decoded.
+        """
+        import pyvips
+
+        scale = max(out_width / width, out_height / height)
+        level = self.top_level
+        if scale < 1:
+            level -= int(math.floor(math.log2(1 / scale)))
+        level = max(0, level)
+        level_width, level_height = dzi_pyramid.level_dimensions(self.width, self.height, level)
+        lx, ly, lw, lh = dzi_pyramid.level_region(x, y, width, height, level, self.top_level)
+        lw, lh = min(lw, level_width - lx), min(lh, level_height - ly)
+
+        size = self.tile_size
+        cols = range(lx // size, (lx + lw - 1) // size + 1)
+        rows = range(ly // size, (ly + lh - 1) // size + 1)
+        tiles = [[self.tile(level, col, row) for col in cols] for row in rows]
+
+        bands = next((tile.bands for row in tiles for tile in row if not isinstance(tile, list)),
+                     None)
+        if bands is None:
+            first = tiles[0][0]
+            bands = 3 if len(first) >= 3 else 1
+        cells = []
+        for row, row_tiles in zip(rows, tiles):
+            for col, tile in zip(cols, row_tiles):
+                if isinstance(tile, list):
+                    tile = self.fill_image(tile,
+                                           min(size, level_width - col * size),
+                                           min(size, level_height - row * size), bands)
+                cells.append(tile)
+        mosaic = cells[0] if len(cells) == 1 else pyvips.Image.arrayjoin(cells, across=len(cols))
+        region = mosaic.crop(lx - cols.start * size, ly - rows.start * size, lw, lh)
+        if (region.width, region.height) != (out_width, out_height):
+            region = region.thumbnail_image(out_width, height=out_height, size='force')
+        return region
+
+    def synthesize_tile(self, level, col, row):
+        """
+        Encoded tile for a position the sparse build left out
+
+        Returns:
+            bytes in the pyramid's format, or None if the tile is not sparse
+        """
+        fill = self.sparse_fill(level, col, row)
+        if fill is None:
+            return None
+        level_width, level_height = dzi_pyramid.level_dimensions(self.width, self.height, level)
+        _, _, width, height = dzi_pyramid.tile_bounds(col, row, self.tile_size, self.overlap,
+                                                      level_width, level_height)
+        image = self.fill_image(fill, width, height, 3 if len(fill) >= 3 else 1)
+        return image.write_to_buffer(f".{self.format}")
+
+    def info(self, base_url):
+        """IIIF info.json document"""
+        return {
+            '@context': IIIF_CONTEXT,
+            'id': base_url,
+            'type': 'ImageService3',
+            'protocol': 'http://iiif.io/api/image',
+            'profile': 'level2',
+            'width': self.width,
+            'height': self.height,
+            'maxArea': MAX_AREA,
+            'tiles': [{
+                'width': self.tile_size,
+                'scaleFactors': [2 ** k for k in range(self.top_level + 1)],
+            }],
+            'extraFormats': [fmt for fmt in OUTPUT_FORMATS if fmt not in ('jpg', 'png')],
+            'extraQualities': ['color', 'gray', 'bitonal'],
+            'extraFeatures': ['mirroring', 'rotationBy90s', 'regionSquare', 'sizeUpscaling'],
+        }
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses, bounded by total bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, content_type):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (body, content_type)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, (old_body, _) = self.entries.popitem(last=False)
+                self.bytes -= len(old_body)
+                self.evictions += 1
+
+class TileServer(ThreadingHTTPServer):
+    """HTTP server holding the pyramids and the response cache"""
+
+    daemon_threads = True
+
+    def __init__(self, address, root, cache_bytes=DEFAULT_CACHE_BYTES, access_log=None):
+        self.root = Path(root).resolve()
+        self.dzi_dir = self.root / 'dzi'
+        self.cache = ResponseCache(cache_bytes)
+        self.access_log = access_log
+        self.metrics = server_metrics.ServerMetrics()
+        self.profiler = server_metrics.SamplingProfiler()
+        self.pyramids = {}
+        self.pyramids_lock = threading.Lock()
+        super().__init__(address, partial(TileRequestHandler, directory=str(self.root)))
+
+    def pyramid(self, name):
+        """Pyramid by name, reloaded when its .dzi changes; None if unknown"""
+        if '/' in name or name.startswith('.'):
+            return None
+        dzi_path = self.dzi_dir / f"{name}.dzi"
+        try:
+            mtime = dzi_path.stat().st_mtime_ns
+        except OSError:
+            return None
+        with self.pyramids_lock:
+            pyramid = self.pyramids.get(name)
+            if pyramid is None or pyramid.mtime != mtime:
+                pyramid = self.pyramids[name] = Pyramid(dzi_path)
+            return pyramid
+
+    def load_tile(self, pyramid, url_path, level, col, row):
+        """
+        One DZI tile through the response cache
+
+        Tiles are keyed by their file's mtime, so a region update is seen at
+        once; sparse tiles that were never written are synthesized.
+
+        Returns:
+            (body, content type, cache hit) tuple, or None if there is no tile
+        """
+        file_path = self.root / url_path.lstrip('/')
+        try:
+            mtime = file_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        key = (url_path, pyramid.mtime if mtime is None else mtime)
+        cached = self.cache.get(key)
+        if cached:
+            return cached[0], cached[1], True
+        if mtime is None:
+            body = pyramid.synthesize_tile(level, col, row)
+            if body is None:
+                return None
+        else:
+            try:
+                body = file_path.read_bytes()
+            except OSError:
+                return None
+        self.cache.put(key, body, pyramid.content_type)
+        return body, pyramid.content_type, False
+
+    def warm(self, tiles, max_bytes=None):
+        """
+        Load tiles into the cache, in order, until max_bytes are loaded
+
+        Args:
+            tiles: (name, level, col, row) tuples, see tile_access.warm_tiles
+            max_bytes: Budget (default: WARM_SHARE of the cache)
+
+        Returns:
+            (tiles loaded, bytes loaded) tuple
+        """
+        max_bytes = max_bytes or int(self.cache.max_bytes * WARM_SHARE)
+        count = loaded = 0
+        for name, level, col, row in tiles:
+            if loaded >= max_bytes:
+                break
+            pyramid = self.pyramid(name)
+            if pyramid is None:
+                continue
+            result = self.load_tile(pyramid, f"/dzi/{name}_files/{level}/{col}_{row}.{pyramid.format}",
+                                    level, col, row)
+            if result:
+                count += 1
+                loaded += len(result[0])
+        return count, loaded
+
+class TileRequestHandler(SimpleHTTPRequestHandler):
+    """Static files plus /iiif/, cached DZI tiles, sparse tiles and /metrics"""
+
+    def do_GET(self):
+        self.measure(self.route_get)
+
+    def do_HEAD(self):
+        self.measure(lambda path: SimpleHTTPRequestHandler.do_HEAD(self))
+
+    def measure(self, handler):
+        """Run a request handler, recording its route, status, latency and size"""
+        path = unquote(self.path.split('?', 1)[0])
+        metrics = self.server.metrics
+        self.response_status, self.body_bytes = 0, 0
+        metrics.begin()
+        start = time.perf_counter()
+        try:
+            handler(path)
+        finally:
+            metrics.end(server_metrics.route_of(path, _TILE_PATH), self.response_status,
+                        time.perf_counter() - start, self.body_bytes)
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length' and self.command != 'HEAD':
+            self.body_bytes = int(value)
+        super().send_header(keyword, value)
+
+    def route_get(self, path):
+        if path == '/metrics':
+            body = self.server.metrics.render(self.server.cache, self.server.profiler).encode()
+            return self.send_body(body, 'text/plain; version=0.0.4; charset=utf-8')
+        if path.startswith('/debug/profile/'):
+            return self.handle_profiler(path[len('/debug/profile/'):])
+        if path.startswith('/iiif/'):
+            return self.handle_iiif(path[len('/iiif/'):])
+        match = _TILE_PATH.match(path)
+        if match:
+            name = match.group('name')
+            level, col, row = (int(match.group(k)) for k in ('level', 'col', 'row'))
+            pyramid = self.server.pyramid(name)
+            result = pyramid and self.server.load_tile(pyramid, path, level, col, row)
+            if result:
+                body, content_type, hit = result
+                if self.server.access_log:
+                    self.server.access_log.record(name, level, col, row, len(body), hit)
+                return self.send_body(body, content_type)
+        return super().do_GET()
+
+    def handle_profiler(self, action):
+        """Switch the sampling profiler on or off (loopback clients only)"""
+        if self.client_address[0] not in ('127.0.0.1', '::1'):
+            return self.send_error(403, "Profiler control is limited to localhost")
+        profiler = self.server.profiler
+        if action == 'start':
+            started = profiler.start()
+            return self.send_body(b"started\n" if started else b"already running\n", 'text/plain')
+        if action == 'stop':
+            return self.send_body(profiler.stop().encode(), 'text/plain')
+        return self.send_error(404, "Use /debug/profile/start or /debug/profile/stop")
+
+    def handle_iiif(self, path):
+        parts = path.split('/')
+        pyramid = self.server.pyramid(parts[0])
+        if pyramid is None:
+            return self.send_error(404, f"No image named '{parts[0]}'")
+        base_url = f"http://{self.headers.get('Host', 'localhost')}/iiif/{parts[0]}"
+        if len(parts) == 1:
+            self.send_response(303)
+            self.send_header('Location', f"{base_url}/info.json")
+            self.end_headers()
+            return None
+        if parts[1:] == ['info.json']:
+            body = json.dumps(pyramid.info(base_url), indent=2).encode()
+            return self.send_body(body, 'application/ld+json')
+        if len(parts) != 5:
+            return self.send_error(400, "Expected {region}/{size}/{rotation}/{quality}.{format}")
+
+        key = (path, pyramid.mtime)
+        cached = self.server.cache.get(key)
+        if cached:
+            return self.send_body(*cached)
+        try:
+            body, content_type = render_iiif(pyramid, *parts[1:])
+        except IIIFError as e:
+            return self.send_error(e.status, str(e))
+        self.server.cache.put(key, body, content_type)
+        return self.send_body(body, content_type)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+def render_iiif(pyramid, region, size, rotation, quality_format):
+    """
+    Render one IIIF image request
+
+    Returns:
+        (body, content type) tuple
+    """
+    quality, _, fmt = quality_format.rpartition('.')
+    if quality not in QUALITIES:
+        raise IIIFError(400, f"Unsupported quality '{quality}'")
+    if fmt not in OUTPUT_FORMATS:
+        raise IIIFError(400, f"Unsupported format '{fmt}'")
+    x, y, width, height = parse_region(region, pyramid.width, pyramid.height)
+    out_width, out_height = parse_size(size, width, height)
+    mirror, degrees = parse_rotation(rotation)
+
+    image = pyramid.render(x, y, width, height, out_width, out_height)
+    if mirror:
+        image = image.fliphor()
+    if degrees:
+        image = {90: image.rot90, 180: image.rot180, 270: image.rot270}[degrees]()
+    if quality in ('gray', 'bitonal') and image.bands >= 3:
+        image = image.colourspace('b-w')
+    if quality == 'bitonal':
+        image = (image > 127).cast('uchar')
+    suffix, content_type = OUTPUT_FORMATS[fmt]
+    return image.write_to_buffer(suffix), content_type
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve the gallery and tiles, with a IIIF Image API over the DZI pyramids',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 tile_server.py
+  python3 tile_server.py --port 8080 --cache-size 1G
+  python3 tile_server.py --access-log ../output/logs/tile_access.log --warm ../output/logs/tile_access.log
+  curl http://localhost:8000/iiif/scan/info.json
+  curl -o crop.jpg http://localhost:8000/iiif/scan/20000,15000,4096,4096/1024,/0/default.jpg
+        """
+    )
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--bind', default='', help='Address to bind (default: all interfaces)')
+    parser.add_argument('--root', default='../output', help='Directory to serve (default: ../output)')
+    parser.add_argument('--cache-size', type=memory_budget.parse_size, default=DEFAULT_CACHE_BYTES,
+                       metavar='SIZE', help='Tile and IIIF response cache size (default: 256M)')
+    parser.add_argument('--access-log', metavar='FILE',
+                       help='Append one line per tile request (for tile_access.py)')
+    parser.add_argument('--warm', metavar='LOG', action='append', default=[],
+                       help='Preload coarse levels and hottest tiles from access log(s) at startup')
+    args = parser.parse_args()
+
+    if not Path(args.root).is_dir():
+        print(f"❌ Error: Directory not found: {args.root}")
+        sys.exit(1)
+
+    import tile_access
+
+    access_log = tile_access.AccessLog(args.access_log) if args.access_log else None
+    server = TileServer((args.bind, args.port), args.root, args.cache_size, access_log)
+    print(f"🌐 Serving {server.root} on http://localhost:{args.port}/")
+    print(f"   IIIF: http://localhost:{args.port}/iiif/<name>/info.json")
+    if access_log:
+        print(f"   Access log: {args.access_log}")
+    print(f"   Press Ctrl+C to stop")
+
+    warm_logs = [path for path in args.warm if Path(path).exists()]
+    if warm_logs:
+        def warm():
+            start = time.time()
+            tiles = tile_access.warm_tiles(tile_access.aggregate(tile_access.read_logs(warm_logs)),
+                                           server.dzi_dir)
+            count, loaded = server.warm(tiles)
+            print(f"🔥 Warmed {count:,} tiles ({loaded / 1024 ** 2:.1f} MB) "
+                  f"in {time.time() - start:.1f}s", flush=True)
+        # Serve right away; requests meanwhile fill the cache as usual
+        threading.Thread(target=warm, daemon=True).start()
+    # Stop on SIGTERM (kill, systemd, docker stop) as on Ctrl+C, so the
+    # access log is flushed and closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        server.server_close()
+        if access_log:
+            access_log.close()
+
+if __name__ == '__main__':
+    main()
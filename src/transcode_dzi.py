@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Re-encode an existing DZI pyramid to another tile codec or quality
+
+Works from the tiles alone, so the original source is not needed: each
+<name>_files/<level>/<col>_<row> tile is decoded and re-encoded in a
+process pool into a hidden staging tree. The tree is then swapped in with
+one rename and the .dzi Format attribute rewritten. Nothing is resampled,
+so this is far faster than converting the source again. Each generation
+of lossy re-encoding loses a little quality; going down in quality (Q95
+to Q80) or to a more efficient codec is the intended use.
+
+Multi-frame series (<name>_series.json) are transcoded frame by frame and
+their shared tile pool is rebuilt afterwards.
+
+Usage:
+    python3 transcode_dzi.py scan --codec webp
+    python3 transcode_dzi.py scan --quality 80
+    python3 transcode_dzi.py cardiac --codec webp --quality 75 --workers 8
+"""
+
+import sys
+import json
+import os
+import shutil
+import signal
+import time
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import memory_budget
+import tile_codecs
+import tile_dedup
+
+# Tiles handed to a worker at a time
+BATCH_SIZE = 256
+
+def _init_worker():
+    """One libvips thread and no operation cache per process; tiles are tiny"""
+    import pyvips
+
+    # Ctrl+C and timeout signal the whole process group; the parent stops
+    # the pool and cleans up, so workers just finish their batch
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    pyvips.cache_set_max(0)
+    if hasattr(pyvips, 'concurrency_set'):
+        pyvips.concurrency_set(1)
+
+def _transcode_batch(job):
+    """
+    Re-encode a batch of tiles of one level (runs in a worker process)
+
+    Returns:
+        (tiles, bytes read, bytes written)
+    """
+    import pyvips
+
+    paths, output_dir, suffix, flatten = job
+    bytes_in = bytes_out = 0
+    for path in paths:
+        image = pyvips.Image.new_from_file(path, access='sequential')
+        if flatten and image.hasalpha():
+            image = image.flatten(background=[255])
+        stem = os.path.splitext(os.path.basename(path))[0]
+        target = os.path.join(output_dir, stem + suffix.split('[', 1)[0])
+        image.write_to_file(os.path.join(output_dir, stem + suffix))
+        bytes_in += os.path.getsize(path)
+        bytes_out += os.path.getsize(target)
+    return len(paths), bytes_in, bytes_out
+
+def _exit_on_sigterm(signum, frame):
+    """Unwind on SIGTERM (timeout, kill) as on Ctrl+C, so staging is removed"""
+    # Only once: timeout signals the process again while it cleans up
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(128 + signum)
+
+def transcode_pyramid(dzi_path, codec, quality=90, workers=None, pool=None):
+    """
+    Re-encode every tile of one pyramid and swap the new tree in
+
+    Args:
+        dzi_path: Path to the .dzi descriptor
+        codec: Target codec, see tile_codecs.CODECS
+        quality: Target quality for the lossy codecs
+        workers: Worker processes (default: CPU count)
+        pool: Existing ProcessPoolExecutor to reuse (series conversions)
+
+    Returns:
+        dict with tiles, bytes_in and bytes_out
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    dzi_path = Path(dzi_path)
+    info = dzi_pyramid.read_dzi(dzi_path)
+    base_path = dzi_path.with_suffix('')
+    tiles_dir = base_path.with_name(f"{base_path.name}_files")
+    staging = base_path.with_name(f".{base_path.name}_transcoding")
+    staged_files = staging / tiles_dir.name
+    source_ext = f".{info['format']}"
+    suffix = tile_codecs.tile_suffix(codec, quality)
+    flatten = codec == 'jpeg'
+
+    if staging.exists():
+        shutil.rmtree(staging)
+    jobs = []
+    for level_dir in sorted(tiles_dir.iterdir(), key=lambda p: p.name):
+        if not level_dir.is_dir():
+            continue
+        output_dir = staged_files / level_dir.name
+        output_dir.mkdir(parents=True)
+        paths = sorted(str(p) for p in level_dir.iterdir() if p.suffix == source_ext)
+        for start in range(0, len(paths), BATCH_SIZE):
+            jobs.append((paths[start:start + BATCH_SIZE], str(output_dir), suffix, flatten))
+
+    stats = {'tiles': 0, 'bytes_in': 0, 'bytes_out': 0}
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                   initializer=_init_worker,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for tiles, bytes_in, bytes_out in pool.map(_transcode_batch, jobs):
+            stats['tiles'] += tiles
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+
+        # Publish: tree first, then the descriptor that names the new format
+        dzi_pyramid.replace_dir(staged_files, tiles_dir)
+        dzi_pyramid.write_dzi(dzi_path, info['width'], info['height'], info['tile_size'],
+                              info['overlap'], tile_codecs.CODECS[codec]['format'])
+    finally:
+        if own_pool:
+            pool.shutdown()
+        shutil.rmtree(staging, ignore_errors=True)
+    return stats
+
+def transcode_series(series_file, codec, quality=90, workers=None):
+    """
+    Transcode every frame of a series and rebuild its tile pool
+
+    Returns:
+        dict with tiles, bytes_in and bytes_out summed over the frames
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    series_file = Path(series_file)
+    with open(series_file) as f:
+        series = json.load(f)
+    output_dir, base_name = series_file.parent, series['base_name']
+
+    stats = {'tiles': 0, 'bytes_in': 0, 'bytes_out': 0}
+    # Spawned, not forked: main() has already run libvips (the codec probe),
+    # and forked children deadlock in its thread pool
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                             initializer=_init_worker,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        for index in range(series['total_frames']):
+            dzi_path = output_dir / f"{base_name}_frame_{index:04d}.dzi"
+            if not dzi_path.exists():
+                continue
+            frame_stats = transcode_pyramid(dzi_path, codec, quality, pool=pool)
+            for key in stats:
+                stats[key] += frame_stats[key]
+            if (index + 1) % 50 == 0:
+                print(f"   ✅ Transcoded {index + 1}/{series['total_frames']} frames...")
+
+    # The old pool only holds tiles of the previous encoding now
+    pool_dir = tile_dedup.pool_dir(output_dir, base_name)
+    if pool_dir.exists():
+        shutil.rmtree(pool_dir)
+    for index in range(series['total_frames']):
+        tiles_dir = output_dir / f"{base_name}_frame_{index:04d}_files"
+        if tiles_dir.exists() and not tile_dedup.add_tree(pool_dir, tiles_dir):
+            break
+    series['quality'] = quality
+    series['dedup'] = tile_dedup.series_summary(output_dir, base_name, series['total_frames'])
+    tmp_path = series_file.with_name(series_file.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(series, f, indent=2)
+    os.replace(tmp_path, series_file)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Re-encode an existing DZI pyramid or series to another codec or quality',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 transcode_dzi.py scan --codec webp
+  python3 transcode_dzi.py scan --quality 80
+  python3 transcode_dzi.py cardiac --codec webp --quality 75 --workers 8
+        """
+    )
+    parser.add_argument('name', help='Pyramid or series name in ../output/dzi (or a .dzi path)')
+    parser.add_argument('--codec', choices=list(tile_codecs.CODECS),
+                       help='Target codec (default: keep the current one)')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='Target quality 1-100 (default: 90)')
+    parser.add_argument('--workers', type=int, metavar='N',
+                       help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print("❌ Error: Quality must be between 1 and 100")
+        sys.exit(1)
+
+    dzi_path = Path(args.name)
+    if dzi_path.suffix != '.dzi':
+        dzi_path = Path('../output/dzi') / f"{args.name}.dzi"
+    series_file = dzi_path.with_name(f"{dzi_path.stem}_series.json")
+    raw_file = dzi_path.with_name(f"{dzi_path.stem}_raw.json")
+
+    if series_file.exists():
+        with open(series_file) as f:
+            series = json.load(f)
+        first = dzi_path.with_name(f"{series['base_name']}_frame_0000.dzi")
+        current = dzi_pyramid.read_dzi(first)['format'] if first.exists() else 'jpg'
+        is_raw = 'raw' in series
+    elif dzi_path.exists():
+        current = dzi_pyramid.read_dzi(dzi_path)['format']
+        is_raw = raw_file.exists()
+    else:
+        print(f"❌ Error: No pyramid or series named {args.name}")
+        sys.exit(1)
+
+    codec = args.codec or tile_codecs.codec_for_format(current)
+    # Raw tiles pack 16-bit values into bytes; lossy coding would scramble them
+    if is_raw and codec != 'png':
+        print("❌ Error: Raw (full-bit-depth) tiles can only be stored as png")
+        sys.exit(1)
+    if not tile_codecs.codec_available(codec):
+        print(f"❌ Error: This libvips build cannot encode {codec} tiles")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print(f"Transcoding: {args.name} ({current} → {codec}, quality {args.quality})")
+    print(f"{'='*60}\n")
+
+    start_time = time.time()
+    previous_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    try:
+        if series_file.exists():
+            stats = transcode_series(series_file, codec, args.quality, args.workers)
+        else:
+            stats = transcode_pyramid(dzi_path, codec, args.quality, args.workers)
+    except Exception as e:
+        print(f"\n❌ Error during transcoding: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+    elapsed = time.time() - start_time
+    print(f"✅ Transcoding complete!")
+    print(f"   Tiles: {stats['tiles']:,} ({stats['tiles'] / max(elapsed, 1e-6):,.0f} tiles/s)")
+    print(f"   Size: {memory_budget.format_bytes(stats['bytes_in'])} → "
+          f"{memory_budget.format_bytes(stats['bytes_out'])}")
+    if stats['bytes_in']:
+        print(f"   Ratio: {stats['bytes_out'] / stats['bytes_in']:.2f}x")
+    print(f"   Time: {elapsed:.1f}s")
+    sys.exit(0)
+
+if __name__ == '__main__':
+    main()
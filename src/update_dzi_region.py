@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Re-tile only the part of an existing DZI pyramid whose source changed
+
+Re-renders the full-resolution tiles that intersect a changed rectangle
+plus their ancestors on every coarser level, instead of regenerating the
+whole pyramid. Only the source under the changed tiles is decoded, widened
+to the footprint of a coarser level's tiles while that stays within
+EXACT_AREA_PIXELS. Coarser tiles are rebuilt by halving that decoded area
+with the box filter dzsave uses, so they match a full build and repeated
+updates do not stack JPEG loss; only beyond it are the finer tiles halved.
+The rectangle is given explicitly or found by diffing the new source
+against the previous one.
+
+Each tile is replaced atomically, but the tree is not: while an update is
+published a viewer can load new tiles on one level and old ones on another.
+
+Usage:
+    python3 update_dzi_region.py scan_v2.tiff scan --region 12000,8000,2048,2048
+    python3 update_dzi_region.py scan_v2.tiff scan --previous scan_v1.tiff
+    python3 update_dzi_region.py scan.tiff scan --repair scan_repair.json
+"""
+
+import sys
+import os
+import shutil
+import time
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+import tile_codecs
+
+# Source pixels decoded beyond the changed tiles so the coarser ancestors
+# come out as a full build makes them (about 100 MB of RGB)
+EXACT_AREA_PIXELS = 32 * 1024 ** 2
+
+def find_changed_region(image, previous):
+    """
+    Bounding box of pixels that differ between two images of equal size
+
+    Returns:
+        (x, y, width, height) tuple, or None if the images are identical
+    """
+    if (image.width, image.height, image.bands) != (previous.width, previous.height, previous.bands):
+        raise ValueError(
+            f"Previous source is {previous.width}×{previous.height}×{previous.bands}, "
+            f"new source is {image.width}×{image.height}×{image.bands}"
+        )
+    mask = (image != previous)
+    if mask.bands > 1:
+        mask = mask.bandor()
+    if mask.max() == 0:
+        return None
+    left, top, width, height = mask.find_trim(threshold=0, background=[0])
+    return left, top, width, height
+
+def parse_region(text):
+    """Parse an X,Y,W,H rectangle from the command line"""
+    parts = [int(p) for p in text.split(',')]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0:
+        raise argparse.ArgumentTypeError("Region must be X,Y,WIDTH,HEIGHT with positive size")
+    return tuple(parts)
+
+def load_repair_regions(repair_path, dzi_path):
+    """
+    Damaged regions of one pyramid from a verify_dzi.py --repair-list file
+
+    Returns:
+        list of (x, y, width, height) tuples, or None if the file has no
+        entry for this pyramid
+    """
+    import json
+
+    with open(repair_path) as f:
+        repairs = json.load(f)
+    for entry in repairs['pyramids']:
+        if Path(entry['dzi']).resolve() == Path(dzi_path).resolve():
+            return [tuple(region) for region in entry['regions']]
+    return None
+
+def _finer_area(staged, staged_dir, live_dir, tile_format, x, y, width, height,
+                tile_size, overlap, level_width, level_height):
+    """
+    Join the finer-level tiles (staged ones first) covering a rectangle
+
+    Each tile contributes its pixels without overlap, so the result is the
+    rectangle of the finer level exactly.
+    """
+    import pyvips
+
+    first_col, last_col = x // tile_size, (x + width - 1) // tile_size
+    first_row, last_row = y // tile_size, (y + height - 1) // tile_size
+    images = []
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            name = f"{col}_{row}.{tile_format}"
+            path = staged_dir / name if (staged_dir / name) in staged else live_dir / name
+            tile_x, tile_y, _, _ = dzi_pyramid.tile_bounds(col, row, tile_size, overlap,
+                                                         level_width, level_height)
+            # From the bytes: libvips caches new_from_file by name, and an
+            # earlier update in this process (--repair) may have replaced it
+            images.append(pyvips.Image.new_from_buffer(path.read_bytes(), '').crop(
+                col * tile_size - tile_x, row * tile_size - tile_y,
+                min(tile_size, level_width - col * tile_size),
+                min(tile_size, level_height - row * tile_size)))
+    area = pyvips.Image.arrayjoin(images, across=last_col - first_col + 1)
+    return area.crop(x - first_col * tile_size, y - first_row * tile_size, width, height)
+
+def _halve(image):
+    """
+    2×2 box downsample of an image with even width and height
+
+    Rounds the sum of each block once, (sum + 2) >> 2, as dzsave does;
+    shrink() averages each axis in turn and rounds twice.
+    """
+    wide = image.cast('uint')
+    total = sum(wide.embed(-dx, -dy, image.width, image.height).subsample(2, 2)
+                for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)))
+    return ((total + 2) >> 2).cast(image.format)
+
+def _decode_bounds(x, y, width, height, image_width, image_height, tile_size, overlap):
+    """
+    Source rectangle to decode for an update
+
+    The footprint of the tiles over the change on the coarsest level whose
+    footprint fits EXACT_AREA_PIXELS; always at least the full-resolution
+    tiles. Footprints are aligned to that level's pixels, so halving the
+    area reproduces every level down to it exactly.
+
+    Returns:
+        (x, y, width, height) in full-resolution pixels
+    """
+    top_level = dzi_pyramid.max_level(image_width, image_height)
+    bounds = None
+    for level in range(top_level, -1, -1):
+        level_width, level_height = dzi_pyramid.level_dimensions(image_width, image_height, level)
+        col_range, row_range = dzi_pyramid.tiles_in_region(
+            *dzi_pyramid.level_region(x, y, width, height, level, top_level),
+            level_width, level_height, tile_size, overlap)
+        left, top, _, _ = dzi_pyramid.tile_bounds(col_range[0], row_range[0], tile_size,
+                                                  overlap, level_width, level_height)
+        right, bottom, right_w, bottom_h = dzi_pyramid.tile_bounds(
+            col_range[-1], row_range[-1], tile_size, overlap, level_width, level_height)
+        scale = 2 ** (top_level - level)
+        x0, y0 = left * scale, top * scale
+        x1 = min(image_width, (right + right_w) * scale)
+        y1 = min(image_height, (bottom + bottom_h) * scale)
+        if bounds is not None and (x1 - x0) * (y1 - y0) > EXACT_AREA_PIXELS:
+            break
+        bounds = (x0, y0, x1 - x0, y1 - y0)
+    return bounds
+
+def _halve_decoded(decoded, finer_width, finer_height, level_width, level_height):
+    """
+    Halve the decoded source area down one level
+
+    Only level pixels whose whole 2×2 block lies in the finer area are
+    kept (at the image edge the block repeats its last pixel, as dzsave
+    does), so the result is exactly what a full build has there.
+
+    Returns:
+        (x, y, image) in level coordinates, or None once nothing is left
+    """
+    if decoded is None:
+        return None
+    finer_x, finer_y, finer = decoded
+    x0, y0 = -(-finer_x // 2), -(-finer_y // 2)
+    right, bottom = finer_x + finer.width, finer_y + finer.height
+    x1 = level_width if right == finer_width else right // 2
+    y1 = level_height if bottom == finer_height else bottom // 2
+    if x1 <= x0 or y1 <= y0:
+        return None
+    block = finer.crop(2 * x0 - finer_x, 2 * y0 - finer_y,
+                       min(2 * (x1 - x0), right - 2 * x0), min(2 * (y1 - y0), bottom - 2 * y0))
+    if (block.width, block.height) != (2 * (x1 - x0), 2 * (y1 - y0)):
+        block = block.embed(0, 0, 2 * (x1 - x0), 2 * (y1 - y0), extend='copy')
+    return x0, y0, _halve(block).copy_memory()
+
+def update_region(input_path, dzi_path, region=None, previous_path=None, quality=90):
+    """
+    Re-render the tiles of an existing pyramid that cover a changed region
+
+    The source is read once, sequentially, down to the bottom of the
+    decoded area (see _decode_bounds); the full-resolution tiles over the
+    region are cut from it and every coarser tile is built by halving it.
+    Where a coarser tile reaches past that area, the finer tiles under it
+    (just re-rendered, or live) are halved instead. The cost follows the
+    region's size rather than the image's.
+
+    New tiles are encoded into a staging directory first; the live tree is
+    only touched once every tile has been written. Updates are atomic per
+    tile, not per tree: each tile is swapped in with an atomic rename so
+    viewers never read a partial file, but a viewer loading tiles during
+    the swap can mix old and new tiles across levels.
+
+    Args:
+        input_path: Updated source image (same dimensions as the pyramid)
+        dzi_path: Existing .dzi descriptor
+        region: (x, y, width, height) changed rectangle at full resolution
+        previous_path: Previous source to diff against when region is None
+        quality: JPEG quality 1-100 for the re-rendered tiles
+
+    Returns:
+        True if successful, False otherwise
+    """
+    import pyvips
+
+    input_path = Path(input_path)
+    dzi_path = Path(dzi_path)
+    tiles_dir = dzi_path.with_name(f"{dzi_path.stem}_files")
+    staging = dzi_path.with_name(f".{dzi_path.stem}_update")
+
+    for path in (input_path, dzi_path, tiles_dir):
+        if not path.exists():
+            print(f"❌ Error: Not found: {path}")
+            return False
+
+    info = dzi_pyramid.read_dzi(dzi_path)
+    tile_size, overlap, tile_format = info['tile_size'], info['overlap'], info['format']
+
+    print(f"\n{'='*60}")
+    print(f"Updating region of: {dzi_path.name}")
+    print(f"Source: {input_path.name}")
+    print(f"{'='*60}\n")
+
+    try:
+        start_time = time.time()
+        image = pyvips.Image.new_from_file(str(input_path))
+        if (image.width, image.height) != (info['width'], info['height']):
+            print(f"❌ Error: Source is {image.width:,} × {image.height:,} but the pyramid is "
+                  f"{info['width']:,} × {info['height']:,}")
+            print(f"   Size changes need a full conversion")
+            return False
+
+        if region is None:
+            if previous_path is None:
+                print(f"❌ Error: Give either --region or --previous")
+                return False
+            print(f"🔍 Diffing against {Path(previous_path).name}...")
+            previous = pyvips.Image.new_from_file(str(previous_path))
+            region = find_changed_region(image, previous)
+            if region is None:
+                print(f"✅ No pixels changed - nothing to do")
+                return True
+
+        x, y, width, height = region
+        x, y = max(0, x), max(0, y)
+        width = min(width, image.width - x)
+        height = min(height, image.height - y)
+        if width <= 0 or height <= 0:
+            print(f"❌ Error: Region {region} lies outside the image")
+            return False
+
+        print(f"📐 Changed region: {width:,} × {height:,} at ({x:,}, {y:,})")
+        print(f"   {100 * width * height / (image.width * image.height):.2f}% of the image")
+
+        if staging.exists():
+            shutil.rmtree(staging)
+
+        top_level = dzi_pyramid.max_level(image.width, image.height)
+        total_tiles = dzi_pyramid.count_tiles(image.width, image.height, tile_size)
+        save_suffix = tile_codecs.tile_suffix(tile_codecs.codec_for_format(tile_format), quality)
+        pending = []
+        staged = set()
+
+        def stage(level, col, row, tile):
+            level_staging = staging / str(level)
+            level_staging.mkdir(parents=True, exist_ok=True)
+            name = f"{col}_{row}.{tile_format}"
+            tile.write_to_file(str(level_staging / f"{col}_{row}{save_suffix}"))
+            pending.append((level_staging / name, tiles_dir / str(level) / name))
+            staged.add(level_staging / name)
+
+        # Full resolution: cut the tiles from one decoded crop of the source
+        col_range, row_range = dzi_pyramid.tiles_in_region(
+            x, y, width, height, image.width, image.height, tile_size, overlap)
+        area_x, area_y, area_w, area_h = _decode_bounds(x, y, width, height, image.width,
+                                                        image.height, tile_size, overlap)
+        source = pyvips.Image.new_from_file(str(input_path), access='sequential')
+        area = source.crop(area_x, area_y, area_w, area_h)
+        if area.hasalpha() and tile_format in ('jpg', 'jpeg'):
+            area = area.flatten(background=[255])
+        area = area.copy_memory()
+        for row in row_range:
+            for col in col_range:
+                tile_x, tile_y, tile_w, tile_h = dzi_pyramid.tile_bounds(
+                    col, row, tile_size, overlap, image.width, image.height)
+                stage(top_level, col, row, area.crop(tile_x - area_x, tile_y - area_y, tile_w, tile_h))
+
+        # Coarser levels: halve the finer tiles under each tile with the
+        # same 2×2 box filter dzsave uses; an odd edge repeats its last
+        # pixel, as dzsave does, so the round-up sizes match. Where the
+        # decoded area still reaches, its own halving replaces those pixels,
+        # so they carry no JPEG loss from the finer tiles
+        decoded = (area_x, area_y, area)
+        for level in range(top_level - 1, -1, -1):
+            level_width, level_height = dzi_pyramid.level_dimensions(image.width, image.height, level)
+            finer_width, finer_height = dzi_pyramid.level_dimensions(image.width, image.height,
+                                                                     level + 1)
+            decoded = _halve_decoded(decoded, finer_width, finer_height, level_width, level_height)
+            region_at_level = dzi_pyramid.level_region(x, y, width, height, level, top_level)
+            col_range, row_range = dzi_pyramid.tiles_in_region(
+                *region_at_level, level_width, level_height, tile_size, overlap)
+            for row in row_range:
+                for col in col_range:
+                    tile_x, tile_y, tile_w, tile_h = dzi_pyramid.tile_bounds(
+                        col, row, tile_size, overlap, level_width, level_height)
+                    finer_x, finer_y = 2 * tile_x, 2 * tile_y
+                    finer_w = min(2 * tile_w, finer_width - finer_x)
+                    finer_h = min(2 * tile_h, finer_height - finer_y)
+                    finer = _finer_area(staged, staging / str(level + 1), tiles_dir / str(level + 1),
+                                        tile_format, finer_x, finer_y, finer_w, finer_h,
+                                        tile_size, overlap, finer_width, finer_height)
+                    if (finer_w, finer_h) != (2 * tile_w, 2 * tile_h):
+                        finer = finer.embed(0, 0, 2 * tile_w, 2 * tile_h, extend='copy')
+                    tile = _halve(finer)
+                    if decoded is not None:
+                        decoded_x, decoded_y, decoded_image = decoded
+                        tile = tile.insert(decoded_image, decoded_x - tile_x, decoded_y - tile_y)
+                    stage(level, col, row, tile)
+
+        # Publish: nothing in the live tree changes until every tile encoded
+        for staged, live in pending:
+            live.parent.mkdir(exist_ok=True)   # A level lost entirely (verify_dzi repairs)
+            os.replace(staged, live)
+        shutil.rmtree(staging, ignore_errors=True)
+        # Tiles changed under an unchanged .dzi; touch it so caches keyed on
+        # the descriptor (tile_server's IIIF responses) drop the old pixels
+        os.utime(dzi_path)
+
+        elapsed = time.time() - start_time
+        print(f"\n✅ Update complete!")
+        print(f"   Re-rendered: {len(pending):,} of {total_tiles:,} tiles "
+              f"({100 * len(pending) / total_tiles:.2f}%)")
+        print(f"   Levels: 0-{top_level}")
+        print(f"   Time: {elapsed:.1f}s")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Error during update: {e}")
+        import traceback
+        traceback.print_exc()
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Re-tile the changed region of an existing DZI pyramid',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 update_dzi_region.py scan_v2.tiff scan --region 12000,8000,2048,2048
+  python3 update_dzi_region.py scan_v2.tiff scan --previous scan_v1.tiff
+  python3 update_dzi_region.py scan.tiff scan --repair scan_repair.json
+        """
+    )
+
+    parser.add_argument('input', help='Updated source image')
+    parser.add_argument('output_name', help='Name of the existing pyramid in ../output/dzi (or a .dzi path)')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--region', type=parse_region, metavar='X,Y,W,H',
+                       help='Changed rectangle in full-resolution pixels')
+    group.add_argument('--previous', metavar='FILE',
+                       help='Previous source image; the changed region is found by diffing')
+    group.add_argument('--repair', metavar='FILE',
+                       help='Repair list from verify_dzi.py; re-tiles every damaged region')
+    parser.add_argument('--quality', type=int, default=90,
+                       help='JPEG quality 1-100 (default: 90)')
+
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print("❌ Error: Quality must be between 1 and 100")
+        sys.exit(1)
+
+    dzi_path = Path(args.output_name)
+    if dzi_path.suffix != '.dzi':
+        dzi_path = Path('../output/dzi') / f"{args.output_name}.dzi"
+
+    if args.repair:
+        regions = load_repair_regions(args.repair, dzi_path)
+        if regions is None:
+            print(f"❌ Error: {args.repair} lists no damage for {dzi_path}")
+            sys.exit(1)
+        print(f"🩹 Repairing {len(regions)} region(s) from {args.repair}")
+        success = all(update_region(args.input, dzi_path, region, quality=args.quality)
+                      for region in regions)
+    else:
+        success = update_region(args.input, dzi_path, args.region, args.previous, args.quality)
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Verify that a DZI pyramid's tile tree is complete and readable
+
+The expected tiles are derived from the .dzi Size, TileSize and Overlap,
+so nothing but the descriptor has to be trusted. Each level directory is
+listed once with os.scandir (levels in parallel threads) and every entry
+is checked against the tile grid: missing and empty tiles, stray files
+and, for a sparse pyramid, the uniform tiles its index says were skipped.
+
+Optionally each tile is opened in a process pool: `--decode header`
+checks the file trailer and that the pixel dimensions match the grid,
+`--decode full` decodes every pixel. Damaged tiles are written to a
+repair list of full-resolution regions that update_dzi_region.py
+--repair re-tiles from the source.
+
+Usage:
+    python3 verify_dzi.py scan
+    python3 verify_dzi.py scan --decode header --workers 8
+    python3 verify_dzi.py scan --decode full --repair-list scan_repair.json
+    python3 verify_dzi.py cardiac              # every frame of a series
+"""
+
+import sys
+import json
+import os
+import time
+from pathlib import Path
+import argparse
+
+import dzi_pyramid
+
+# Tiles handed to a decode worker at a time
+BATCH_SIZE = 512
+
+# Above this many damaged regions the repair list is one bounding box
+MAX_REGIONS = 256
+
+# Per-tile states while a level is scanned
+EXPECTED, PRESENT, SKIPPED = 0, 1, 2
+
+def sparse_levels(base_path):
+    """
+    Tiles a sparse build left out, from <base>_sparse.json
+
+    Returns:
+        dict mapping level to a list of (start, count) runs of row-major
+        tile indices, empty for a full pyramid
+    """
+    index_path = dzi_pyramid.sparse_index_path(base_path)
+    if not index_path.exists():
+        return {}
+    with open(index_path) as f:
+        index = json.load(f)
+    return {int(level): [(start, count) for start, count, _ in runs]
+            for level, runs in index['levels'].items()}
+
+def scan_level(level_dir, level, cols, rows, tile_format, skipped_runs):
+    """
+    Check one level directory against its tile grid
+
+    Returns:
+        (problems, present) where problems is a list of
+        (level, col, row, reason) and present a list of (col, row, path)
+        for the tiles that exist
+    """
+    state = bytearray(cols * rows)
+    for start, count in skipped_runs:
+        state[start:start + count] = bytes([SKIPPED]) * count
+
+    problems, present = [], []
+    extension = f".{tile_format}"
+    try:
+        entries = os.scandir(level_dir)
+    except FileNotFoundError:
+        entries = None
+    if entries is not None:
+        with entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                col, _, row = stem.partition('_')
+                if ext != extension or not (col.isdigit() and row.isdigit()) \
+                        or int(col) >= cols or int(row) >= rows:
+                    problems.append((level, None, None, f"unexpected file {entry.name}"))
+                    continue
+                col, row = int(col), int(row)
+                state[row * cols + col] = PRESENT
+                if entry.stat().st_size == 0:
+                    problems.append((level, col, row, 'empty'))
+                else:
+                    present.append((col, row, entry.path))
+
+    # Everything never seen and not skipped by a sparse build is missing
+    start = state.find(EXPECTED)
+    while start != -1:
+        problems.append((level, start % cols, start // cols, 'missing'))
+        start = state.find(EXPECTED, start + 1)
+    return problems, present
+
+def _init_worker():
+    """One libvips thread and no operation cache per process; tiles are tiny"""
+    import pyvips
+
+    pyvips.cache_set_max(0)
+    if hasattr(pyvips, 'concurrency_set'):
+        pyvips.concurrency_set(1)
+
+def _decode_batch(job):
+    """
+    Open a batch of tiles of one level (runs in a worker process)
+
+    Returns:
+        list of (level, col, row, reason) for the tiles that fail
+    """
+    import pyvips
+
+    level, tiles, full = job
+    problems = []
+    for col, row, path, width, height in tiles:
+        if not dzi_pyramid.tile_looks_complete(path):
+            problems.append((level, col, row, 'truncated'))
+            continue
+        try:
+            image = pyvips.Image.new_from_file(path, access='sequential', fail=full)
+            if (image.width, image.height) != (width, height):
+                problems.append((level, col, row,
+                                 f"{image.width}×{image.height}, expected {width}×{height}"))
+            elif full:
+                image.avg()
+        except pyvips.Error as e:
+            problems.append((level, col, row, f"unreadable: {str(e).splitlines()[0]}"))
+    return problems
+
+def verify_pyramid(dzi_path, decode=None, workers=None, pool=None):
+    """
+    Check every tile of one pyramid
+
+    Args:
+        dzi_path: Path to the .dzi descriptor
+        decode: None (presence and size only), 'header' or 'full'
+        workers: Scan threads and decode processes (default: CPU count)
+        pool: Existing ProcessPoolExecutor to reuse (series)
+
+    Returns:
+        dict with info, expected, present, skipped and problems, a list of
+        (level, col, row, reason); col and row are None for stray files
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    dzi_path = Path(dzi_path)
+    info = dzi_pyramid.read_dzi(dzi_path)
+    base_path = dzi_path.with_suffix('')
+    tiles_dir = base_path.with_name(f"{base_path.name}_files")
+    width, height, tile_size, overlap = info['width'], info['height'], info['tile_size'], info['overlap']
+    skipped = sparse_levels(base_path)
+    workers = workers or os.cpu_count() or 1
+
+    levels = []
+    for level in range(dzi_pyramid.max_level(width, height) + 1):
+        level_width, level_height = dzi_pyramid.level_dimensions(width, height, level)
+        levels.append((level, level_width, level_height,
+                       *dzi_pyramid.tile_grid(level_width, level_height, tile_size)))
+
+    result = {'info': info, 'expected': 0, 'present': 0, 'problems': [],
+              'skipped': sum(count for runs in skipped.values() for _, count in runs)}
+    jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as threads:
+        scans = [threads.submit(scan_level, tiles_dir / str(level), level, cols, rows,
+                                info['format'], skipped.get(level, ()))
+                 for level, _, _, cols, rows in levels]
+        for (level, level_width, level_height, cols, rows), scan in zip(levels, scans):
+            problems, present = scan.result()
+            result['expected'] += cols * rows
+            result['present'] += len(present)
+            result['problems'].extend(problems)
+            if decode:
+                tiles = [(col, row, path,
+                          *dzi_pyramid.tile_bounds(col, row, tile_size, overlap,
+                                                   level_width, level_height)[2:])
+                         for col, row, path in present]
+                for start in range(0, len(tiles), BATCH_SIZE):
+                    jobs.append((level, tiles[start:start + BATCH_SIZE], decode == 'full'))
+
+    if jobs:
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        try:
+            for problems in pool.map(_decode_batch, jobs):
+                result['problems'].extend(problems)
+        finally:
+            if own_pool:
+                pool.shutdown()
+    return result
+
+def merge_regions(rects):
+    """Union overlapping or touching (x, y, width, height) rectangles"""
+    rects = sorted(rects)
+    merged = True
+    while merged:
+        merged, output = False, []
+        for x, y, w, h in rects:
+            for index, (ox, oy, ow, oh) in enumerate(output):
+                if x <= ox + ow and ox <= x + w and y <= oy + oh and oy <= y + h:
+                    x0, y0 = min(x, ox), min(y, oy)
+                    output[index] = (x0, y0, max(x + w, ox + ow) - x0, max(y + h, oy + oh) - y0)
+                    merged = True
+                    break
+            else:
+                output.append((x, y, w, h))
+        rects = output
+    return rects
+
+def repair_regions(info, problems):
+    """
+    Full-resolution rectangles whose re-tiling replaces the damaged tiles
+
+    Each tile's core area (without overlap) is scaled up to the full image;
+    re-tiling it re-renders that tile on its own level and every other.
+    """
+    width, height, tile_size = info['width'], info['height'], info['tile_size']
+    top_level = dzi_pyramid.max_level(width, height)
+    rects = set()
+    for level, col, row, _ in problems:
+        if col is None:
+            continue
+        scale = 2 ** (top_level - level)
+        x, y = col * tile_size * scale, row * tile_size * scale
+        rects.add((x, y, min(tile_size * scale, width - x), min(tile_size * scale, height - y)))
+    if len(rects) > MAX_REGIONS:
+        x0, y0 = min(r[0] for r in rects), min(r[1] for r in rects)
+        x1, y1 = max(r[0] + r[2] for r in rects), max(r[1] + r[3] for r in rects)
+        return [(x0, y0, x1 - x0, y1 - y0)]
+    return merge_regions(rects)
+
+def pyramid_paths(name):
+    """The .dzi files behind a name: one pyramid, or every frame of a series"""
+    dzi_path = Path(name)
+    if dzi_path.suffix != '.dzi':
+        dzi_path = Path('../output/dzi') / f"{name}.dzi"
+    series_file = dzi_path.with_name(f"{dzi_path.stem}_series.json")
+    if series_file.exists():
+        with open(series_file) as f:
+            series = json.load(f)
+        return [dzi_path.with_name(f"{series['base_name']}_frame_{index:04d}.dzi")
+                for index in range(series['total_frames'])]
+    return [dzi_path]
+
+def main():
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(
+        description='Verify a DZI pyramid (or series) is complete and readable',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python3 verify_dzi.py scan
+  python3 verify_dzi.py scan --decode header --workers 8
+  python3 verify_dzi.py scan --decode full --repair-list scan_repair.json
+  python3 update_dzi_region.py scan.tiff scan --repair scan_repair.json
+        """
+    )
+    parser.add_argument('name', help='Pyramid or series name in ../output/dzi (or a .dzi path)')
+    parser.add_argument('--decode', choices=['header', 'full'],
+                       help='Also open each tile: header checks trailer and size, full decodes pixels')
+    parser.add_argument('--workers', type=int, metavar='N',
+                       help='Scan threads and decode processes (default: CPU count)')
+    parser.add_argument('--repair-list', metavar='FILE',
+                       help='Write damaged regions as JSON for update_dzi_region.py --repair')
+    args = parser.parse_args()
+
+    paths = pyramid_paths(args.name)
+    missing = [path for path in paths if not path.exists()]
+    if len(missing) == len(paths):
+        print(f"❌ Error: No pyramid or series named {args.name}")
+        sys.exit(1)
+
+    print(f"🔍 Verifying {args.name} ({len(paths)} pyramid(s), "
+          f"{'presence and size' if not args.decode else args.decode + ' decode'})")
+    start_time = time.time()
+    repairs, totals = [], {'expected': 0, 'present': 0, 'skipped': 0, 'problems': 0}
+    pool = None
+    if args.decode:
+        pool = ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1,
+                                   initializer=_init_worker)
+    try:
+        for dzi_path in paths:
+            if not dzi_path.exists():
+                print(f"   ❌ {dzi_path.name}: descriptor missing")
+                totals['problems'] += 1
+                continue
+            result = verify_pyramid(dzi_path, args.decode, args.workers, pool)
+            for key in ('expected', 'present', 'skipped'):
+                totals[key] += result[key]
+            totals['problems'] += len(result['problems'])
+            if not result['problems']:
+                continue
+            print(f"   ❌ {dzi_path.name}: {len(result['problems']):,} problem(s)")
+            for level, col, row, reason in result['problems'][:10]:
+                where = f"{level}/{col}_{row}" if col is not None else f"{level}/"
+                print(f"      {where}: {reason}")
+            if len(result['problems']) > 10:
+                print(f"      ... and {len(result['problems']) - 10:,} more")
+            repairs.append({
+                'dzi': str(dzi_path),
+                'tiles': [[level, col, row, reason] for level, col, row, reason in result['problems']
+                          if col is not None],
+                'regions': [list(r) for r in repair_regions(result['info'], result['problems'])],
+            })
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.time() - start_time
+    print(f"\n📊 Tiles: {totals['present']:,} present of {totals['expected']:,} expected"
+          + (f" ({totals['skipped']:,} skipped as uniform)" if totals['skipped'] else ""))
+    print(f"   Time: {elapsed:.1f}s ({totals['expected'] / max(elapsed, 1e-6):,.0f} tiles/s)")
+
+    if args.repair_list:
+        with open(args.repair_list, 'w') as f:
+            json.dump({'pyramids': repairs}, f, indent=2)
+        print(f"📄 Repair list: {args.repair_list}")
+
+    if totals['problems']:
+        print(f"\n❌ {totals['problems']:,} problem(s) found")
+        sys.exit(1)
+    print(f"\n✅ Pyramid complete")
+
+if __name__ == '__main__':
+    main()